@@ -6,24 +6,74 @@ Follows architecture rules: callback-only, keyboard from keyboards.py.
 """
 from aiogram import Router, types, F
 from bot.keyboards import logs_kb
+from bot.handlers.utils import repost_service
 from utils.log_buffer import log_buffer
 from config import ADMIN_IDS
 
 router = Router()
 
 
+def _pipeline_summary(stats: dict) -> str:
+    stages = stats["stages"]
+    limiter = stats["limiter"]
+    media = stats["media_cache"]
+    outbox = stats["outbox"]
+    store = stats["media_store"]
+    listeners = stats["listeners"]
+    startup = stats["startup"]
+    startup_line = (
+        f"Startup: {startup['listening']}/{startup['users']} listening, ready in {startup['ready_s']}s "
+        f"(connect p50 {startup['connect_p50_ms']} ms, max {startup['connect_max_ms']} ms)\n"
+    ) if startup else ""
+    sessions = stats["session_store"]
+    sessions_line = (
+        f"Sessions: {sessions['sessions']} in memory, {sessions['dirty']} unsaved | "
+        f"{sessions['flushes']} flushes, {sessions['rows_written']} rows, {sessions['imports']} imported\n"
+    ) if sessions else ""
+    store_line = (
+        f"Media store: {store['files']} files, {store['mb']} MB | "
+        f"{store['hits']} hits, {store['misses']} misses, {store['evictions']} evicted\n"
+    ) if store else ""
+    return (
+        f"Pipeline: ingest {stats['ingest_depth']}/{stats['ingest_capacity']} | "
+        f"send {stats['send_depth']} queued, {stats['in_flight']} in flight | "
+        f"dropped {stats['dropped']}, coalesced {stats['coalesced']}, held {stats['held']} | "
+        f"outbox {outbox['buffered']} unsaved, {outbox['rejected']} rejected\n"
+        f"Pacing: {limiter['floods']} flood waits, {limiter['waited_s']}s throttled | "
+        f"file_id cache {media['hit_rate']}% hits ({media['memory_hits']} mem, {media['disk_hits']} disk, {media['misses']} miss)\n"
+        f"{store_line}"
+        f"Listeners: {listeners['watched']} watched, {listeners['recovering']} reconnecting | "
+        f"{listeners['reconnects']} reconnects, {listeners['stalls']} stalls\n"
+        f"Hibernation: {listeners['awake']} awake, {listeners['hibernated']} asleep, {listeners['polls']} polls | "
+        f"client ~{listeners['client_kb'] if listeners['client_kb'] is not None else '?'} KB, "
+        f"est. saved ~{listeners['est_saved_mb'] or 0} MB (client × asleep)\n"
+        f"{sessions_line}"
+        f"{startup_line}"
+        f"Avg ms: ingest wait {stages['ingest_wait']['avg_ms']}, route {stages['route']['avg_ms']}, "
+        f"send wait {stages['send_wait']['avg_ms']}, send {stages['send']['avg_ms']}"
+    )
+
+
 @router.callback_query(F.data == "logs")
 async def cb_view_logs(callback: types.CallbackQuery):
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("Access denied.", show_alert=True)
         return
 
+    # Sharded mode reports one block per worker process
+    shards = await repost_service.stats_by_shard()
+    summary = "\n\n".join(
+        f"[{label}]\n{_pipeline_summary(stats)}" if label else _pipeline_summary(stats)
+        for label, stats in shards.items()
+    )
+    # Telegram caps a message at 4096 characters; the summary wins, the log excerpt gets the rest
     raw = log_buffer.get_logs(25)
-    if len(raw) > 4000:
-        raw = raw[-4000:]
+    room = max(0, 4000 - len(summary))
+    if len(raw) > room:
+        raw = raw[-room:]
 
     await callback.message.edit_text(
-        f"Recent Logs\n\n{raw}",
+        f"{summary}\n\nRecent Logs\n\n{raw}",
         reply_markup=logs_kb()
     )
     await callback.answer()
@@ -14,9 +14,9 @@ from bot.keyboards import (
     cancel_kb, filter_kb, schedule_kb,
     delete_confirm_kb, session_required_kb,
     limit_reached_kb, main_menu_kb, start_msg_kb,
-    confirm_pair_kb,
+    confirm_pair_kb, PAIR_SETTINGS,
 )
-from bot.handlers.utils import render_pairs_view, repost_service
+from bot.handlers.utils import render_pairs_view, render_pair_settings, repost_service
 from core.repost.resolver import resolve_channel_input
 from config import ADMIN_IDS
 
@@ -81,6 +81,42 @@ async def cb_toggle_pair(callback: types.CallbackQuery):
         logger.error(f"Toggle failed: {e}")
         await safe_callback_answer(callback, "⚠️ Connection lag.", show_alert=True)
 
+# --- PAIR SETTINGS ---
+
+@router.callback_query(F.data.startswith("pcfg_"))
+async def cb_pair_settings(callback: types.CallbackQuery):
+    pair_id = int(callback.data.split("_")[1])
+    if not await render_pair_settings(callback.message, callback.from_user.id, pair_id):
+        return await safe_callback_answer(callback, "❌ Pair not found.", show_alert=True)
+    await safe_callback_answer(callback)
+
+@router.callback_query(F.data.startswith("pset_"))
+async def cb_cycle_setting(callback: types.CallbackQuery):
+    _, key, raw_id = callback.data.split("_")
+    pair_id = int(raw_id)
+    user_id = callback.from_user.id
+    if key not in PAIR_SETTINGS:
+        return await safe_callback_answer(callback, "❌ Unknown setting.", show_alert=True)
+
+    try:
+        pairs = await repost_service.get_user_pairs(user_id)
+        target = next((p for p in pairs if p.id == pair_id), None)
+        if not target:
+            return await safe_callback_answer(callback, "❌ Pair not found.", show_alert=True)
+
+        # Rule 4: Each press moves to the next choice, wrapping around
+        column, labels = PAIR_SETTINGS[key]
+        choices = list(labels)
+        current = getattr(target, column, None)
+        value = choices[(choices.index(current) + 1) % len(choices)] if current in choices else choices[0]
+
+        await repost_service.update_pair_settings(user_id, pair_id, **{column: value})
+        await safe_callback_answer(callback, f"✅ {labels[value]}")
+        await render_pair_settings(callback.message, user_id, pair_id)
+    except Exception as e:
+        logger.error(f"Setting change failed: {e}")
+        await safe_callback_answer(callback, "⚠️ Connection lag.", show_alert=True)
+
 # --- CREATE FLOW (FSM) ---
 
 @router.callback_query(F.data == "create")
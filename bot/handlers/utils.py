@@ -4,13 +4,18 @@ Shared render helpers used across handler modules.
 """
 from aiogram import types
 from services.repost_engine import RepostService
+from services.shard_coordinator import ShardCoordinator
 from bot.keyboards import (
     MAX_PAIRS, SCHEDULE_LABELS, FILTER_LABELS,
-    main_menu_kb, pairs_kb, empty_pairs_kb,
+    main_menu_kb, pairs_kb, empty_pairs_kb, pair_settings_kb,
 )
-from config import ADMIN_IDS
+from config import ADMIN_IDS, config
 
-repost_service = RepostService()
+# Rule 1: With SHARD_WORKERS > 1 the accounts run in worker processes behind the same interface
+if config.SHARD_WORKERS > 1:
+    repost_service = ShardCoordinator(config.SHARD_WORKERS, config.SHARD_SOCKET_DIR)
+else:
+    repost_service = RepostService()
 
 async def render_main_menu(target: types.Message, user_id: int = None, edit: bool = True):
     has_session = False
@@ -35,7 +40,7 @@ async def render_main_menu(target: types.Message, user_id: int = None, edit: boo
     if pair_count > 0:
         status_text = "ON" if active_count > 0 else "OFF"
         if error_count > 0:
-            lines.append(f"Reposting: {status_text} (⚠️ {error_count} errors)")
+            lines.append(f"Reposting: {status_text} (⚠️ {error_count} disabled by errors)")
         else:
             lines.append(f"Reposting: {status_text}")
             
@@ -73,6 +78,8 @@ async def render_pairs_view(message: types.Message, user_id: int):
             status = STATUS_DISPLAY.get(raw_status, raw_status.title())
 
         schedule = SCHEDULE_LABELS.get(p.schedule_interval, "Instant")
+        if p.schedule_interval and getattr(p, "schedule_mode", None) == "paced":
+            schedule += " (paced)"
         filt = FILTER_LABELS.get(p.filter_type, "Unknown")
         
         # Build the info block
@@ -87,9 +94,41 @@ async def render_pairs_view(message: types.Message, user_id: int):
             info.append(f"<i>Start From: msg #{p.start_from_msg_id}</i>")
         
         errs = getattr(p, "error_count", 0) or 0
-        if errs > 0:
+        if raw_status == "error":
+            # A pair disabled by errors stays so until the user turns it on again; sends never revive it
+            info.append(f"<i>Disabled after {errs} errors. Turn it on to retry.</i>")
+        elif errs > 0:
             info.append(f"<i>Errors: {errs}/5</i>")
 
         lines.append("\n".join(info) + "\n")
 
-    await message.edit_text("\n".join(lines), reply_markup=pairs_kb(pairs), parse_mode="HTML")
\ No newline at end of file
+    await message.edit_text("\n".join(lines), reply_markup=pairs_kb(pairs), parse_mode="HTML")
+
+async def render_pair_settings(message: types.Message, user_id: int, pair_id: int) -> bool:
+    """Per-pair delivery settings. False when the pair is not the user's (or gone)."""
+    pairs = await repost_service.get_user_pairs(user_id)
+    pair = next((p for p in pairs if p.id == pair_id), None)
+    if not pair:
+        return False
+
+    schedule = SCHEDULE_LABELS.get(pair.schedule_interval, "Instant")
+    text = (
+        f"<b>⚙️ Pair #{pair.id} Settings</b>\n"
+        f"<code>{pair.source_id}</code> ➔ <code>{pair.destination_id}</code>\n"
+        f"Schedule: {schedule}\n\n"
+        "<b>When Busy:</b> what happens to new posts while this pair's send queue is full "
+        "(wait for room, drop the oldest queued post, or coalesce: a copy-mode post joins the "
+        "newest queued one, any other replaces it).\n"
+        "<b>Queued Posts:</b> on a scheduled pair, send everything collected since the last "
+        "run, or only the newest post.\n"
+        "<b>Delivery:</b> on a scheduled pair, send the queue together each interval (burst) "
+        "or spread it evenly across the interval (paced).\n"
+        "<b>Per Tick:</b> most posts sent at once; paced pairs default to 1.\n"
+        "<b>Album Wait:</b> how long to wait for more parts of an album after the last one "
+        "arrived before sending it.\n"
+        "<b>Copy Mode:</b> Telegram duplicates posts server-side without the original author "
+        "and without re-uploading media; posts whose text the filter changes are still re-sent.\n\n"
+        "Tap a setting to change it."
+    )
+    await message.edit_text(text, reply_markup=pair_settings_kb(pair), parse_mode="HTML")
+    return True
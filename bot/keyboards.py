@@ -26,6 +26,64 @@ FILTER_LABELS = {
     2: "Replace Links",
 }
 
+OVERLOAD_LABELS = {
+    "block": "Wait",
+    "drop_oldest": "Drop Oldest",
+    "coalesce": "Coalesce",
+}
+
+QUEUE_LABELS = {
+    "all": "Send All",
+    "latest": "Latest Only",
+}
+
+ALBUM_WINDOW_LABELS = {
+    None: "Default",
+    250: "250 ms",
+    500: "500 ms",
+    1000: "1 s",
+    2000: "2 s",
+    3000: "3 s",
+}
+
+COPY_MODE_LABELS = {
+    False: "Off",
+    True: "On",
+}
+
+SCHEDULE_MODE_LABELS = {
+    "burst": "Burst",
+    "paced": "Paced",
+}
+
+MAX_PER_TICK_LABELS = {
+    None: "No Limit",
+    1: "1",
+    2: "2",
+    5: "5",
+    10: "10",
+    25: "25",
+}
+
+SETTING_NAMES = {
+    "overload_policy": "When Busy",
+    "queue_policy": "Queued Posts",
+    "album_window_ms": "Album Wait",
+    "copy_mode": "Copy Mode",
+    "schedule_mode": "Delivery",
+    "max_per_tick": "Per Tick",
+}
+
+# Settings button key -> (pair column, labels in cycling order)
+PAIR_SETTINGS = {
+    "ovl": ("overload_policy", OVERLOAD_LABELS),
+    "queue": ("queue_policy", QUEUE_LABELS),
+    "album": ("album_window_ms", ALBUM_WINDOW_LABELS),
+    "copy": ("copy_mode", COPY_MODE_LABELS),
+    "smode": ("schedule_mode", SCHEDULE_MODE_LABELS),
+    "tick": ("max_per_tick", MAX_PER_TICK_LABELS),
+}
+
 
 def main_menu_kb(has_session: bool = False, is_admin: bool = False):
     builder = InlineKeyboardBuilder()
@@ -52,11 +110,23 @@ def pairs_kb(pairs):
     for p in pairs:
         label = "Pause" if p.is_active else "Play"
         builder.button(text=f"{label} #{p.id}", callback_data=f"tog_{p.id}")
+        builder.button(text=f"Settings #{p.id}", callback_data=f"pcfg_{p.id}")
         builder.button(text=f"Delete #{p.id}", callback_data=f"del_{p.id}")
     if len(pairs) < MAX_PAIRS:
         builder.button(text="+ New Pair", callback_data="create")
     builder.button(text="Back", callback_data="main")
-    builder.adjust(2)
+    builder.adjust(*([3] * len(pairs)), 2)
+    return builder.as_markup()
+
+
+def pair_settings_kb(pair):
+    """One button per setting; each press moves it to the next choice."""
+    builder = InlineKeyboardBuilder()
+    for key, (column, labels) in PAIR_SETTINGS.items():
+        current = labels.get(getattr(pair, column, None), next(iter(labels.values())))
+        builder.button(text=f"{SETTING_NAMES[column]}: {current}", callback_data=f"pset_{key}_{pair.id}")
+    builder.button(text="Back", callback_data="pairs")
+    builder.adjust(1)
     return builder.as_markup()
 
 
@@ -4,7 +4,7 @@ Centralized configuration management. (Rule 13, 14)
 Uses Pydantic to validate that all required keys exist at startup.
 """
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import SecretStr
+from pydantic import SecretStr, model_validator
 
 ADMIN_IDS: list[int] = [8526011565]
 
@@ -23,8 +23,88 @@ class Settings(BaseSettings):
     # Database Configuration
     DATABASE_URL: str = "sqlite+aiosqlite:///data/reposter.db"
 
+    # Seconds an unused Telethon connection stays warm before it is closed
+    CLIENT_IDLE_TTL: int = 900
+
+    # Consolidated write-behind store of every Telethon session (empty string = per-account .session/string sessions)
+    SESSION_STORE_PATH: str = "data/session_store.db"
+    SESSION_FLUSH_SECONDS: float = 30
+
+    # Clients connected in parallel during boot recovery
+    RECOVERY_CONCURRENCY: int = 20
+
+    # Sharded mode: worker processes owning hash-partitioned users (0/1 = everything in the bot process),
+    # their unix socket directory, and how long a handoff waits for a released user's queued work
+    SHARD_WORKERS: int = 0
+    SHARD_SOCKET_DIR: str = "data/shards"
+    SHARD_HANDOFF_SECONDS: float = 30
+    # Per-shard write-behind file of the last seen message ids (.shardN suffix), read when a shard dies
+    LAST_SEEN_PATH: str = "data/last_seen.json"
+    LAST_SEEN_FLUSH_SECONDS: float = 5
+
+    # Listener supervision: check period, silence that counts as a stall, reconnect backoff cap, catch-up cap per source
+    LISTENER_CHECK_SECONDS: int = 30
+    LISTENER_STALL_SECONDS: int = 900
+    LISTENER_BACKOFF_MAX_SECONDS: int = 300
+    CATCHUP_LIMIT: int = 500
+    # Hibernation: seconds without updates or use before an account's client is dropped (0 = never), poll period while asleep
+    LISTENER_HIBERNATE_SECONDS: int = 0
+    LISTENER_POLL_SECONDS: int = 300
+
+    # Repost pipeline sizing (ingest -> route/clean -> send)
+    ROUTE_WORKERS: int = 2
+    SEND_WORKERS: int = 8
+    INGEST_QUEUE_SIZE: int = 1000
+    SEND_LANE_SIZE: int = 50
+
+    # Album assembly: quiet window after the last part, hard cap per album, open albums cap
+    ALBUM_QUIET_MS: int = 500
+    ALBUM_MAX_WAIT_MS: int = 5000
+    ALBUM_MAX_BUFFERED: int = 200
+    # Shutdown waits this long for open albums and queued sends to go out
+    SHUTDOWN_DRAIN_SECONDS: float = 10
+
+    # Append-only dedup log; empty string keeps dedup in memory only
+    DEDUP_LOG_PATH: str = "data/dedup.log"
+
+    # file_id cache: on-disk SQLite index (empty string = memory only), in-memory LRU size, on-disk cap
+    MEDIA_CACHE_PATH: str = "data/media_cache.db"
+    MEDIA_CACHE_MEMORY_ENTRIES: int = 5000
+    MEDIA_CACHE_MAX_ENTRIES: int = 100000
+
+    # Re-upload of media that can't be sent by reference: part size (KB, divides 512), parallel parts, temp dir
+    TRANSFER_PART_KB: int = 512
+    TRANSFER_WORKERS: int = 4
+    TRANSFER_TMP_DIR: str = ""
+    # Content-addressed store of downloaded media, shared by all pairs (empty string disables), LRU-bounded by size
+    MEDIA_STORE_DIR: str = "data/media_store"
+    MEDIA_STORE_MAX_MB: int = 2048
+
+    # Send pacing (messages per minute): learned from FloodWaits, never above these ceilings
+    SEND_RATE_PER_ACCOUNT: float = 60
+    SEND_BURST_PER_ACCOUNT: int = 5
+    SEND_RATE_PER_CHAT: float = 20
+    SEND_BURST_PER_CHAT: int = 3
+
+    # Seconds between batched writes of pair error counters / last repost times
+    PAIR_STATE_FLUSH_SECONDS: float = 5.0
+
+    # Durable outbox for scheduled sends: rows per write/read batch, write-behind delay, attempts before a send is dropped
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_FLUSH_MS: int = 1000
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    # Unsaved enqueues held in memory while the Vault is unavailable; beyond this new posts are rejected
+    OUTBOX_MAX_BUFFERED: int = 5000
+
     # Pydantic configuration to read from .env file
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
+    @model_validator(mode="after")
+    def _sharding_needs_server_db(self):
+        """Rule 13: Several worker processes writing one SQLite file lock each other out."""
+        if self.SHARD_WORKERS > 1 and self.DATABASE_URL.startswith("sqlite"):
+            raise ValueError("SHARD_WORKERS > 1 needs a server database (e.g. PostgreSQL) in DATABASE_URL, not SQLite")
+        return self
+
 # Global instance to be imported by the Skeleton (main.py)
 config = Settings()
@@ -3,45 +3,20 @@ CORE: REPOST LOGIC
 Pure functions for text processing. 
 Handles the actual cleaning, stripping, and replacing of text.
 """
-import re
+from core.repost.text_pipeline import compile_text_pipeline, REMOVE_PATTERN, REPLACE_PATTERN
 
 class MessageCleaner:
-    # Rule 11: Pre-compile regex for speed and precision
-    # This specifically targets TG links and usernames without swallowing surrounding punctuation
-    _REMOVE_PATTERN = re.compile(
-        r'(?:https?://)?t\.me/(?:joinchat/|\+)?[\w_-]+/?(?:\d+)?|@[\w_]+', 
-        re.IGNORECASE
-    )
-    _REPLACE_PATTERN = re.compile(
-        r'(?:https?://)?t\.me/(?:joinchat/|\+)?[\w_-]+/?(?:\d+)?', 
-        re.IGNORECASE
-    )
+    _REMOVE_PATTERN = REMOVE_PATTERN
+    _REPLACE_PATTERN = REPLACE_PATTERN
 
     @staticmethod
     def clean(text: str, mode: int, replacement: str = None) -> str:
         """
         Modes: 0 = As Is, 1 = Remove, 2 = Replace
+        Rule 11: Runs the pipeline compiled for (mode, replacement); hot paths should
+        hold on to compile_text_pipeline(...) instead of calling this per message.
         """
-        if not text or mode == 0:
-            return text
-
-        cleaned_text = text
-        
-        # Rule 3: Single Responsibility - Handle matching in one pass
-        if mode == 1:
-            # Delete matches (including @usernames)
-            cleaned_text = MessageCleaner._REMOVE_PATTERN.sub('', cleaned_text)
-        elif mode == 2:
-            # Swap matches for custom link (exclude @usernames to avoid spammy looking quotes)
-            rep = replacement if replacement else ""
-            cleaned_text = MessageCleaner._REPLACE_PATTERN.sub(rep, cleaned_text)
-
-        # Rule 14: Final Polish
-        # Remove triple+ newlines, double spaces, and lead/trail whitespace
-        cleaned_text = re.sub(r' {2,}', ' ', cleaned_text)
-        cleaned_text = re.sub(r'\n{3,}', '\n\n', cleaned_text)
-        
-        return cleaned_text.strip()
+        return compile_text_pipeline(mode, replacement)(text)
 
 def sanitize_channel_id(input_string: str) -> str:
     """
@@ -3,7 +3,7 @@ DATA: MODELS
 Defines the database structure for users and their reposting rules.
 """
 from datetime import datetime
-from sqlalchemy import BigInteger, String, DateTime, ForeignKey, Boolean, Integer
+from sqlalchemy import BigInteger, String, Text, DateTime, ForeignKey, Boolean, Integer, Float
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -42,3 +42,52 @@ class RepostPair(Base):
 
     error_count: Mapped[int] = mapped_column(Integer, default=0)
     status: Mapped[str] = mapped_column(String(16), default="active")
+
+    # What the send stage does when this pair's lane is full: block, drop_oldest, coalesce
+    overload_policy: Mapped[str] = mapped_column(String(16), default="block")
+    # Album quiet window in ms; null falls back to ALBUM_QUIET_MS
+    album_window_ms: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # Server-side forward (no re-upload) whenever the filter leaves the text untouched
+    copy_mode: Mapped[bool] = mapped_column(Boolean, default=False)
+
+    # Scheduled delivery: "burst" flushes the queue each interval, "paced" spreads it across the interval
+    schedule_mode: Mapped[str] = mapped_column(String(16), default="burst")
+    # Most posts sent per flush tick; null means no cap
+    max_per_tick: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # "all" delivers every queued post, "latest" keeps only the newest one
+    queue_policy: Mapped[str] = mapped_column(String(16), default="all")
+
+    # Resolved InputPeers of the pair's account ("channel:<id>:<access_hash>", ...); sends never resolve again
+    source_peer: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    destination_peer: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+
+class ScheduledJob(Base):
+    """Next run of a timed engine job ("flush" or "backfill") for one pair."""
+    __tablename__ = "scheduled_jobs"
+
+    pair_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(16), primary_key=True)
+    due_at: Mapped[float] = mapped_column(Float)  # Unix timestamp
+
+
+class OutboxItem(Base):
+    """
+    One queued send of a scheduled pair. Media is kept as source message ids and
+    re-fetched at send time, so Telegram file references are always fresh.
+    """
+    __tablename__ = "outbox"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    pair_id: Mapped[int] = mapped_column(Integer, index=True)
+    user_id: Mapped[int] = mapped_column(BigInteger)
+    destination_id: Mapped[str] = mapped_column(String)
+
+    source_id: Mapped[str] = mapped_column(String)
+    msg_ids: Mapped[str] = mapped_column(String)  # "101,102,103"
+    texts: Mapped[str] = mapped_column(Text)  # JSON list of cleaned texts, one per message
+    copy_mode: Mapped[bool] = mapped_column(Boolean, default=False)
+    drop_captions: Mapped[bool] = mapped_column(Boolean, default=False)
+
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
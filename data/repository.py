@@ -3,9 +3,15 @@ DATA: REPOSITORY
 Handles all database operations for users and repost pairs.
 Strictly for reading and writing to the Vault.
 """
-from sqlalchemy import select, delete, update
+from sqlalchemy import select, delete, update, tuple_, func, bindparam
 from sqlalchemy.ext.asyncio import AsyncSession
-from .models import User, RepostPair
+from .models import User, RepostPair, ScheduledJob, OutboxItem
+
+# Per-pair delivery settings the bot may change after creation
+PAIR_SETTINGS = (
+    "overload_policy", "queue_policy", "album_window_ms", "copy_mode",
+    "schedule_mode", "max_per_tick",
+)
 
 
 class UserRepository:
@@ -38,7 +44,11 @@ class UserRepository:
     async def add_repost_pair(
         self, user_id: int, source: str, destination: str,
         filter_type: int = 1, replacement_link: str = None,
-        schedule_interval: int = None, start_from_msg_id: int = None
+        schedule_interval: int = None, start_from_msg_id: int = None,
+        overload_policy: str = "block", album_window_ms: int = None,
+        copy_mode: bool = False, schedule_mode: str = "burst",
+        max_per_tick: int = None, queue_policy: str = "all",
+        source_peer: str = None, destination_peer: str = None
     ):
         # Rule 5: Check for existing pairs to prevent duplicates
         existing = await self.session.execute(
@@ -60,6 +70,14 @@ class UserRepository:
             replacement_link=replacement_link,
             schedule_interval=schedule_interval,
             start_from_msg_id=start_from_msg_id,
+            overload_policy=overload_policy,
+            album_window_ms=album_window_ms,
+            copy_mode=copy_mode,
+            schedule_mode=schedule_mode,
+            max_per_tick=max_per_tick,
+            queue_policy=queue_policy,
+            source_peer=source_peer,
+            destination_peer=destination_peer,
             status="active",
             is_active=True
         )
@@ -80,6 +98,24 @@ class UserRepository:
             return True
         return False
 
+    async def update_pair_settings(self, user_id: int, pair_id: int, **values) -> RepostPair | None:
+        """Rule 5: Only the whitelisted delivery settings, only on the user's own pair."""
+        unknown = set(values) - set(PAIR_SETTINGS)
+        if unknown:
+            raise ValueError(f"Not a pair setting: {', '.join(sorted(unknown))}")
+        result = await self.session.execute(
+            select(RepostPair).where(
+                RepostPair.id == pair_id,
+                RepostPair.user_id == user_id
+            )
+        )
+        pair = result.scalar_one_or_none()
+        if pair:
+            for column, value in values.items():
+                setattr(pair, column, value)
+            await self.session.commit()
+        return pair
+
     async def delete_pair_by_id(self, user_id: int, pair_id: int) -> bool:
         query = select(RepostPair).where(
             RepostPair.id == pair_id,
@@ -118,6 +154,17 @@ class UserRepository:
         )
         return result.scalar_one_or_none()
 
+    async def get_active_users_with_sessions(self):
+        """Every user with an active pair, session data included, in one joined query."""
+        query = (
+            select(User)
+            .join(RepostPair, RepostPair.user_id == User.id)
+            .where(RepostPair.is_active == True)
+            .distinct()
+        )
+        result = await self.session.execute(query)
+        return result.scalars().all()
+
     async def get_all_active_users_with_pairs(self):
         # Optimized for performance
         query = select(RepostPair.user_id).where(RepostPair.is_active == True).distinct()
@@ -167,25 +214,96 @@ class UserRepository:
             return True
         return False
 
-    async def increment_error_count(self, pair_id: int) -> int:
+    async def save_pair_states(self, rows: list):
+        """
+        Bulk UPDATE by primary key: rows are {"id": pair_id, <column>: value, ...}.
+        One executemany per set of columns. A Core UPDATE, unlike the ORM bulk one, lets a
+        row whose pair was deleted meanwhile match nothing instead of failing the batch.
+        """
+        if not rows:
+            return
+        table = RepostPair.__table__
+        groups = {}
+        for row in rows:
+            columns = tuple(sorted(k for k in row if k != "id"))
+            if columns:
+                groups.setdefault(columns, []).append(row)
+        for columns, group in groups.items():
+            stmt = (
+                update(table)
+                .where(table.c.id == bindparam("b_id"))
+                .values({c: bindparam(f"b_{c}") for c in columns})
+            )
+            await self.session.execute(stmt, [{f"b_{k}": v for k, v in row.items()} for row in group])
+        await self.session.commit()
+
+
+class ScheduleRepository:
+    """Persisted next-run times of the engine scheduler."""
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def load_jobs(self) -> dict:
+        result = await self.session.execute(select(ScheduledJob))
+        return {(j.kind, j.pair_id): j.due_at for j in result.scalars().all()}
+
+    async def save_jobs(self, upserts: dict, deletes: set):
+        """Applies a batch of changes in one transaction."""
+        keys = list(set(upserts) | set(deletes))
+        if not keys:
+            return
+        await self.session.execute(
+            delete(ScheduledJob).where(tuple_(ScheduledJob.kind, ScheduledJob.pair_id).in_(keys))
+        )
+        self.session.add_all([
+            ScheduledJob(kind=kind, pair_id=pair_id, due_at=due)
+            for (kind, pair_id), due in upserts.items()
+        ])
+        await self.session.commit()
+
+
+class OutboxRepository:
+    """Durable queue of scheduled sends, drained oldest first per pair."""
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def save_batch(self, inserts: list, acks: set, retries: dict):
+        """Applies buffered enqueues, acks and attempt bumps in one transaction."""
+        if acks:
+            await self.session.execute(delete(OutboxItem).where(OutboxItem.id.in_(acks)))
+        for item_id, attempts in retries.items():
+            await self.session.execute(
+                update(OutboxItem).where(OutboxItem.id == item_id).values(attempts=attempts)
+            )
+        self.session.add_all([OutboxItem(**item) for item in inserts])
+        await self.session.commit()
+
+    async def fetch(self, pair_id: int, limit: int):
         result = await self.session.execute(
-            select(RepostPair).where(RepostPair.id == pair_id)
+            select(OutboxItem).where(OutboxItem.pair_id == pair_id).order_by(OutboxItem.id).limit(limit)
         )
-        pair = result.scalar_one_or_none()
-        if pair:
-            pair.error_count = (pair.error_count or 0) + 1
-            current_count = pair.error_count
-            await self.session.commit()
-            return current_count
-        return 0
+        return result.scalars().all()
 
-    async def reset_error_count(self, pair_id: int):
+    async def count(self, pair_id: int) -> int:
         result = await self.session.execute(
-            select(RepostPair).where(RepostPair.id == pair_id)
+            select(func.count()).select_from(OutboxItem).where(OutboxItem.pair_id == pair_id)
         )
-        pair = result.scalar_one_or_none()
-        if pair:
-            pair.error_count = 0
-            if pair.status == "error":
-                pair.status = "active"
-            await self.session.commit()
\ No newline at end of file
+        return result.scalar_one()
+
+    async def keep_latest(self, pair_id: int) -> int:
+        """Deletes every queued post of the pair except the newest one."""
+        newest = select(func.max(OutboxItem.id)).where(OutboxItem.pair_id == pair_id).scalar_subquery()
+        result = await self.session.execute(
+            delete(OutboxItem).where(OutboxItem.pair_id == pair_id, OutboxItem.id < newest)
+        )
+        await self.session.commit()
+        return result.rowcount
+
+    async def delete_pair(self, pair_id: int) -> int:
+        result = await self.session.execute(delete(OutboxItem).where(OutboxItem.pair_id == pair_id))
+        await self.session.commit()
+        return result.rowcount
+
+    async def pending_pairs(self) -> set:
+        result = await self.session.execute(select(OutboxItem.pair_id).distinct())
+        return set(result.scalars().all())
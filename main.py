@@ -70,6 +70,8 @@ async def main():
     except Exception as e:
         logger.critical(f"Organism failed to boot: {e}")
     finally:
+        from bot.handlers.utils import repost_service
+        await repost_service.shutdown()
         # Close session properly
         await bot.session.close()
 
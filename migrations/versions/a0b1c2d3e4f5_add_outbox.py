@@ -0,0 +1,39 @@
+"""add outbox table
+
+Revision ID: a0b1c2d3e4f5
+Revises: f9a0b1c2d3e4
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'a0b1c2d3e4f5'
+down_revision: Union[str, None] = 'f9a0b1c2d3e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('outbox',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('pair_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('destination_id', sa.String(), nullable=False),
+    sa.Column('source_id', sa.String(), nullable=False),
+    sa.Column('msg_ids', sa.String(), nullable=False),
+    sa.Column('texts', sa.Text(), nullable=False),
+    sa.Column('copy_mode', sa.Boolean(), server_default=sa.false(), nullable=False),
+    sa.Column('drop_captions', sa.Boolean(), server_default=sa.false(), nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_pair_id', 'outbox', ['pair_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_outbox_pair_id', table_name='outbox')
+    op.drop_table('outbox')
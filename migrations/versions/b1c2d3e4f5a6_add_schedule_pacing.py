@@ -0,0 +1,28 @@
+"""add schedule pacing columns
+
+Revision ID: b1c2d3e4f5a6
+Revises: a0b1c2d3e4f5
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'b1c2d3e4f5a6'
+down_revision: Union[str, None] = 'a0b1c2d3e4f5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('repost_pairs', sa.Column('schedule_mode', sa.String(16), server_default='burst', nullable=False))
+    op.add_column('repost_pairs', sa.Column('max_per_tick', sa.Integer(), nullable=True))
+    op.add_column('repost_pairs', sa.Column('queue_policy', sa.String(16), server_default='all', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('repost_pairs', 'queue_policy')
+    op.drop_column('repost_pairs', 'max_per_tick')
+    op.drop_column('repost_pairs', 'schedule_mode')
@@ -0,0 +1,26 @@
+"""add resolved input peers to repost pairs
+
+Revision ID: c2d3e4f5a6b7
+Revises: b1c2d3e4f5a6
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'c2d3e4f5a6b7'
+down_revision: Union[str, None] = 'b1c2d3e4f5a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('repost_pairs', sa.Column('source_peer', sa.String(64), nullable=True))
+    op.add_column('repost_pairs', sa.Column('destination_peer', sa.String(64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('repost_pairs', 'destination_peer')
+    op.drop_column('repost_pairs', 'source_peer')
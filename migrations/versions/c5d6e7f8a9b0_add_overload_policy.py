@@ -0,0 +1,24 @@
+"""add overload_policy column
+
+Revision ID: c5d6e7f8a9b0
+Revises: b4g2c3d5e7f8
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'c5d6e7f8a9b0'
+down_revision: Union[str, None] = 'b4g2c3d5e7f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('repost_pairs', sa.Column('overload_policy', sa.String(16), server_default='block', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('repost_pairs', 'overload_policy')
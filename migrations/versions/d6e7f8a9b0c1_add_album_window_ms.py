@@ -0,0 +1,24 @@
+"""add album_window_ms column
+
+Revision ID: d6e7f8a9b0c1
+Revises: c5d6e7f8a9b0
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'd6e7f8a9b0c1'
+down_revision: Union[str, None] = 'c5d6e7f8a9b0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('repost_pairs', sa.Column('album_window_ms', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('repost_pairs', 'album_window_ms')
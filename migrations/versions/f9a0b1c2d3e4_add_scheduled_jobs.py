@@ -0,0 +1,29 @@
+"""add scheduled_jobs table
+
+Revision ID: f9a0b1c2d3e4
+Revises: e8f9a0b1c2d3
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = 'f9a0b1c2d3e4'
+down_revision: Union[str, None] = 'e8f9a0b1c2d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('scheduled_jobs',
+    sa.Column('pair_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('due_at', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('pair_id', 'kind')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('scheduled_jobs')
@@ -0,0 +1,194 @@
+"""
+PROVIDERS: CLIENT REGISTRY
+The 'Optic Nerve'. (Rule 1, 11)
+Owns every TelegramClient in the process: one connection per user, shared by
+every provider (listener, session validation) through reference counting.
+Released clients stay connected for an idle grace period, so the next user of
+the account skips the MTProto handshake.
+"""
+import logging
+import asyncio
+import hashlib
+import os
+import time
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+
+logger = logging.getLogger(__name__)
+
+# (api_id, api_hash) -> ClientRegistry; one per process
+_registries = {}
+
+
+def get_registry(api_id: int, api_hash: str, idle_ttl: float = 900, session_store=None) -> "ClientRegistry":
+    registry = _registries.get((api_id, api_hash))
+    if registry is None:
+        registry = _registries[(api_id, api_hash)] = ClientRegistry(api_id, api_hash, idle_ttl)
+    if session_store is not None and registry.session_store is None:
+        registry.session_store = session_store
+    return registry
+
+
+def session_object(session_data):
+    """.session paths are used as-is; anything else is a string session."""
+    if isinstance(session_data, str) and not session_data.endswith('.session'):
+        return StringSession(session_data)
+    return session_data
+
+
+def session_key(session_data):
+    """Identity of a session: the same .session file reached by different relative paths is one session."""
+    if isinstance(session_data, str) and session_data.endswith('.session'):
+        return os.path.abspath(session_data)
+    return session_data
+
+
+def session_identity(session_data) -> str:
+    """
+    What a session actually is right now: the .session file's path and version (a
+    re-upload overwrites the same path) or a digest of the session string.
+    """
+    if isinstance(session_data, str) and session_data.endswith('.session'):
+        path = os.path.abspath(session_data)
+        try:
+            stat = os.stat(path)
+            return f"{path}@{stat.st_mtime_ns}:{stat.st_size}"
+        except OSError:
+            return path
+    return "string:" + hashlib.sha256(str(session_data).encode()).hexdigest()
+
+
+class ClientRegistry:
+    def __init__(self, api_id: int, api_hash: str, idle_ttl: float = 900):
+        self.api_id = api_id
+        self.api_hash = api_hash
+        self.idle_ttl = idle_ttl
+        # user_id -> connected, authorized TelegramClient (shared by reference with providers)
+        self.clients = {}
+        self._session_data = {}
+        # user_id -> session_identity() of the data the live client was opened with
+        self._identity = {}
+        self._refs = {}
+        self._idle_since = {}
+        self._locks = {}
+        self._reaper = None
+        # Optional write-behind store (providers/session_store.py) backing every registry client
+        self.session_store = None
+
+    def get(self, user_id: int) -> TelegramClient | None:
+        client = self.clients.get(user_id)
+        return client if client and client.is_connected() else None
+
+    def holds(self, user_id: int, session_data) -> bool:
+        """
+        True when the user's live connection was opened with exactly this session: same
+        path is not enough, the file must not have been replaced since.
+        """
+        return (
+            self.get(user_id) is not None
+            and self._session_data.get(user_id) == session_key(session_data)
+            and self._identity.get(user_id) == session_identity(session_data)
+        )
+
+    def in_use(self, user_id: int) -> bool:
+        return self._refs.get(user_id, 0) > 0
+
+    def refcount(self, user_id: int) -> int:
+        return self._refs.get(user_id, 0)
+
+    async def acquire(self, user_id: int, session_data) -> TelegramClient | None:
+        """Returns the user's shared client (connecting it if needed) and takes a reference, or None."""
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            client = self.get(user_id)
+            if client is None or self._session_data.get(user_id) != session_key(session_data):
+                if client is not None:
+                    await self._close(user_id)
+                client = await self._connect(user_id, session_data)
+                if client is None:
+                    return None
+            self._refs[user_id] = self._refs.get(user_id, 0) + 1
+            self._idle_since.pop(user_id, None)
+            return client
+
+    async def release(self, user_id: int):
+        """Drops a reference. The last one starts the idle grace period instead of disconnecting."""
+        refs = self._refs.get(user_id, 0) - 1
+        if refs > 0:
+            self._refs[user_id] = refs
+            return
+        self._refs.pop(user_id, None)
+        if user_id in self.clients:
+            self._idle_since[user_id] = time.monotonic()
+            self._ensure_reaper()
+
+    async def close(self, user_id: int):
+        """Disconnects now, whoever still holds references (session revoked, user gone)."""
+        async with self._locks.setdefault(user_id, asyncio.Lock()):
+            await self._close(user_id)
+
+    async def _connect(self, user_id: int, session_data) -> TelegramClient | None:
+        # Taken before the session opens the file: a live SQLiteSession keeps writing to it
+        identity = session_identity(session_data)
+        session = self.session_store.session_for(user_id, session_data) if self.session_store else session_object(session_data)
+        client = TelegramClient(session, self.api_id, self.api_hash)
+        for attempt in range(2):
+            try:
+                await client.connect()
+                if not await client.is_user_authorized():
+                    logger.warning(f"User {user_id} unauthorized.")
+                    await client.disconnect()
+                    return None
+                break
+            except (OSError, asyncio.TimeoutError) as e:
+                if attempt == 1: raise e
+                await asyncio.sleep(2)
+        self.clients[user_id] = client
+        self._session_data[user_id] = session_key(session_data)
+        self._identity[user_id] = identity
+        return client
+
+    async def _close(self, user_id: int):
+        client = self.clients.pop(user_id, None)
+        self._session_data.pop(user_id, None)
+        self._identity.pop(user_id, None)
+        self._refs.pop(user_id, None)
+        self._idle_since.pop(user_id, None)
+        if client:
+            try:
+                await client.disconnect()
+            except Exception as e:
+                logger.error(f"Disconnect failed for User {user_id}: {e}")
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle(), name="client_reaper")
+
+    async def _reap_idle(self):
+        """Disconnects clients nobody has held for idle_ttl; exits once none are idle."""
+        while self._idle_since:
+            await asyncio.sleep(min(60, self.idle_ttl))
+            now = time.monotonic()
+            for user_id, since in list(self._idle_since.items()):
+                if now - since < self.idle_ttl:
+                    continue
+                async with self._locks.setdefault(user_id, asyncio.Lock()):
+                    # Re-check under the lock: someone may have acquired it meanwhile
+                    if user_id in self._idle_since and not self._refs.get(user_id):
+                        logger.info(f"Closing idle connection of User {user_id}.")
+                        await self._close(user_id)
+
+    async def close_all(self):
+        if self._reaper:
+            self._reaper.cancel()
+        for user_id in list(self.clients):
+            await self._close(user_id)
+        # After the disconnects, so their final update state is part of the last flush
+        if self.session_store:
+            self.session_store.close()
+
+    def stats(self) -> dict:
+        stats = {"connected": len(self.clients), "idle": len(self._idle_since)}
+        if self.session_store:
+            stats["session_store"] = self.session_store.stats()
+        return stats
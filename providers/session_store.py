@@ -0,0 +1,298 @@
+"""
+PROVIDERS: SESSION STORE
+The 'Long-Term Memory' of the Eyes. (Rule 1, 14)
+Telethon sessions of every account kept in memory: auth key, DC, entity cache and
+update state. Changes are written behind into one consolidated SQLite file, in one
+transaction per flush interval and at shutdown, instead of each account doing its
+own SQLite I/O per update. Existing .session files and session strings are imported
+the first time an account connects, and again whenever the user links a new session.
+"""
+import logging
+import asyncio
+import datetime
+import os
+import sqlite3
+import time
+from telethon.crypto import AuthKey
+from telethon.sessions import MemorySession, StringSession
+from telethon.tl import types
+from providers.client_registry import session_identity
+
+logger = logging.getLogger(__name__)
+
+# path -> SessionStore; one per process and file
+_stores = {}
+
+
+def get_session_store(path: str, flush_seconds: float = 30) -> "SessionStore":
+    store = _stores.get(path)
+    if store is None:
+        store = _stores[path] = SessionStore(path, flush_seconds)
+    return store
+
+
+def _state(pts, qts, date, seq) -> types.updates.State:
+    return types.updates.State(
+        pts=pts, qts=qts, seq=seq, unread_count=0,
+        date=datetime.datetime.fromtimestamp(date, tz=datetime.timezone.utc),
+    )
+
+
+class BufferedSession(MemorySession):
+    """A MemorySession that tells its store what changed; nothing here touches the disk."""
+    def __init__(self, store: "SessionStore", user_id: int):
+        super().__init__()
+        self._store = store
+        self.user_id = user_id
+        # Entity rows and update-state ids changed since the last flush
+        self.new_entities = set()
+        self.dirty_states = set()
+        self.dirty_auth = False
+
+    def set_dc(self, dc_id, server_address, port):
+        super().set_dc(dc_id, server_address, port)
+        self._touch(auth=True)
+
+    @property
+    def auth_key(self):
+        return self._auth_key
+
+    @auth_key.setter
+    def auth_key(self, value):
+        self._auth_key = value
+        self._touch(auth=True)
+
+    @property
+    def takeout_id(self):
+        return self._takeout_id
+
+    @takeout_id.setter
+    def takeout_id(self, value):
+        self._takeout_id = value
+        self._touch(auth=True)
+
+    def set_update_state(self, entity_id, state):
+        super().set_update_state(entity_id, state)
+        self.dirty_states.add(entity_id)
+        self._touch()
+
+    def process_entities(self, tlo):
+        # Most updates carry entities already known: only genuinely new rows mark the session dirty
+        rows = set(self._entities_to_rows(tlo)) - self._entities
+        if rows:
+            self._entities |= rows
+            self.new_entities |= rows
+            self._touch()
+
+    def _touch(self, auth: bool = False):
+        if auth:
+            self.dirty_auth = True
+        self._store.mark_dirty(self.user_id)
+
+    def delete(self):
+        self._store.forget(self.user_id)
+
+
+class SessionStore:
+    def __init__(self, path: str, flush_seconds: float = 30):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        # user_id -> (source, BufferedSession)
+        self._sessions = {}
+        self._dirty = set()
+        # Users whose stored rows are replaced wholesale on the next flush (fresh import)
+        self._replace = set()
+        self._db = None
+        self._timer = None
+        self.imports = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    # --- Lazy open ---
+
+    def _ensure_open(self):
+        """Rule 1: The store file is opened on first use."""
+        if self._db is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id INTEGER PRIMARY KEY, source TEXT NOT NULL, dc_id INTEGER, server_address TEXT, "
+            "port INTEGER, auth_key BLOB, takeout_id INTEGER, updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS entities ("
+            "user_id INTEGER NOT NULL, id INTEGER NOT NULL, hash INTEGER NOT NULL, username TEXT, "
+            "phone INTEGER, name TEXT, PRIMARY KEY (user_id, id));"
+            "CREATE TABLE IF NOT EXISTS update_state ("
+            "user_id INTEGER NOT NULL, id INTEGER NOT NULL, pts INTEGER, qts INTEGER, date INTEGER, "
+            "seq INTEGER, PRIMARY KEY (user_id, id));"
+        )
+
+    # --- Sessions ---
+
+    def session_for(self, user_id: int, session_data) -> BufferedSession:
+        """
+        The account's in-memory session. Served from memory, else from the store file;
+        imported from session_data when the store has nothing for it or the user has
+        linked a different session since.
+        """
+        source = session_identity(session_data)
+        cached = self._sessions.get(user_id)
+        if cached and cached[0] == source:
+            return cached[1]
+
+        self._ensure_open()
+        session = self._load(user_id, source)
+        if session is None:
+            session = self._import(user_id, session_data)
+            self.imports += 1
+            # The whole snapshot goes out with the next flush
+            session.dirty_auth = True
+            session.new_entities = set(session._entities)
+            session.dirty_states = set(session._update_states)
+            self._replace.add(user_id)
+            self.mark_dirty(user_id)
+        self._sessions[user_id] = (source, session)
+        return session
+
+    def _load(self, user_id: int, source: str) -> BufferedSession | None:
+        row = self._db.execute(
+            "SELECT dc_id, server_address, port, auth_key, takeout_id FROM sessions WHERE user_id = ? AND source = ?",
+            (user_id, source)
+        ).fetchone()
+        if row is None:
+            return None
+        session = BufferedSession(self, user_id)
+        session._dc_id, session._server_address, session._port = row[0] or 0, row[1], row[2]
+        session._auth_key = AuthKey(data=row[3]) if row[3] else None
+        session._takeout_id = row[4]
+        session._entities = set(self._db.execute(
+            "SELECT id, hash, username, phone, name FROM entities WHERE user_id = ?", (user_id,)
+        ).fetchall())
+        for entity_id, pts, qts, date, seq in self._db.execute(
+            "SELECT id, pts, qts, date, seq FROM update_state WHERE user_id = ?", (user_id,)
+        ):
+            session._update_states[entity_id] = _state(pts, qts, date, seq)
+        return session
+
+    def _import(self, user_id: int, session_data) -> BufferedSession:
+        session = BufferedSession(self, user_id)
+        if isinstance(session_data, str) and session_data.endswith(".session"):
+            if os.path.exists(session_data):
+                self._import_file(session, session_data)
+        elif session_data:
+            legacy = StringSession(session_data)
+            session._dc_id, session._server_address, session._port = legacy.dc_id, legacy.server_address, legacy.port
+            session._auth_key = legacy.auth_key
+        logger.info(f"Session of User {user_id} imported into the session store.")
+        return session
+
+    @staticmethod
+    def _import_file(session: BufferedSession, path: str):
+        """Reads a Telethon SQLite .session file without opening it as a live session."""
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            row = db.execute("SELECT dc_id, server_address, port, auth_key, takeout_id FROM sessions").fetchone()
+            if row:
+                session._dc_id, session._server_address, session._port = row[0] or 0, row[1], row[2]
+                session._auth_key = AuthKey(data=row[3]) if row[3] else None
+                session._takeout_id = row[4]
+            session._entities = set(db.execute("SELECT id, hash, username, phone, name FROM entities").fetchall())
+            for entity_id, pts, qts, date, seq in db.execute("SELECT id, pts, qts, date, seq FROM update_state"):
+                session._update_states[entity_id] = _state(pts, qts, date, seq)
+        except sqlite3.Error as e:
+            logger.error(f"Partial import of {path}: {e}")
+        finally:
+            db.close()
+
+    def forget(self, user_id: int):
+        self._sessions.pop(user_id, None)
+        self._dirty.discard(user_id)
+        if self._db is not None:
+            with self._db:
+                for table in ("sessions", "entities", "update_state"):
+                    self._db.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+
+    # --- Write-behind ---
+
+    def mark_dirty(self, user_id: int):
+        self._dirty.add(user_id)
+        if self._timer is None:
+            try:
+                self._timer = asyncio.get_running_loop().call_later(self.flush_seconds, self.flush)
+            except RuntimeError:
+                # No loop (import at startup): the next change or close() flushes
+                pass
+
+    def flush(self):
+        """Rule 14: Every session changed since the last flush, in one transaction."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._dirty or self._db is None:
+            return
+        dirty, self._dirty = self._dirty, set()
+        replace, self._replace = self._replace, set()
+        now = time.time()
+        rows = 0
+        written = []
+        try:
+            with self._db:
+                for user_id in dirty:
+                    cached = self._sessions.get(user_id)
+                    if cached is None:
+                        continue
+                    source, s = cached
+                    if user_id in replace:
+                        # A (re-)import: rows learned under the previous session are stale
+                        self._db.execute("DELETE FROM entities WHERE user_id = ?", (user_id,))
+                        self._db.execute("DELETE FROM update_state WHERE user_id = ?", (user_id,))
+                    if s.dirty_auth:
+                        self._db.execute(
+                            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (user_id, source, s.dc_id, s.server_address, s.port,
+                             s.auth_key.key if s.auth_key else None, s.takeout_id, now)
+                        )
+                        rows += 1
+                    if s.new_entities:
+                        self._db.executemany(
+                            "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?)",
+                            [(user_id, *row) for row in s.new_entities]
+                        )
+                        rows += len(s.new_entities)
+                    if s.dirty_states:
+                        states = [(eid, s._update_states[eid]) for eid in s.dirty_states if eid in s._update_states]
+                        self._db.executemany(
+                            "INSERT OR REPLACE INTO update_state VALUES (?, ?, ?, ?, ?, ?)",
+                            [(user_id, eid, st.pts, st.qts, int(st.date.timestamp()), st.seq) for eid, st in states]
+                        )
+                        rows += len(states)
+                    written.append(s)
+            # Deltas are cleared only once the transaction has committed
+            for s in written:
+                s.dirty_auth = False
+                s.new_entities = set()
+                s.dirty_states = set()
+            self.flushes += 1
+            self.rows_written += rows
+        except sqlite3.Error as e:
+            logger.error(f"Session store flush of {len(dirty)} sessions failed: {e}")
+            # Snapshots stay marked; the next flush retries them
+            self._dirty |= dirty
+            self._replace |= replace
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "dirty": len(self._dirty),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "imports": self.imports,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
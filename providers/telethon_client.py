@@ -5,76 +5,473 @@ Handles raw communication with Telegram Servers.
 """
 import logging
 import asyncio
+import copy
+import math
+import mmap
+import os
+import random
+import tempfile
+import time
 from telethon import TelegramClient, events
-from telethon.errors import FloodWaitError
-from telethon.tl.functions.messages import ImportChatInviteRequest, CheckChatInviteRequest
+from telethon.errors import FloodWaitError, ChatForwardsRestrictedError, FileReferenceExpiredError
+from telethon.tl.functions.messages import ImportChatInviteRequest, CheckChatInviteRequest, ForwardMessagesRequest
+from telethon.tl.functions.upload import SaveFilePartRequest, SaveBigFilePartRequest
+from telethon.tl.types import (
+    UpdateNewMessage, UpdateNewChannelMessage, InputPhoto, InputDocument, InputFile, InputFileBig,
+    InputPeerChannel, InputPeerUser, InputPeerChat, InputPeerSelf,
+    InputMediaUploadedPhoto, InputMediaUploadedDocument, DocumentAttributeVideo,
+)
 from telethon.tl.functions.channels import JoinChannelRequest
-from telethon.sessions import StringSession
+from providers.client_registry import get_registry, session_object
+from providers.session_store import get_session_store
 
 logger = logging.getLogger(__name__)
 
+# Telegram accepts at most 100 message ids per ForwardMessagesRequest
+FORWARD_BATCH_SIZE = 100
+# Upload/download parts: a multiple of 4 KB that divides 512 KB
+MAX_PART_KB = 512
+# Above this, uploads must use SaveBigFilePartRequest
+BIG_FILE_BYTES = 10 * 1024 * 1024
+
+
+def encode_peer(peer) -> str | None:
+    """InputPeer -> 'channel:<id>:<access_hash>' / 'user:<id>:<access_hash>' / 'chat:<id>' / 'self'."""
+    if isinstance(peer, InputPeerChannel):
+        return f"channel:{peer.channel_id}:{peer.access_hash}"
+    if isinstance(peer, InputPeerUser):
+        return f"user:{peer.user_id}:{peer.access_hash}"
+    if isinstance(peer, InputPeerChat):
+        return f"chat:{peer.chat_id}"
+    if isinstance(peer, InputPeerSelf):
+        return "self"
+    return None
+
+
+def decode_peer(encoded: str | None):
+    if not encoded:
+        return None
+    kind, _, rest = encoded.partition(":")
+    try:
+        if kind == "channel":
+            peer_id, access_hash = rest.split(":")
+            return InputPeerChannel(int(peer_id), int(access_hash))
+        if kind == "user":
+            peer_id, access_hash = rest.split(":")
+            return InputPeerUser(int(peer_id), int(access_hash))
+        if kind == "chat":
+            return InputPeerChat(int(rest))
+        if kind == "self":
+            return InputPeerSelf()
+    except ValueError:
+        pass
+    logger.warning(f"Ignoring malformed stored peer '{encoded}'")
+    return None
+
+
+def _rss_bytes() -> int | None:
+    """Resident memory of the process from /proc (Linux); None where unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SourceFilteredNewMessage(events.NewMessage):
+    """
+    NewMessage builder that only lets through chats in a live set of source ids.
+    The set is shared by reference, so the provider can swap sources without
+    re-registering the handler or resolving entities again.
+    """
+    def __init__(self, source_ids: set, **kwargs):
+        super().__init__(**kwargs)
+        self.source_ids = source_ids
+        # Any new message on the account counts as a sign of life for the supervisor
+        self.last_event_at = time.monotonic()
+        # How talkative the account is: real updates only (last_event_at is also reset on reconnect)
+        self.first_update_at = None
+        self.last_update_at = None
+        self.updates = 0
+
+    @property
+    def mean_gap(self) -> float | None:
+        """Average seconds between updates so far; None until two have arrived."""
+        if self.updates < 2:
+            return None
+        return (self.last_update_at - self.first_update_at) / (self.updates - 1)
+
+    def filter(self, event):
+        now = self.last_event_at = time.monotonic()
+        if self.first_update_at is None:
+            self.first_update_at = now
+        self.last_update_at = now
+        self.updates += 1
+        if event.chat_id not in self.source_ids:
+            return None
+        return super().filter(event)
+
+
+class ParallelTransfer:
+    """
+    Moves one file through disk in fixed-size parts, several requests in flight at once.
+    Downloads interleave parts across workers (worker k takes parts k, k+n, k+2n...);
+    uploads hand out part numbers from one shared iterator. Only one part per worker
+    is ever held in memory.
+    """
+    def __init__(self, client, part_kb: int = MAX_PART_KB, workers: int = 4):
+        # Telegram wants 4 KB-aligned parts that evenly divide 512 KB
+        part_kb = max(4, min(MAX_PART_KB, part_kb))
+        while MAX_PART_KB % part_kb or part_kb % 4:
+            part_kb -= 4
+        self.client = client
+        self.part_size = part_kb * 1024
+        self.workers = max(1, workers)
+
+    async def download(self, media, path: str, size: int | None = None) -> int:
+        """Streams media into path. Without a known size a single ordered stream is used."""
+        part = self.part_size
+        workers = min(self.workers, math.ceil(size / part)) if size else 1
+        with open(path, "wb") as f:
+            if size:
+                f.truncate(size)
+
+        async def worker(k: int) -> int:
+            written = 0
+            offset = k * part
+            with open(path, "r+b") as f:
+                async for chunk in self.client.iter_download(
+                    media, offset=offset, stride=part * workers,
+                    request_size=part, chunk_size=part, file_size=size,
+                ):
+                    f.seek(offset)
+                    f.write(chunk)
+                    written += len(chunk)
+                    offset += part * workers
+            return written
+
+        return sum(await asyncio.gather(*(worker(k) for k in range(max(1, workers)))))
+
+    async def upload(self, path: str, name: str):
+        """Uploads path part by part and returns the InputFile(Big) to attach to a message."""
+        size = os.path.getsize(path)
+        part = self.part_size
+        total = max(1, math.ceil(size / part))
+        big = size > BIG_FILE_BYTES
+        file_id = random.getrandbits(63)
+        parts = iter(range(total))
+
+        async def worker():
+            with open(path, "rb") as f:
+                # Parts are sliced straight out of the page cache, no read() buffers
+                view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+                try:
+                    for i in parts:
+                        data = view[i * part:(i + 1) * part]
+                        await self._send_part(file_id, i, total, big, data, name)
+                finally:
+                    if size:
+                        view.close()
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, total))))
+        if big:
+            return InputFileBig(file_id, total, name)
+        return InputFile(file_id, total, name, "")
+
+    async def _send_part(self, file_id: int, i: int, total: int, big: bool, data: bytes, name: str):
+        if big:
+            request = SaveBigFilePartRequest(file_id, i, total, data)
+        else:
+            request = SaveFilePartRequest(file_id, i, data)
+        if not await self.client(request):
+            raise RuntimeError(f"Telegram rejected part {i}/{total} of {name}")
+
+
 class TelethonProvider:
-    def __init__(self, api_id: int, api_hash: str):
+    def __init__(self, api_id: int, api_hash: str, transfer_part_kb: int = MAX_PART_KB,
+                 transfer_workers: int = 4, transfer_dir: str | None = None, media_store=None,
+                 client_idle_ttl: float = 900, session_store_path: str | None = None,
+                 session_flush_seconds: float = 30):
         self.api_id = api_id
         self.api_hash = api_hash
-        self.active_clients = {}
+        # Rule 1: Every provider in the process shares one connection per user
+        session_store = get_session_store(session_store_path, session_flush_seconds) if session_store_path else None
+        self.registry = get_registry(api_id, api_hash, client_idle_ttl, session_store)
+        self.active_clients = self.registry.clients
+        # user_id -> {"client", "handler", "builder", "task", ...} for users this provider listens for
+        self._listeners = {}
+        # user_id -> what it takes to reopen a hibernated listener; no client is kept
+        self._hibernated = {}
+        self._wake_locks = {}
+        # Resident memory added by opening one client, sampled on uncontended connects
+        self._footprint_samples = 0
+        self._footprint_bytes = 0
+        self._connecting = 0
+        self.transfer_part_kb = transfer_part_kb
+        self.transfer_workers = transfer_workers
+        self.transfer_dir = transfer_dir
+        # Optional content-addressed store: downloads land there and are reused (see services/media_store.py)
+        self.media_store = media_store
+        # user_id -> set of marked chat ids the listener cares about
+        self._source_filters = {}
+        # (user_id, identifier) -> InputPeer; access hashes are only valid for the account that saw them
+        self._peers = {}
+
+    @staticmethod
+    def _to_target(identifier):
+        """Numeric ids become ints; usernames stay strings."""
+        return int(identifier) if str(identifier).replace("-", "").isdigit() else identifier
+
+    def remember_peer(self, user_id: int, identifier, encoded: str | None):
+        """Seeds the cache from a peer stored with a pair."""
+        peer = decode_peer(encoded)
+        if peer is not None:
+            self._peers[(user_id, str(identifier))] = peer
 
-    def _get_session(self, session_data):
-        if isinstance(session_data, str) and not session_data.endswith('.session'):
-            return StringSession(session_data)
-        return session_data
+    def _target(self, user_id: int, identifier):
+        """Cached InputPeer when known (no resolve round-trip), otherwise the raw identifier."""
+        return self._peers.get((user_id, str(identifier))) or self._to_target(identifier)
 
-    async def validate_session(self, session_data) -> bool:
-        session_obj = self._get_session(session_data)
+    async def resolve_peer(self, user_id: int, identifier) -> str | None:
+        """
+        Resolves an identifier to an InputPeer once per account and caches it. Returns the
+        encoded peer for storage with the pair, or None when it can't be resolved.
+        """
+        peer = self._peers.get((user_id, str(identifier)))
+        if peer is None:
+            client = await self._client(user_id)
+            if not client or not client.is_connected(): return None
+            try:
+                peer = await client.get_input_entity(self._to_target(identifier))
+            except Exception as e:
+                logger.error(f"Failed to resolve peer '{identifier}': {e}")
+                return None
+            self._peers[(user_id, str(identifier))] = peer
+        return encode_peer(peer)
+
+    @staticmethod
+    def _to_input_media(ref):
+        """Compact MediaCache records become InputPhoto/InputDocument; anything else passes through."""
+        if not isinstance(ref, dict):
+            return ref
+        cls = InputPhoto if ref["kind"] == "photo" else InputDocument
+        return cls(id=ref["id"], access_hash=ref["access_hash"], file_reference=ref["file_reference"])
+
+    async def _client(self, user_id: int):
+        """The user's connected client; a hibernated account is woken first (Rule 1)."""
+        if user_id in self._hibernated:
+            await self.wake(user_id)
+        listener = self._listeners.get(user_id)
+        if listener:
+            listener["last_used_at"] = time.monotonic()
+        return self.active_clients.get(user_id)
+
+    async def validate_session(self, session_data, user_id: int = None, fresh: bool = False) -> bool:
+        """
+        Reuses the user's live connection when it runs on this very session (same string,
+        or same .session file not replaced since). Newly uploaded data (fresh=True), or any
+        session the live connection is not running on, is checked with a throwaway client.
+        With no connection at all, a valid session is connected through the registry and
+        left warm for the listener.
+        """
         try:
-            async with TelegramClient(session_obj, self.api_id, self.api_hash) as client:
-                return await asyncio.wait_for(client.is_user_authorized(), timeout=10)
+            if user_id is not None and not fresh and self.registry.holds(user_id, session_data):
+                return await asyncio.wait_for(self.registry.get(user_id).is_user_authorized(), timeout=10)
+
+            if user_id is None or fresh or self.registry.get(user_id) is not None or self.registry.in_use(user_id):
+                async with TelegramClient(session_object(session_data), self.api_id, self.api_hash) as client:
+                    return await asyncio.wait_for(client.is_user_authorized(), timeout=10)
+
+            client = await asyncio.wait_for(self.registry.acquire(user_id, session_data), timeout=10)
+            if client is None:
+                return False
+            await self.registry.release(user_id)
+            return True
         except Exception as e:
             logger.error(f"Telethon Validation Error: {e}")
             return False
 
-    async def start_listener(self, user_id: int, session_data, callback):
+    def update_chat_filter(self, user_id: int, chat_ids):
+        """Rule 4: Mutates the live filter in place; takes effect on the next update."""
+        source_ids = self._source_filters.setdefault(user_id, set())
+        source_ids.clear()
+        source_ids.update(chat_ids)
+
+    async def start_listener(self, user_id: int, session_data, callback, chat_ids=None,
+                             on_disconnect=None) -> bool:
+        """Returns True once the user is listening. on_disconnect(user_id) fires when the connection ends."""
         # Rule 1: Idempotency - Don't double-start
-        if user_id in self.active_clients and self.active_clients[user_id].is_connected():
+        if self.is_listening(user_id):
             logger.info(f"Eyes already open for User {user_id}")
-            return
+            return True
 
         try:
-            session_obj = self._get_session(session_data)
-            client = TelegramClient(session_obj, self.api_id, self.api_hash)
-            
-            for attempt in range(2):
-                try:
-                    await client.connect()
-                    if not await client.is_user_authorized():
-                        logger.warning(f"User {user_id} unauthorized.")
-                        await client.disconnect()
-                        return
-                    break
-                except (OSError, asyncio.TimeoutError) as e:
-                    if attempt == 1: raise e
-                    await asyncio.sleep(2)
-
-            self.active_clients[user_id] = client
-
-            @client.on(events.NewMessage())
+            stale = self._listeners.pop(user_id, None)
+            if stale:
+                stale["client"].remove_event_handler(stale["handler"])
+                await self.registry.release(user_id)
+
+            # A connection warmed by session validation is picked up here without a new handshake
+            fresh = self.registry.get(user_id) is None
+            self._connecting += 1
+            rss_before = _rss_bytes() if fresh and self._connecting == 1 else None
+            try:
+                client = await self.registry.acquire(user_id, session_data)
+            finally:
+                self._connecting -= 1
+            if client is None:
+                return False
+            if rss_before is not None and self._connecting == 0:
+                rss_after = _rss_bytes()
+                if rss_after is not None:
+                    self._footprint_samples += 1
+                    self._footprint_bytes += max(0, rss_after - rss_before)
+
+            if chat_ids is not None:
+                self.update_chat_filter(user_id, chat_ids)
+            source_ids = self._source_filters.setdefault(user_id, set())
+
+            # Telethon rejects non-source chats before the callback coroutine is created
+            builder = SourceFilteredNewMessage(source_ids)
+
+            @client.on(builder)
             async def handler(event):
                 if event and event.message:
                     # Rule 3: Single Responsibility - Just pass the signal back
                     await callback(event.message, user_id)
 
-            asyncio.create_task(
-                client.run_until_disconnected(), 
-                name=f"eyes_{user_id}"
-            )
+            self._listeners[user_id] = {
+                "client": client, "handler": handler, "builder": builder,
+                "task": None, "on_disconnect": on_disconnect,
+                "session_data": session_data, "callback": callback,
+                "last_used_at": time.monotonic(),
+            }
+            self._hibernated.pop(user_id, None)
+            self._run_listener(user_id)
             logger.info(f"Eyes wide open for User {user_id}")
+            return True
 
         except Exception as e:
             logger.error(f"Failed to open Eyes for User {user_id}: {e}")
-            self.active_clients.pop(user_id, None)
+            return False
+
+    def _run_listener(self, user_id: int):
+        """Tracks the connection task, so a drop is noticed instead of dying silently."""
+        listener = self._listeners[user_id]
+        task = asyncio.create_task(
+            listener["client"].run_until_disconnected(),
+            name=f"eyes_{user_id}"
+        )
+        listener["task"] = task
+        if listener["on_disconnect"]:
+            task.add_done_callback(lambda t: listener["on_disconnect"](user_id))
+
+    def is_listening(self, user_id: int) -> bool:
+        listener = self._listeners.get(user_id)
+        return bool(
+            listener and listener["client"].is_connected()
+            and listener["task"] and not listener["task"].done()
+        )
+
+    def last_event_at(self, user_id: int) -> float:
+        listener = self._listeners.get(user_id)
+        return listener["builder"].last_event_at if listener else 0.0
+
+    def has_listener(self, user_id: int) -> bool:
+        """An open or hibernated listener exists (connected or not); False once stopped or released."""
+        return user_id in self._listeners or user_id in self._hibernated
+
+    def update_gap(self, user_id: int) -> float | None:
+        """The account's average seconds between updates, or None when there is no history yet."""
+        listener = self._listeners.get(user_id)
+        return listener["builder"].mean_gap if listener else None
+
+    def last_activity_at(self, user_id: int) -> float:
+        """Newest of: an update arrived, or the engine used the client."""
+        listener = self._listeners.get(user_id)
+        return max(listener["builder"].last_event_at, listener["last_used_at"]) if listener else 0.0
+
+    def is_hibernating(self, user_id: int) -> bool:
+        return user_id in self._hibernated
+
+    async def hibernate(self, user_id: int) -> bool:
+        """
+        Drops an idle account's client entirely (connection, entity cache, sender state),
+        keeping only the session reference and callbacks needed to reopen it. Refused
+        while anyone else holds the connection.
+        """
+        listener = self._listeners.get(user_id)
+        if not listener or self.registry.refcount(user_id) > 1:
+            return False
+        self._listeners.pop(user_id)
+        listener["client"].remove_event_handler(listener["handler"])
+        self._hibernated[user_id] = {
+            "session_data": listener["session_data"],
+            "callback": listener["callback"],
+            "on_disconnect": listener["on_disconnect"],
+            "since": time.monotonic(),
+        }
+        await self.registry.release(user_id)
+        await self.registry.close(user_id)
+        logger.info(f"Eyes of User {user_id} hibernating.")
+        return True
+
+    async def wake(self, user_id: int) -> bool:
+        """Reopens a hibernated listener with its original session, filter and callbacks."""
+        async with self._wake_locks.setdefault(user_id, asyncio.Lock()):
+            entry = self._hibernated.get(user_id)
+            if entry is None:
+                return self.is_listening(user_id)
+            # Until the listener is back the entry stays, so concurrent callers queue on the lock
+            return await self.start_listener(
+                user_id, entry["session_data"], entry["callback"], on_disconnect=entry["on_disconnect"]
+            )
+
+    def hibernation_stats(self) -> dict:
+        client_kb = round(self._footprint_bytes / self._footprint_samples / 1024) if self._footprint_samples else None
+        return {
+            "awake": len(self._listeners),
+            "hibernated": len(self._hibernated),
+            # None until a connect could be measured (non-Linux, or only concurrent connects so far)
+            "client_kb": client_kb,
+            # An estimate: one measured footprint times the sleeping accounts, not a measurement
+            "est_saved_mb": round(client_kb * len(self._hibernated) / 1024, 1) if client_kb else None,
+        }
+
+    async def reconnect(self, user_id: int) -> bool:
+        """Re-opens the listener's connection in place; handlers and filters stay attached."""
+        listener = self._listeners.get(user_id)
+        if not listener:
+            return False
+        client = listener["client"]
+        try:
+            if client.is_connected():
+                await client.disconnect()
+            if listener["task"]:
+                await asyncio.gather(listener["task"], return_exceptions=True)
+            await asyncio.wait_for(client.connect(), timeout=30)
+            if not await client.is_user_authorized():
+                logger.warning(f"User {user_id} unauthorized on reconnect.")
+                return False
+        except Exception as e:
+            logger.error(f"Reconnect failed for User {user_id}: {e}")
+            return False
+        listener["builder"].last_event_at = time.monotonic()
+        self._run_listener(user_id)
+        return True
+
+    async def latest_message_id(self, user_id: int, source_id) -> int | None:
+        client = await self._client(user_id)
+        if not client or not client.is_connected(): return None
+        try:
+            messages = await client.get_messages(self._target(user_id, source_id), limit=1)
+            return messages[0].id if messages else None
+        except Exception as e:
+            logger.error(f"Latest id lookup failed for {source_id}: {e}")
+            return None
 
     async def join_channel(self, user_id: int, invite_hash: str) -> dict | None:
-        client = self.active_clients.get(user_id)
+        client = await self._client(user_id)
         if not client or not client.is_connected(): return None
 
         try:
@@ -96,16 +493,12 @@ class TelethonProvider:
             return None
 
     async def resolve_entity(self, user_id: int, identifier: str) -> dict | None:
-        client = self.active_clients.get(user_id)
+        client = await self._client(user_id)
         if not client or not client.is_connected(): return None
 
         try:
             # Rule 6: Robust Entity Resolution
-            target = identifier
-            if str(identifier).replace("-", "").isdigit():
-                target = int(identifier)
-            
-            entity = await client.get_entity(target)
+            entity = await client.get_entity(self._target(user_id, identifier))
             return {
                 "id": entity.id,
                 "title": getattr(entity, "title", getattr(entity, "username", "Unknown")),
@@ -115,68 +508,214 @@ class TelethonProvider:
             return None
 
     
-    async def fetch_messages_from(self, user_id: int, source_id: str, from_msg_id: int, limit: int = 1):
-        client = self.active_clients.get(user_id)
-        if not client or not client.is_connected(): return []
+    async def get_messages_by_ids(self, user_id: int, source_id: str, msg_ids: list) -> list | None:
+        """Fresh copies of specific messages; deleted ones are left out. None means the fetch failed."""
+        client = await self._client(user_id)
+        if not client or not client.is_connected(): return None
 
         try:
-            target = int(source_id) if str(source_id).replace("-", "").isdigit() else source_id
-            
-            # Mister, we change 'min_id' to 'offset_id' and set 'reverse=True'
-            # This forces Telethon to start at 19 and look FORWARD to 20, 21...
-            # instead of starting at the newest and looking back.
-            messages = await client.get_messages(
-                target, 
-                offset_id=from_msg_id, 
-                limit=limit, 
-                reverse=True
-            )
-            return list(messages) if messages else []
+            messages = await client.get_messages(self._target(user_id, source_id), ids=msg_ids)
+            return [m for m in messages if m]
         except Exception as e:
-            logger.error(f"Fetch failed for {source_id}: {e}")
-            return []
+            logger.error(f"Fetch by ids failed for {source_id}: {e}")
+            return None
+
+    async def iter_messages_from(self, user_id: int, source_id: str, from_msg_id: int):
+        """
+        Streams a source's history oldest -> newest, starting at from_msg_id (inclusive).
+        Telethon pulls pages of 100 under the hood; deleted ids are simply absent.
+        """
+        client = await self._client(user_id)
+        if not client or not client.is_connected(): return
 
+        try:
+            async for msg in client.iter_messages(
+                self._target(user_id, source_id),
+                offset_id=max(from_msg_id - 1, 0),
+                reverse=True,
+                wait_time=1,
+            ):
+                yield msg
+        except Exception as e:
+            logger.error(f"History stream failed for {source_id}: {e}")
 
     async def send_message(self, user_id: int, destination: str | int, message: any) -> dict:
-        client = self.active_clients.get(user_id)
+        client = await self._client(user_id)
         if not client or not client.is_connected():
             return {"ok": False, "error": "disconnected"}
 
         try:
-            target = int(destination) if str(destination).replace("-", "").isdigit() else destination
-            
-            # Mister, if the engine sends a list of messages (an album), 
-            # we use send_file with the list of media.
-            if isinstance(message, list):
-                media_list = []
-                for m in message:
-                    if hasattr(m, "cached_file_id") and m.cached_file_id:
-                        media_list.append(m.cached_file_id)
-                    elif getattr(m, "media", None):
-                        media_list.append(m.media)
-                sent = await client.send_file(target, media_list, caption=message[0].message)
-            else:
-                if hasattr(message, "cached_file_id") and message.cached_file_id:
-                    sent = await client.send_file(target, message.cached_file_id, caption=getattr(message, "message", ""))
+            target = self._target(user_id, destination)
+            try:
+                sent = await self._send(client, target, message)
+                return {"ok": True, "message": sent}
+            except FileReferenceExpiredError:
+                # A stale cached file_id: the message's own media still carries a fresh reference,
+                # so resend with that before falling back to a full download and re-upload
+                messages = message if isinstance(message, list) else [message]
+                stale = [idx for idx, m in enumerate(messages) if getattr(m, "cached_file_id", None)]
+                if not stale:
+                    raise
+                for idx in stale:
+                    messages[idx].cached_file_id = None
+                logger.info(f"Stale cached file id for {destination}; resending with the message's own media.")
+                sent = await self._send(client, target, message)
+                # The engine re-learns the file ids of these from what was sent
+                return {"ok": True, "message": sent, "refreshed": stale}
+        except FloodWaitError as e:
+            return {"ok": False, "error": "flood_wait", "wait_seconds": e.seconds}
+        except (ChatForwardsRestrictedError, FileReferenceExpiredError) as e:
+            # The media can't be reused by reference (protected source, stale reference): copy the bytes
+            logger.info(f"Re-uploading media for {destination}: {type(e).__name__}")
+            return await self._reupload_and_send(client, target, message)
+        except Exception as e:
+            logger.error(f"Telethon send error: {e}")
+            return {"ok": False, "error": "exception", "detail": str(e)}
+
+    async def _send(self, client, target, message):
+        # Mister, if the engine sends a list of messages (an album), 
+        # we use send_file with the list of media.
+        if isinstance(message, list):
+            media_list = []
+            for m in message:
+                if hasattr(m, "cached_file_id") and m.cached_file_id:
+                    media_list.append(self._to_input_media(m.cached_file_id))
+                elif getattr(m, "media", None):
+                    media_list.append(m.media)
+            return await client.send_file(target, media_list, caption=message[0].message)
+        if hasattr(message, "cached_file_id") and message.cached_file_id:
+            return await client.send_file(target, self._to_input_media(message.cached_file_id), caption=getattr(message, "message", ""))
+        return await client.send_message(target, message)
+
+    async def _reupload_and_send(self, client, target, message) -> dict:
+        """
+        Download -> upload through ParallelTransfer, then send. Messages carrying a
+        local_path (media store hit) skip the download; fresh downloads with a
+        store_key are kept in the media store, the rest stream via a temp dir.
+        """
+        messages = message if isinstance(message, list) else [message]
+        transfer = ParallelTransfer(client, self.transfer_part_kb, self.transfer_workers)
+        # Pinned before local_path is checked and until the upload is done: eviction must not
+        # unlink a file between the exists() check and the upload opening it
+        pinned = [m.store_key for m in messages if getattr(m, "store_key", None)] if self.media_store else []
+        for key in pinned:
+            self.media_store.pin(key)
+        try:
+            with tempfile.TemporaryDirectory(prefix="transfer_", dir=self.transfer_dir) as tmp:
+                files = []
+                for m in messages:
+                    if not getattr(m, "media", None):
+                        continue
+                    document = getattr(m.media, "document", None)
+                    path = await self._local_copy(transfer, m, tmp, size=getattr(document, "size", None))
+                    if document is None:
+                        # Photos are recognised by their extension
+                        files.append((await transfer.upload(path, "photo.jpg"), None))
+                    else:
+                        name = next((a.file_name for a in document.attributes if getattr(a, "file_name", None)), "file")
+                        files.append((await transfer.upload(path, name), document))
+
+                caption = messages[0].message
+                if not files:
+                    sent = await client.send_message(target, caption)
+                elif len(files) == 1:
+                    uploaded, document = files[0]
+                    extra = {}
+                    if document is not None:
+                        extra = {"attributes": document.attributes, "mime_type": document.mime_type,
+                                 "force_document": False, "supports_streaming": True}
+                    sent = await client.send_file(target, uploaded, caption=caption, **extra)
                 else:
-                    sent = await client.send_message(target, message)
-                
+                    # send_file takes one set of attributes for the whole album: each document
+                    # carries its own (video duration/streaming, audio title, file name) instead
+                    sent = await client.send_file(target, [self._uploaded_media(f, d) for f, d in files], caption=caption)
             return {"ok": True, "message": sent}
         except FloodWaitError as e:
             return {"ok": False, "error": "flood_wait", "wait_seconds": e.seconds}
         except Exception as e:
-            logger.error(f"Telethon send error: {e}")
+            logger.error(f"Telethon re-upload error: {e}")
+            return {"ok": False, "error": "exception", "detail": str(e)}
+        finally:
+            for key in pinned:
+                self.media_store.unpin(key)
+
+    @staticmethod
+    def _uploaded_media(uploaded, document):
+        if document is None:
+            return InputMediaUploadedPhoto(file=uploaded)
+        attributes = []
+        for attr in document.attributes:
+            if isinstance(attr, DocumentAttributeVideo):
+                # Copied so the source message's attribute is left untouched
+                attr = copy.copy(attr)
+                attr.supports_streaming = True
+            attributes.append(attr)
+        return InputMediaUploadedDocument(
+            file=uploaded, mime_type=document.mime_type, attributes=attributes, force_file=False
+        )
+
+    async def _local_copy(self, transfer: ParallelTransfer, m, tmp: str, size: int | None) -> str:
+        path = getattr(m, "local_path", None)
+        if path and os.path.exists(path):
+            return path
+        key = getattr(m, "store_key", None)
+        if not (self.media_store and key):
+            path = os.path.join(tmp, str(m.id))
+            await transfer.download(m.media, path, size=size)
+            return path
+
+        staged = self.media_store.staging_path(key)
+        try:
+            await transfer.download(m.media, staged, size=size)
+        except BaseException:
+            self.media_store.discard_staged(staged)
+            raise
+        m.local_path = self.media_store.put(key, staged)
+        return m.local_path
+
+    async def forward_messages(self, user_id: int, source_id, destination, msg_ids: list,
+                               drop_media_captions: bool = False) -> dict:
+        """
+        Server-side copy: Telegram duplicates the messages (media included) without
+        re-uploading anything. drop_author hides the 'Forwarded from' header.
+        """
+        client = await self._client(user_id)
+        if not client or not client.is_connected():
+            return {"ok": False, "error": "disconnected"}
+
+        try:
+            from_peer = await client.get_input_entity(self._target(user_id, source_id))
+            to_peer = await client.get_input_entity(self._target(user_id, destination))
+            sent = []
+            for i in range(0, len(msg_ids), FORWARD_BATCH_SIZE):
+                result = await client(ForwardMessagesRequest(
+                    from_peer=from_peer,
+                    id=msg_ids[i:i + FORWARD_BATCH_SIZE],
+                    to_peer=to_peer,
+                    drop_author=True,
+                    drop_media_captions=drop_media_captions or None,
+                ))
+                sent.extend(
+                    u.message for u in getattr(result, "updates", [])
+                    if isinstance(u, (UpdateNewMessage, UpdateNewChannelMessage))
+                )
+            return {"ok": True, "message": sent}
+        except FloodWaitError as e:
+            return {"ok": False, "error": "flood_wait", "wait_seconds": e.seconds}
+        except ChatForwardsRestrictedError:
+            return {"ok": False, "error": "forwards_restricted"}
+        except Exception as e:
+            logger.error(f"Telethon forward error: {e}")
             return {"ok": False, "error": "exception", "detail": str(e)}
 
-    
-    
     async def stop_listener(self, user_id: int):
-        client = self.active_clients.pop(user_id, None)
-        if client:
-            try:
-                await client.disconnect()
-                return True
-            except: pass
-        return False
+        if self._hibernated.pop(user_id, None):
+            return True
+        listener = self._listeners.pop(user_id, None)
+        if not listener:
+            return False
+        listener["client"].remove_event_handler(listener["handler"])
+        await self.registry.release(user_id)
+        return True
 
 
@@ -0,0 +1,97 @@
+"""
+SCRIPTS: DEDUP BENCHMARK
+The 'Stress Test'.
+Compares the old sort-on-overflow dict against DedupStore's O(1) LRU,
+and the old md5 text digest against the crc32 digest now used for dedup keys.
+
+Usage: python scripts/bench_dedup.py [inserts]
+"""
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+import timeit
+import zlib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from services.dedup_store import DedupStore
+
+CAPACITY = 500
+
+
+def legacy_is_duplicate(seen: dict, key: str, capacity: int = CAPACITY) -> bool:
+    """The pre-DedupStore algorithm, verbatim (capacity was DEDUP_CACHE_SIZE)."""
+    if key in seen: return True
+    seen[key] = time.time()
+    if len(seen) > capacity:
+        oldest = sorted(seen, key=seen.get)[:100]
+        for k in oldest: del seen[k]
+    return False
+
+
+def best_of(run, repeats: int = 5) -> float:
+    """Fastest of several runs: the least disturbed by the rest of the machine."""
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def bench_store(inserts: int, keys: list, capacity: int = CAPACITY):
+    def legacy():
+        seen = {}
+        for k in keys:
+            legacy_is_duplicate(seen, k, capacity)
+
+    def memory():
+        store = DedupStore(capacity=capacity)
+        for k in keys:
+            store.seen_before(1, k)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "dedup.log")
+
+        def disk():
+            if os.path.exists(path):
+                os.remove(path)
+            store = DedupStore(capacity=capacity, path=path)
+            for k in keys:
+                store.seen_before(1, k)
+            store.close()
+
+        legacy_s, memory_s, disk_s = best_of(legacy), best_of(memory), best_of(disk)
+
+        def load():
+            DedupStore(capacity=capacity, path=path).seen_before(1, "warmup")
+        load_s = best_of(load)
+
+    print(f"{inserts} inserts, capacity {capacity} (best of 5)")
+    print(f"  legacy dict + sort : {legacy_s * 1e6 / inserts:8.3f} us/insert  (memory only, lost on restart)")
+    print(f"  DedupStore memory  : {memory_s * 1e6 / inserts:8.3f} us/insert")
+    print(f"  DedupStore + log   : {disk_s * 1e6 / inserts:8.3f} us/insert  (survives restarts)")
+    print(f"  lazy log load      : {load_s * 1e3:8.3f} ms")
+
+
+def bench_digest():
+    rng = random.Random(7)
+    words = ["promo", "sale", "https://t.me/channel", "new", "drop", "today", "🔥", "link", "@handle"]
+    texts = [" ".join(rng.choice(words) for _ in range(rng.randint(5, 120))).encode() for _ in range(1000)]
+    md5 = timeit.timeit(lambda: [hashlib.md5(t).hexdigest()[:12] for t in texts], number=50)
+    crc = timeit.timeit(lambda: [f"{zlib.crc32(t):08x}{len(t):x}" for t in texts], number=50)
+    print("text digest, 50k captions")
+    print(f"  md5[:12]           : {md5 * 1e6 / 50000:8.3f} us/caption")
+    print(f"  crc32 + length     : {crc * 1e6 / 50000:8.3f} us/caption")
+
+
+if __name__ == "__main__":
+    inserts = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    keys = [f"-100123:{i}" for i in range(inserts)]
+    bench_store(inserts, keys)
+    # The legacy sort grows with the cache, the LRU does not
+    bench_store(inserts, keys, capacity=CAPACITY * 10)
+    bench_digest()
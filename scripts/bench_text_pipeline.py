@@ -0,0 +1,94 @@
+"""
+SCRIPTS: TEXT PIPELINE BENCHMARK
+The 'Stress Test'.
+Runs a synthetic caption corpus (promo posts with links and @usernames, plain
+captions, media without a caption) through the original MessageCleaner passes
+and through the compiled per-pair pipelines. Checks that both produce the same
+text and reports CPU time per caption.
+
+Usage: python scripts/bench_text_pipeline.py [captions] [rounds]
+"""
+import random
+import re
+import sys
+import os
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.repost.text_pipeline import compile_text_pipeline, REMOVE_PATTERN, REPLACE_PATTERN
+
+WORDS = (
+    "new drop is live today grab yours before it sells out limited offer free shipping "
+    "daily signals entry target stop loss update giveaway winners announced tomorrow "
+    "🔥 🚀 ✅ 💎 #crypto #sale #news price 24h volume, market. join us for more!"
+).split()
+LINKS = [
+    "https://t.me/somechannel", "t.me/+AbCdEf12_x", "https://t.me/joinchat/QwErTy", "t.me/chan/1234",
+    "T.ME/Shouting", "@promo_bot", "@Admin_Support", "https://example.com/page",
+]
+SETTINGS = [(1, None), (2, "https://t.me/mychannel"), (2, None), (0, None)]
+
+
+def legacy_clean(text: str, mode: int, replacement: str = None) -> str:
+    """MessageCleaner.clean as it was before the compiled pipeline."""
+    if not text or mode == 0:
+        return text
+    if mode == 1:
+        text = REMOVE_PATTERN.sub('', text)
+    elif mode == 2:
+        text = REPLACE_PATTERN.sub(replacement if replacement else "", text)
+    text = re.sub(r' {2,}', ' ', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+
+def make_corpus(count: int) -> list:
+    rng = random.Random(42)
+    corpus = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.2:
+            # Media without a caption
+            corpus.append("")
+            continue
+        promo = kind < 0.6
+        lines = []
+        for _ in range(rng.randint(1, 8 if promo else 3)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(3, 20))]
+            if promo and rng.random() < 0.5:
+                words.insert(rng.randrange(len(words) + 1), rng.choice(LINKS))
+            lines.append(" ".join(words) + ("  " if rng.random() < 0.1 else ""))
+        corpus.append(rng.choice(["\n", "\n\n", "\n\n\n"]).join(lines))
+    return corpus
+
+
+def timed(fn, corpus: list, rounds: int) -> float:
+    started = time.process_time()
+    for _ in range(rounds):
+        for text in corpus:
+            fn(text)
+    return time.process_time() - started
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    corpus = make_corpus(count)
+    print(f"{count} captions x {rounds} rounds")
+    for mode, replacement in SETTINGS:
+        pipeline = compile_text_pipeline(mode, replacement)
+        mismatches = sum(pipeline(t) != legacy_clean(t, mode, replacement) for t in corpus)
+        before = timed(lambda t: legacy_clean(t, mode, replacement), corpus, rounds)
+        after = timed(pipeline, corpus, rounds)
+        per = 1e6 / (count * rounds)
+        print(
+            f"mode {mode} {replacement or '-':>24}: legacy {before * per:6.2f} us  "
+            f"compiled {after * per:6.2f} us  ({before / after if after else 0:4.1f}x)  "
+            f"mismatches {mismatches}"
+        )
+
+
+if __name__ == "__main__":
+    main()
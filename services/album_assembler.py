@@ -0,0 +1,81 @@
+"""
+SERVICES: ALBUM ASSEMBLER
+The 'Short-Term Memory'. (Anatomy: Nervous System)
+Collects the parts of a Telegram album (same grouped_id) and releases them as one batch.
+Debounce timers replace polling: each new part restarts a quiet window, a full album
+flushes at once, and every album is bounded by a hard deadline.
+"""
+import logging
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_ALBUM_LIMIT = 10
+
+
+class AlbumAssembler:
+    def __init__(self, on_ready, quiet_ms: int = 500, max_wait_ms: int = 5000, max_buffered: int = 200):
+        # on_ready(user_id, messages) is awaited in its own task for every finished album
+        self._on_ready = on_ready
+        self.quiet_ms = quiet_ms
+        self.max_wait_ms = max_wait_ms
+        self.max_buffered = max_buffered
+        # grouped_id -> album state; insertion order doubles as age order
+        self._albums = {}
+        self._tasks = set()
+        self.forced_flushes = 0
+
+    def __len__(self):
+        return len(self._albums)
+
+    def add(self, user_id: int, message, quiet_ms: int = None):
+        loop = asyncio.get_running_loop()
+        gid = message.grouped_id
+        album = self._albums.get(gid)
+        if album is None:
+            # Rule 14: Never hold more than max_buffered open albums
+            if len(self._albums) >= self.max_buffered:
+                self.forced_flushes += 1
+                self._flush(next(iter(self._albums)))
+            album = {"user_id": user_id, "messages": [], "started": loop.time(), "timer": None}
+            self._albums[gid] = album
+
+        album["messages"].append(message)
+        if len(album["messages"]) >= TELEGRAM_ALBUM_LIMIT:
+            self._flush(gid)
+            return
+
+        if album["timer"]:
+            album["timer"].cancel()
+        quiet = (quiet_ms or self.quiet_ms) / 1000
+        deadline = album["started"] + self.max_wait_ms / 1000
+        delay = max(0.0, min(quiet, deadline - loop.time()))
+        album["timer"] = loop.call_later(delay, self._flush, gid)
+
+    def _flush(self, gid):
+        album = self._albums.pop(gid, None)
+        if not album:
+            return
+        if album["timer"]:
+            album["timer"].cancel()
+        # Parts can arrive out of order; Telegram ids inside an album are ascending
+        messages = sorted(album["messages"], key=lambda m: m.id)
+        task = asyncio.create_task(self._on_ready(album["user_id"], messages))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def flush_user(self, user_id: int):
+        """Releases one user's open albums immediately (the user moves to another shard)."""
+        for gid in [gid for gid, album in self._albums.items() if album["user_id"] == user_id]:
+            self._flush(gid)
+
+    def flush_all(self):
+        """Releases every open album immediately."""
+        for gid in list(self._albums):
+            self._flush(gid)
+
+    async def close(self):
+        """Shutdown: releases every open album and waits until each is handed over."""
+        self.flush_all()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
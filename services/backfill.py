@@ -0,0 +1,84 @@
+"""
+SERVICES: BACKFILL CURSOR
+The 'Long-Term Recall'. (Anatomy: Nervous System)
+Pulls a source's history through a bounded prefetch buffer so the engine can post
+it at its own pace without holding the whole range in memory.
+
+A scheduled backfill may wait hours between steps, longer than media file references
+live, so it buffers MessageRefs (ids only) and re-fetches each group just before sending.
+"""
+import logging
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class MessageRef:
+    """What a scheduled backfill keeps of a history message: no media, nothing to go stale."""
+    __slots__ = ("id", "grouped_id", "postable")
+
+    def __init__(self, msg):
+        self.id = msg.id
+        self.grouped_id = getattr(msg, "grouped_id", None)
+        self.postable = bool(getattr(msg, "message", None) or getattr(msg, "media", None))
+
+
+async def message_refs(history):
+    """Wraps a history stream so only MessageRefs are buffered."""
+    async for msg in history:
+        yield MessageRef(msg)
+
+
+class BackfillCursor:
+    def __init__(self, history, prefetch: int = 100):
+        # history: async iterator of messages, oldest first
+        self._history = history
+        self._buffer = asyncio.Queue(maxsize=prefetch)
+        self._task = None
+        self._peeked = None
+        self._done = False
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._fill())
+
+    async def _fill(self):
+        try:
+            async for msg in self._history:
+                await self._buffer.put(msg)
+        except Exception as e:
+            logger.error(f"Backfill prefetch stopped: {e}")
+        await self._buffer.put(_END)
+
+    async def _next(self):
+        if self._done:
+            return None
+        item = await self._buffer.get()
+        if item is _END:
+            self._done = True
+            return None
+        return item
+
+    async def next_group(self) -> list | None:
+        """Next single message, or every part of the next album. None at the end."""
+        self.start()
+        first = self._peeked if self._peeked is not None else await self._next()
+        self._peeked = None
+        if first is None:
+            return None
+
+        group = [first]
+        gid = getattr(first, "grouped_id", None)
+        while gid:
+            nxt = await self._next()
+            if nxt is None or getattr(nxt, "grouped_id", None) != gid:
+                self._peeked = nxt
+                break
+            group.append(nxt)
+        return group
+
+    def close(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
@@ -0,0 +1,177 @@
+"""
+SERVICES: DEDUP STORE
+The 'Immune Memory'. (Anatomy: Immune System)
+Remembers which messages each pair already posted so nothing is sent twice.
+O(1) LRU/TTL eviction per pair, optionally backed by an append-only log on disk
+so the memory survives restarts and reconnects.
+"""
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Log records are formatted and written in batches of this many (or every flush_interval)
+LOG_BATCH = 256
+# The log is never compacted below this many lines: small stores would rewrite it constantly
+COMPACT_MIN_LINES = 20_000
+
+
+class DedupStore:
+    """
+    Log format, one record per line:
+      <pair_id>\\t<timestamp>\\t<key>   key seen
+      <pair_id>\\t-\\t                  pair forgotten (tombstone)
+    Records are queued in memory and written LOG_BATCH at a time (and every
+    flush_interval). The log is compacted (rewritten from memory) once it holds
+    compact_ratio times more lines than there are live keys, and COMPACT_MIN_LINES.
+    """
+    def __init__(self, capacity: int = 500, ttl_seconds: int = 86400 * 7, path: str | None = None,
+                 flush_interval: float = 5.0, compact_ratio: float = 3.0):
+        self.capacity = capacity
+        self.ttl = ttl_seconds
+        self._path = path
+        self._flush_interval = flush_interval
+        self._compact_ratio = compact_ratio
+        self._seen = {}
+        self._loaded = False
+        self._file = None
+        # (pair_id, timestamp or None for a tombstone, key) not yet written to the log
+        self._pending = []
+        self._log_lines = 0
+        self._compact_at = 0
+        self._last_flush = time.time()
+
+    # --- Lazy load ---
+
+    def _ensure_loaded(self):
+        """Rule 1: The log is read on first use, not at import time."""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self._path:
+            return
+        if os.path.exists(self._path):
+            now = time.time()
+            with open(self._path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._log_lines += 1
+                    parts = line.rstrip("\n").split("\t", 2)
+                    if len(parts) != 3 or not parts[0].isdigit():
+                        continue
+                    pair_id = int(parts[0])
+                    if parts[1] == "-":
+                        self._seen.pop(pair_id, None)
+                        continue
+                    try:
+                        ts = float(parts[1])
+                    except ValueError:
+                        continue
+                    if now - ts < self.ttl:
+                        self._remember(pair_id, parts[2], ts)
+            logger.info(f"Dedup log loaded: {self.size()} keys for {len(self._seen)} pairs.")
+        else:
+            os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+        self._file = open(self._path, "a", encoding="utf-8")
+        self._schedule_compaction()
+
+    # --- Core ---
+
+    def _remember(self, pair_id: int, key: str, ts: float):
+        seen = self._seen.get(pair_id)
+        if seen is None:
+            seen = self._seen[pair_id] = OrderedDict()
+        seen[key] = ts
+        seen.move_to_end(key)
+        if len(seen) > self.capacity:
+            seen.popitem(last=False)
+
+    def seen_before(self, pair_id: int, key: str) -> bool:
+        """
+        Returns True for a repeat; otherwise records the key and returns False.
+        Capacity bounds memory (O(1) pop from the cold end); TTL is checked on lookup.
+        """
+        if not self._loaded:
+            self._ensure_loaded()
+        now = time.time()
+        seen = self._seen.get(pair_id)
+        if seen is None:
+            seen = self._seen[pair_id] = OrderedDict()
+        else:
+            ts = seen.get(key)
+            if ts is not None:
+                if now - ts < self.ttl:
+                    seen[key] = now
+                    seen.move_to_end(key)
+                    return True
+                del seen[key]
+
+        seen[key] = now
+        if len(seen) > self.capacity:
+            seen.popitem(last=False)
+        if self._file is not None:
+            # Rule 14: The hot path only queues the record; formatting and I/O happen per batch
+            pending = self._pending
+            pending.append((pair_id, now, key))
+            if len(pending) >= LOG_BATCH or now - self._last_flush > self._flush_interval:
+                self.flush()
+        return False
+
+    def forget_pair(self, pair_id: int):
+        self._ensure_loaded()
+        if self._seen.pop(pair_id, None) is not None and self._file is not None:
+            self._pending.append((pair_id, None, ""))
+            self.flush()
+
+    def size(self) -> int:
+        return sum(len(s) for s in self._seen.values())
+
+    # --- Disk ---
+
+    def _schedule_compaction(self):
+        self._compact_at = max(COMPACT_MIN_LINES, max(self.capacity, self.size()) * self._compact_ratio)
+
+    def flush(self):
+        """Writes the queued records in one call; compacts instead once the log has grown enough."""
+        self._last_flush = time.time()
+        if not self._file:
+            return
+        pending, self._pending = self._pending, []
+        if pending:
+            self._file.write("".join(
+                f"{pair_id}\t{int(ts)}\t{key}\n" if ts is not None else f"{pair_id}\t-\t\n"
+                for pair_id, ts, key in pending
+            ))
+            self._log_lines += len(pending)
+        if self._log_lines > self._compact_at:
+            self.compact()
+        else:
+            self._file.flush()
+
+    def compact(self):
+        """Rewrites the log with live keys only, atomically."""
+        if not self._path:
+            return
+        tmp = f"{self._path}.tmp"
+        lines = 0
+        with open(tmp, "w", encoding="utf-8") as f:
+            for pair_id, seen in self._seen.items():
+                for key, ts in seen.items():
+                    f.write(f"{pair_id}\t{ts:.0f}\t{key}\n")
+                    lines += 1
+        if self._file:
+            self._file.close()
+        os.replace(tmp, self._path)
+        self._file = open(self._path, "a", encoding="utf-8")
+        self._log_lines = lines
+        # Memory already holds everything queued: the rewrite covers it
+        self._pending = []
+        self._last_flush = time.time()
+        self._schedule_compaction()
+
+    def close(self):
+        if self._file:
+            self.flush()
+            self._file.close()
+            self._file = None
@@ -0,0 +1,105 @@
+"""
+SERVICES: LAST SEEN LOG
+The 'Bookmark'. (Anatomy: Nervous System)
+Newest message id seen per (user, source chat): the point a catch-up resumes from.
+In sharded mode each worker writes it behind to its own JSON file, so when a worker
+dies the coordinator can hand the dead shard's bookmarks to the adopting shard
+instead of the adopter starting from the newest message and missing the gap.
+
+File format, the same shape as a live shard's release handoff:
+  {"<user_id>": [[chat_id, msg_id], ...], ...}
+"""
+import logging
+import asyncio
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def read_last_seen(path: str) -> dict:
+    """The handoff written by a (possibly dead) shard; {} when there is none."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error(f"Unreadable last seen file {path}: {e}")
+        return {}
+
+
+class LastSeenLog:
+    def __init__(self, path: str | None = None, flush_seconds: float = 5):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        # (user_id, source chat id) -> newest message id seen
+        self._seen = {}
+        self._timer = None
+        self._dirty = False
+        if path:
+            # The file describes this run only: a leftover from a previous one must not be handed on
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, user_id: int, chat_id) -> int | None:
+        return self._seen.get((user_id, chat_id))
+
+    def seed(self, user_id: int, chat_id, msg_id: int):
+        """Anchors a source nothing has been seen from yet."""
+        if (user_id, chat_id) not in self._seen:
+            self._seen[(user_id, chat_id)] = msg_id
+            self._touch()
+
+    def mark(self, user_id: int, chat_id, msg_id: int):
+        key = (user_id, chat_id)
+        if msg_id > self._seen.get(key, 0):
+            self._seen[key] = msg_id
+            self._touch()
+
+    def pop_user(self, user_id: int) -> dict:
+        """Removes and returns {chat_id: msg_id} of one user (the user leaves this shard)."""
+        seen = {chat_id: msg_id for (uid, chat_id), msg_id in self._seen.items() if uid == user_id}
+        for chat_id in seen:
+            del self._seen[(user_id, chat_id)]
+        if seen:
+            self._touch()
+        return seen
+
+    # --- Write-behind ---
+
+    def _touch(self):
+        if not self.path:
+            return
+        self._dirty = True
+        if self._timer is None:
+            try:
+                self._timer = asyncio.get_running_loop().call_later(self.flush_seconds, self.flush)
+            except RuntimeError:
+                pass
+
+    def flush(self):
+        """Rule 14: One small atomic rewrite per interval, only when something moved."""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._dirty or not self.path:
+            return
+        by_user = {}
+        for (user_id, chat_id), msg_id in self._seen.items():
+            by_user.setdefault(str(user_id), []).append([chat_id, msg_id])
+        tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(by_user, f)
+            os.replace(tmp, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.error(f"Last seen write to {self.path} failed: {e}")
+
+    def close(self):
+        self.flush()
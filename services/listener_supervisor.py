@@ -0,0 +1,183 @@
+"""
+SERVICES: LISTENER SUPERVISOR
+The 'Brainstem'. (Anatomy: Nervous System)
+Keeps the Eyes open. Watches every listener for a dead connection or a stall
+(an account with active sources that has heard nothing for far longer than it
+usually does), reconnects with jittered exponential backoff, then asks the
+engine to catch up on whatever the sources posted while the listener was deaf.
+Optionally puts idle accounts to sleep: their client is dropped and, every poll
+interval, briefly reopened to catch up; an account with news stays awake.
+"""
+import logging
+import asyncio
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Silence counts as a stall only past this many of the account's average gaps between updates
+STALL_GAP_FACTOR = 10
+
+
+class ListenerSupervisor:
+    def __init__(self, provider, catch_up, has_sources, check_interval: float = 30,
+                 stall_seconds: float = 900, backoff_base: float = 2, backoff_max: float = 300,
+                 hibernate_after: float = 0, poll_interval: float = 300):
+        # catch_up(user_id) is awaited after every successful reconnect and returns the messages it queued
+        self.provider = provider
+        self._catch_up = catch_up
+        self._has_sources = has_sources
+        self.check_interval = check_interval
+        self.stall_seconds = stall_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # 0 keeps every listener awake
+        self.hibernate_after = hibernate_after
+        self.poll_interval = poll_interval
+        self._watched = set()
+        self._recovering = {}
+        # user_id -> hibernate or poll task in flight
+        self._sleeping = {}
+        self._next_poll = {}
+        self._wake = None
+        self._task = None
+        self.reconnects = 0
+        self.stalls = 0
+        self.hibernations = 0
+        self.polls = 0
+
+    def start(self):
+        """Rule 1: Idempotent; one watchdog loop for every listener."""
+        if self._task and not self._task.done():
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="listener_supervisor")
+
+    def watch(self, user_id: int):
+        self._watched.add(user_id)
+        self.start()
+
+    def unwatch(self, user_id: int):
+        self._watched.discard(user_id)
+        self._next_poll.pop(user_id, None)
+        for tasks in (self._recovering, self._sleeping):
+            task = tasks.pop(user_id, None)
+            if task: task.cancel()
+
+    def wake(self, user_id: int = None):
+        """Disconnect hook: checks right away instead of at the next interval."""
+        if self._wake:
+            self._wake.set()
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+            now = time.monotonic()
+            for user_id in list(self._watched):
+                if user_id in self._recovering or user_id in self._sleeping:
+                    continue
+                if not self.provider.has_listener(user_id):
+                    # Stopped or released elsewhere: nothing left to keep open
+                    self.unwatch(user_id)
+                    continue
+                if self.provider.is_hibernating(user_id):
+                    # Accounts without sources have nothing to catch up; they wake on use only
+                    if self._has_sources(user_id) and now >= self._next_poll.get(user_id, 0):
+                        self._start(self._sleeping, user_id, self._poll(user_id))
+                    continue
+                if (self.hibernate_after and self.provider.is_listening(user_id)
+                        and now - self.provider.last_activity_at(user_id) > self.hibernate_after):
+                    self._start(self._sleeping, user_id, self._hibernate(user_id))
+                    continue
+                reason = None
+                if not self.provider.is_listening(user_id):
+                    reason = "disconnected"
+                elif self._has_sources(user_id) and self._stalled(user_id, now):
+                    self.stalls += 1
+                    reason = f"no updates for {now - self.provider.last_event_at(user_id):.0f}s"
+                if reason:
+                    self._start(self._recovering, user_id, self._recover(user_id, reason))
+
+    def _stalled(self, user_id: int, now: float) -> bool:
+        """
+        Silence is only suspicious on an account expected to talk: at least stall_seconds and
+        STALL_GAP_FACTOR of its own average gaps. One that has not shown two updates yet is
+        never called stalled; a dead connection is still caught by is_listening.
+        """
+        gap = self.provider.update_gap(user_id)
+        if gap is None:
+            return False
+        return now - self.provider.last_event_at(user_id) > max(self.stall_seconds, STALL_GAP_FACTOR * gap)
+
+    @staticmethod
+    def _start(tasks: dict, user_id: int, coro):
+        task = tasks[user_id] = asyncio.create_task(coro)
+        task.add_done_callback(lambda t: tasks.pop(user_id, None) if tasks.get(user_id) is t else None)
+
+    async def _hibernate(self, user_id: int):
+        if await self.provider.hibernate(user_id):
+            self.hibernations += 1
+            self._next_poll[user_id] = time.monotonic() + self.poll_interval
+
+    async def _poll(self, user_id: int):
+        """
+        The wake-up: a full reconnect, then one history scan per source from its last seen id
+        (no getDifference: the update state left with the dropped client). Back to sleep if nothing came.
+        """
+        self.polls += 1
+        self._next_poll[user_id] = time.monotonic() + self.poll_interval
+        if not await self.provider.wake(user_id):
+            logger.warning(f"Poll of hibernated User {user_id} could not reconnect; retrying next interval.")
+            return
+        try:
+            queued = await self._catch_up(user_id)
+        except Exception as e:
+            logger.error(f"Catch-up for User {user_id} failed: {e}")
+            return
+        if not queued:
+            await self._hibernate(user_id)
+
+    async def _recover(self, user_id: int, reason: str):
+        logger.warning(f"Listener of User {user_id} {reason}; reconnecting.")
+        attempt = 0
+        while user_id in self._watched:
+            if not self.provider.has_listener(user_id):
+                # reconnect() can never succeed without a listener entry: stop instead of retrying forever
+                logger.info(f"Listener of User {user_id} is gone; recovery stopped.")
+                self._watched.discard(user_id)
+                return
+            if await self.provider.reconnect(user_id):
+                self.reconnects += 1
+                logger.info(f"Listener of User {user_id} back after {attempt + 1} attempt(s); catching up.")
+                try:
+                    await self._catch_up(user_id)
+                except Exception as e:
+                    logger.error(f"Catch-up for User {user_id} failed: {e}")
+                return
+            # Full jitter keeps many accounts from reconnecting in lockstep
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "watched": len(self._watched),
+            "recovering": len(self._recovering),
+            "reconnects": self.reconnects,
+            "stalls": self.stalls,
+            "hibernations": self.hibernations,
+            "polls": self.polls,
+            **self.provider.hibernation_stats(),
+        }
+
+    async def stop(self):
+        for task in [*self._recovering.values(), *self._sleeping.values()]:
+            task.cancel()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -1,59 +1,140 @@
 """
 SERVICES: MEDIA CACHE
-Caches media references for scheduled reposts to prevent stale file references.
-Stores lightweight metadata keyed by pair_id to ensure reliable delayed sends.
-Also caches Telegram file_id mappings for media reuse without reuploading.
+Remembers which uploaded Telegram file stands for a source photo/document, so
+the same media is re-sent by reference instead of being downloaded and uploaded
+again. A bounded in-memory LRU sits in front of an on-disk SQLite index; only a
+compact record (id, access_hash, file_reference, dc) is kept per file.
 """
 import logging
+import os
+import sqlite3
 import time
+from collections import OrderedDict
 
 logger = logging.getLogger(__name__)
 
 
 class MediaCache:
-    def __init__(self, max_age_hours: int = 24):
-        self._cache = {}
-        self._max_age = max_age_hours * 3600
-        self._file_id_map = {}
-        self._file_id_max_age = 86400 * 7
-
-    def cache_bundle(self, pair_id: int, messages) -> list:
-        if pair_id not in self._cache:
-            self._cache[pair_id] = []
-
-        bundle = {
-            "messages": messages,
-            "cached_at": time.time(),
-        }
-        self._cache[pair_id].append(bundle)
-        self._evict_stale(pair_id)
-        return messages
+    def __init__(self, path: str | None = None, memory_entries: int = 5000, max_entries: int = 100_000,
+                 max_age_days: int = 7, flush_every: int = 50, flush_interval: float = 5.0):
+        self._path = path
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self._file_id_max_age = max_age_days * 86400
+        self._flush_every = flush_every
+        self._flush_interval = flush_interval
+        # media key -> (record, cached_at); most recently used at the end
+        self._lru = OrderedDict()
+        self._db = None
+        self._loaded = False
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._writes_since_prune = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
 
-    def get_cached(self, pair_id: int) -> list:
-        self._evict_stale(pair_id)
-        bundles = self._cache.get(pair_id, [])
-        return [b["messages"] for b in bundles]
+    # --- Lazy load ---
 
-    def clear_pair(self, pair_id: int):
-        self._cache.pop(pair_id, None)
+    def _ensure_loaded(self):
+        """Rule 1: The index is opened on first use; only the newest entries are warmed into memory."""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self._path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self._path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS file_ids ("
+                "media_key TEXT PRIMARY KEY, kind TEXT NOT NULL, id INTEGER NOT NULL, "
+                "access_hash INTEGER NOT NULL, file_reference BLOB NOT NULL, dc_id INTEGER, "
+                "cached_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_file_ids_cached_at ON file_ids (cached_at)")
+            rows = self._db.execute(
+                "SELECT media_key, kind, id, access_hash, file_reference, dc_id, cached_at FROM file_ids "
+                "WHERE cached_at > ? ORDER BY cached_at DESC LIMIT ?",
+                (time.time() - self._file_id_max_age, self.memory_entries)
+            ).fetchall()
+            for row in reversed(rows):
+                self._lru[row[0]] = (self._record(*row[1:6]), row[6])
+            logger.info(f"Media cache warmed with {len(rows)} file references.")
+        except sqlite3.Error as e:
+            logger.error(f"Media cache index unavailable, using memory only: {e}")
+            self._db = None
 
-    def clear_all(self):
-        self._cache.clear()
+    @staticmethod
+    def _record(kind: str, file_id: int, access_hash: int, file_reference: bytes, dc_id: int | None) -> dict:
+        return {"kind": kind, "id": file_id, "access_hash": access_hash,
+                "file_reference": bytes(file_reference), "dc_id": dc_id}
 
-    def store_file_id(self, original_key: str, file_id: str):
-        self._file_id_map[original_key] = {
-            "file_id": file_id,
-            "cached_at": time.time(),
-        }
+    @classmethod
+    def compact_record(cls, media) -> dict | None:
+        """Strips a sent message's media down to what is needed to send it again."""
+        photo = getattr(media, "photo", None)
+        if photo is not None and getattr(photo, "access_hash", None) is not None:
+            return cls._record("photo", photo.id, photo.access_hash, photo.file_reference, getattr(photo, "dc_id", None))
+        document = getattr(media, "document", None)
+        if document is not None and getattr(document, "access_hash", None) is not None:
+            return cls._record("document", document.id, document.access_hash, document.file_reference,
+                               getattr(document, "dc_id", None))
+        return None
+
+    # --- Core ---
+
+    def _remember(self, original_key: str, record: dict, cached_at: float):
+        self._lru[original_key] = (record, cached_at)
+        self._lru.move_to_end(original_key)
+        if len(self._lru) > self.memory_entries:
+            self._lru.popitem(last=False)
+
+    def store_file_id(self, original_key: str, sent_media):
+        record = self.compact_record(sent_media)
+        if record is None:
+            return
+        if not self._loaded:
+            self._ensure_loaded()
+        now = time.time()
+        self._remember(original_key, record, now)
+        if self._db is not None:
+            self._pending[original_key] = (record, now)
+            if len(self._pending) >= self._flush_every or time.monotonic() - self._last_flush > self._flush_interval:
+                self.flush()
 
-    def get_file_id(self, original_key: str) -> str | None:
-        entry = self._file_id_map.get(original_key)
-        if not entry:
+    def get_file_id(self, original_key: str) -> dict | None:
+        if not self._loaded:
+            self._ensure_loaded()
+        now = time.time()
+        entry = self._lru.get(original_key)
+        if entry is not None:
+            if now - entry[1] < self._file_id_max_age:
+                self._lru.move_to_end(original_key)
+                self.memory_hits += 1
+                return entry[0]
+            del self._lru[original_key]
+
+        entry = self._pending.get(original_key) or self._read_disk(original_key)
+        if entry is not None and now - entry[1] < self._file_id_max_age:
+            self._remember(original_key, *entry)
+            self.disk_hits += 1
+            return entry[0]
+        self.misses += 1
+        return None
+
+    def _read_disk(self, original_key: str):
+        if self._db is None:
             return None
-        if time.time() - entry["cached_at"] > self._file_id_max_age:
-            del self._file_id_map[original_key]
+        try:
+            row = self._db.execute(
+                "SELECT kind, id, access_hash, file_reference, dc_id, cached_at FROM file_ids WHERE media_key = ?",
+                (original_key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Media cache lookup failed: {e}")
             return None
-        return entry["file_id"]
+        return (self._record(*row[:5]), row[5]) if row else None
 
     def extract_media_key(self, media) -> str | None:
         if not media:
@@ -64,15 +145,49 @@ class MediaCache:
             return f"doc:{media.document.id}"
         return None
 
-    def _evict_stale(self, pair_id: int):
-        if pair_id not in self._cache:
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups * 100, 1) if lookups else 0.0,
+        }
+
+    # --- Disk ---
+
+    def flush(self):
+        """Writes pending records in one transaction and keeps the index within max_entries."""
+        self._last_flush = time.monotonic()
+        if self._db is None or not self._pending:
             return
-        now = time.time()
-        before = len(self._cache[pair_id])
-        self._cache[pair_id] = [
-            b for b in self._cache[pair_id]
-            if (now - b["cached_at"]) < self._max_age
-        ]
-        evicted = before - len(self._cache[pair_id])
-        if evicted > 0:
-            logger.info(f"Evicted {evicted} stale cache entries for Pair #{pair_id}")
+        pending, self._pending = self._pending, {}
+        try:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO file_ids VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(key, r["kind"], r["id"], r["access_hash"], r["file_reference"], r["dc_id"], ts)
+                     for key, (r, ts) in pending.items()]
+                )
+            self._writes_since_prune += len(pending)
+            if self._writes_since_prune >= self.max_entries // 10:
+                self._prune()
+        except sqlite3.Error as e:
+            logger.error(f"Media cache write of {len(pending)} records failed: {e}")
+
+    def _prune(self):
+        self._writes_since_prune = 0
+        with self._db:
+            self._db.execute("DELETE FROM file_ids WHERE cached_at <= ?", (time.time() - self._file_id_max_age,))
+            self._db.execute(
+                "DELETE FROM file_ids WHERE media_key NOT IN "
+                "(SELECT media_key FROM file_ids ORDER BY cached_at DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
@@ -0,0 +1,180 @@
+"""
+SERVICES: MEDIA STORE
+The 'Fat Reserves'. (Anatomy: Digestive System)
+Content-addressed files on disk for media that had to be downloaded for a
+re-upload. A photo/document is fetched from Telegram once and then reused by
+every pair and every later scheduled send. Bounded by total bytes, evicting
+the least recently used file first.
+
+File name: <media key>.<sha256 of the content>, e.g. doc_5012345678.9f86d081884c7d65...
+The directory is the index: it is scanned lazily, mtime keeps the LRU order across restarts.
+"""
+import logging
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK = 1024 * 1024
+
+
+class MediaStore:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        # media key -> (file name, size); least recently used first
+        self._files = OrderedDict()
+        self._bytes = 0
+        # stem -> number of transfers using its file right now; pinned files are never evicted
+        self._pins = {}
+        # stem -> replaced file names still in use by a pinned transfer, removed on the last unpin
+        self._superseded = {}
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _stem(key: str) -> str:
+        return key.replace(":", "_").replace(os.sep, "_")
+
+    def _ensure_loaded(self):
+        """Rule 1: Scanned on first use; leftovers of interrupted downloads are removed."""
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.root, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.root):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".part"):
+                os.remove(entry.path)
+                continue
+            stem, _, digest = entry.name.rpartition(".")
+            if not stem or len(digest) != 64:
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stem, entry.name, stat.st_size))
+        key_of = {}
+        for _, stem, name, size in sorted(entries):
+            if stem in key_of:
+                # An older content version of the same media: only the newest is kept
+                os.remove(os.path.join(self.root, key_of[stem][0]))
+            key_of[stem] = (name, size)
+        for stem, (name, size) in key_of.items():
+            self._files[stem] = (name, size)
+            self._bytes += size
+        logger.info(f"Media store: {len(self._files)} files, {self._bytes / 1048576:.1f} MB.")
+        self._evict()
+
+    def get(self, key: str) -> str | None:
+        """Path of the stored content for a media key, or None (go to the network)."""
+        if not key:
+            return None
+        self._ensure_loaded()
+        stem = self._stem(key)
+        entry = self._files.get(stem)
+        if entry is None:
+            self.misses += 1
+            return None
+        path = os.path.join(self.root, entry[0])
+        if not os.path.exists(path):
+            self._drop(stem)
+            self.misses += 1
+            return None
+        self._files.move_to_end(stem)
+        os.utime(path)
+        self.hits += 1
+        return path
+
+    def staging_path(self, key: str) -> str:
+        """Where a download for key should land before put(); same filesystem, so put() is a rename."""
+        self._ensure_loaded()
+        return os.path.join(self.root, f"{self._stem(key)}.{time.monotonic_ns()}.part")
+
+    def put(self, key: str, staged_path: str) -> str:
+        """Moves a finished download into the store under its content hash and returns the final path."""
+        self._ensure_loaded()
+        digest = hashlib.sha256()
+        with open(staged_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                digest.update(chunk)
+        stem = self._stem(key)
+        name = f"{stem}.{digest.hexdigest()}"
+        path = os.path.join(self.root, name)
+        if stem in self._files and self._files[stem][0] != name:
+            # Same Telegram id, different bytes (edited media): the new content replaces the old
+            if stem in self._pins:
+                old_name, old_size = self._files.pop(stem)
+                self._bytes -= old_size
+                self._superseded.setdefault(stem, []).append(old_name)
+            else:
+                self._drop(stem)
+        if stem in self._files:
+            self._bytes -= self._files.pop(stem)[1]
+        os.replace(staged_path, path)
+        size = os.path.getsize(path)
+        self._files[stem] = (name, size)
+        self._bytes += size
+        self._evict(keep=stem)
+        return path
+
+    def pin(self, key: str):
+        """Keeps a key's file on disk while a transfer reads it; pair every pin with unpin."""
+        stem = self._stem(key)
+        self._pins[stem] = self._pins.get(stem, 0) + 1
+
+    def unpin(self, key: str):
+        stem = self._stem(key)
+        left = self._pins.get(stem, 0) - 1
+        if left > 0:
+            self._pins[stem] = left
+            return
+        self._pins.pop(stem, None)
+        for name in self._superseded.pop(stem, ()):
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+        # Whatever the pin held over budget goes now
+        if self._loaded:
+            self._evict()
+
+    def discard_staged(self, staged_path: str):
+        try:
+            os.remove(staged_path)
+        except FileNotFoundError:
+            pass
+
+    def _drop(self, stem: str):
+        name, size = self._files.pop(stem)
+        self._bytes -= size
+        try:
+            os.remove(os.path.join(self.root, name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep: str | None = None):
+        """
+        Oldest first until the byte budget holds. The file just stored and files pinned by a
+        transfer always survive; the budget may be exceeded until they are released.
+        """
+        for stem in list(self._files):
+            if self._bytes <= self.max_bytes:
+                break
+            if stem == keep or stem in self._pins:
+                continue
+            self._drop(stem)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._files),
+            "mb": round(self._bytes / 1048576, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,167 @@
+"""
+SERVICES: OUTBOX
+The 'Stomach'. (Anatomy: Digestive System)
+Holds every scheduled send in the Vault until it is delivered, so a deploy or
+crash never drops a queued post. Enqueues, acks and retries are buffered and
+written in batches; readers page through one pair at a time, oldest first,
+so memory stays flat no matter how much is queued.
+"""
+import logging
+import asyncio
+import json
+from data.repository import OutboxRepository
+
+logger = logging.getLogger(__name__)
+
+
+class Outbox:
+    def __init__(self, session_factory, batch_size: int = 100, flush_ms: int = 1000, max_buffered: int = 5000):
+        self._session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.max_buffered = max_buffered
+        self.rejected = 0
+        self._inserts = []
+        self._acks = set()
+        self._retries = {}
+        self._timer = None
+        self._tasks = set()
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def encode(pair_id: int, user_id: int, destination, messages, forward: dict = None) -> dict:
+        """Compact row for a cleaned batch: ids stand in for the media, texts carry the cleaning."""
+        return {
+            "pair_id": pair_id,
+            "user_id": user_id,
+            "destination_id": str(destination),
+            "source_id": str(messages[0].chat_id),
+            "msg_ids": ",".join(str(m.id) for m in messages),
+            "texts": json.dumps([m.message or "" for m in messages], ensure_ascii=False),
+            "copy_mode": forward is not None,
+            "drop_captions": bool(forward and forward["drop_captions"]),
+        }
+
+    @staticmethod
+    def decode(row) -> dict:
+        return {
+            "id": row.id,
+            "pair_id": row.pair_id,
+            "user_id": row.user_id,
+            "destination": row.destination_id,
+            "source_id": row.source_id,
+            "msg_ids": [int(i) for i in row.msg_ids.split(",") if i],
+            "texts": json.loads(row.texts),
+            "copy_mode": row.copy_mode,
+            "drop_captions": row.drop_captions,
+            "attempts": row.attempts,
+        }
+
+    # --- Buffered writes ---
+
+    def put(self, item: dict) -> bool:
+        """
+        Rule 14: Only unsaved enqueues live in memory. If the Vault keeps refusing
+        writes and max_buffered of them pile up, new posts are rejected (and counted).
+        """
+        if len(self._inserts) >= self.max_buffered:
+            self.rejected += 1
+            return False
+        self._inserts.append(item)
+        self._arm()
+        return True
+
+    def ack(self, item_id: int):
+        self._retries.pop(item_id, None)
+        self._acks.add(item_id)
+        self._arm()
+
+    def retry(self, item_id: int, attempts: int):
+        self._retries[item_id] = attempts
+        self._arm()
+
+    def _pending_writes(self) -> int:
+        return len(self._inserts) + len(self._acks) + len(self._retries)
+
+    def _arm(self):
+        """Rule 14: A full batch is written at once, anything smaller after flush_ms."""
+        if self._pending_writes() >= self.batch_size:
+            self._spawn_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_ms / 1000, self._spawn_flush)
+
+    def _spawn_flush(self):
+        task = asyncio.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self) -> bool:
+        """Writes everything buffered. False when the Vault refused it (it stays buffered for the next try)."""
+        async with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending_writes():
+                return True
+            inserts, self._inserts = self._inserts, []
+            acks, self._acks = self._acks, set()
+            retries, self._retries = self._retries, {}
+            try:
+                async with self._session_factory() as db_session:
+                    await OutboxRepository(db_session).save_batch(inserts, acks, retries)
+            except Exception as e:
+                logger.error(f"Outbox write of {len(inserts)} enqueues / {len(acks)} acks failed: {e}")
+                # Put the batch back in front of anything buffered meanwhile
+                self._inserts[:0] = inserts
+                self._acks |= acks
+                for item_id, attempts in retries.items():
+                    self._retries.setdefault(item_id, attempts)
+                return False
+            return True
+
+    # --- Reads ---
+
+    async def read(self, pair_id: int, limit: int = None) -> list | None:
+        """
+        Oldest queued sends of a pair. Pending writes land first, so acks are never re-read.
+        None when they could not be written: the rows of posts already sent are still in
+        the Vault, and handing them out again would post them twice.
+        """
+        if not await self.flush():
+            return None
+        async with self._session_factory() as db_session:
+            rows = await OutboxRepository(db_session).fetch(pair_id, limit or self.batch_size)
+        # Acks buffered since the flush (another pair's drain) are skipped too
+        return [self.decode(r) for r in rows if r.id not in self._acks]
+
+    async def count(self, pair_id: int) -> int:
+        await self.flush()
+        async with self._session_factory() as db_session:
+            return await OutboxRepository(db_session).count(pair_id)
+
+    async def keep_latest(self, pair_id: int) -> int:
+        """Latest-wins: collapses the pair's queue to its newest post, in the Vault."""
+        await self.flush()
+        async with self._lock:
+            async with self._session_factory() as db_session:
+                return await OutboxRepository(db_session).keep_latest(pair_id)
+
+    async def discard(self, pair_id: int) -> int:
+        async with self._lock:
+            # Under the lock: a failed flush puts its batch back before we get here, never after
+            self._inserts = [i for i in self._inserts if i["pair_id"] != pair_id]
+            async with self._session_factory() as db_session:
+                return await OutboxRepository(db_session).delete_pair(pair_id)
+
+    async def pending_pairs(self) -> set:
+        await self.flush()
+        async with self._session_factory() as db_session:
+            return await OutboxRepository(db_session).pending_pairs()
+
+    def stats(self) -> dict:
+        return {"buffered": len(self._inserts), "rejected": self.rejected}
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
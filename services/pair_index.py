@@ -0,0 +1,123 @@
+"""
+SERVICES: PAIR INDEX
+The 'Reflexes'. (Anatomy: Nervous System)
+In-memory routing table of active repost pairs, keyed by normalized source chat id.
+Lets the engine drop messages from non-source chats without touching the Vault.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_chat_id(raw) -> str:
+    """Rule 4: Same '-100' normalization the engine always used for matching."""
+    cid = str(raw)
+    return cid if cid.startswith("-100") else f"-100{cid}"
+
+
+def _as_int(cid: str) -> int | None:
+    try:
+        return int(cid)
+    except ValueError:
+        return None
+
+
+def event_chat_ids(src: str) -> set:
+    """
+    Every event.chat_id that normalizes to this route key: the key itself (channels,
+    "-100123") and what was prefixed (basic groups "-100-123" <- -123, users and bots
+    "-100555" <- 555). Matching the normalized key both ways, exactly as match() does.
+    """
+    ids = {_as_int(src), _as_int(src[4:]) if src.startswith("-100") else None}
+    ids.discard(None)
+    return ids
+
+
+class PairIndex:
+    def __init__(self):
+        # user_id -> normalized source id -> pair_id -> pair
+        self._routes = {}
+        # pair_id -> (user_id, normalized source id)
+        self._owners = {}
+
+    @staticmethod
+    def is_routable(pair) -> bool:
+        return bool(pair.is_active) and pair.status != "error"
+
+    def load(self, pairs):
+        """Rebuilds the whole index from a list of pair records."""
+        self._routes.clear()
+        self._owners.clear()
+        for p in pairs:
+            self.add(p)
+        logger.info(f"Pair index built: {len(self._owners)} active pairs for {len(self._routes)} users.")
+
+    def add(self, pair):
+        """Adds or refreshes a pair. Inactive or errored pairs are removed instead."""
+        self.remove(pair.id)
+        if not self.is_routable(pair):
+            return
+        src = normalize_chat_id(pair.source_id)
+        self._routes.setdefault(pair.user_id, {}).setdefault(src, {})[pair.id] = pair
+        self._owners[pair.id] = (pair.user_id, src)
+
+    def remove(self, pair_id: int):
+        owner = self._owners.pop(pair_id, None)
+        if not owner:
+            return
+        user_id, src = owner
+        sources = self._routes.get(user_id)
+        if not sources:
+            return
+        bucket = sources.get(src)
+        if bucket is not None:
+            bucket.pop(pair_id, None)
+            if not bucket:
+                del sources[src]
+        if not sources:
+            del self._routes[user_id]
+
+    def remove_user(self, user_id: int):
+        sources = self._routes.pop(user_id, {})
+        for bucket in sources.values():
+            for pair_id in bucket:
+                self._owners.pop(pair_id, None)
+
+    def get(self, pair_id: int):
+        owner = self._owners.get(pair_id)
+        if not owner:
+            return None
+        user_id, src = owner
+        return self._routes[user_id][src][pair_id]
+
+    def match(self, user_id: int, chat_id) -> list:
+        """Returns the active pairs of a user whose source is this chat, ordered by pair id."""
+        sources = self._routes.get(user_id)
+        if not sources:
+            return []
+        bucket = sources.get(normalize_chat_id(chat_id))
+        if not bucket:
+            return []
+        return [bucket[pid] for pid in sorted(bucket)]
+
+    def sources(self, user_id: int) -> set:
+        return set(self._routes.get(user_id, ()))
+
+    def chat_ids(self, user_id: int) -> set:
+        """One numeric id per source, as the pairs store it: what catch-up fetches from."""
+        ids = set()
+        for bucket in self._routes.get(user_id, {}).values():
+            chat_id = _as_int(str(next(iter(bucket.values())).source_id))
+            if chat_id is not None:
+                ids.add(chat_id)
+        return ids
+
+    def event_chat_ids(self, user_id: int) -> set:
+        """The live listener filter: every event.chat_id that routes to one of the user's sources."""
+        return {cid for src in self._routes.get(user_id, ()) for cid in event_chat_ids(src)}
+
+    def pair_ids(self, user_id: int) -> set:
+        return {pid for bucket in self._routes.get(user_id, {}).values() for pid in bucket}
+
+    def has_pairs(self, user_id: int) -> bool:
+        return user_id in self._routes
@@ -0,0 +1,104 @@
+"""
+SERVICES: PAIR STATE
+The 'Pulse'. (Anatomy: Circulatory System)
+In-memory error counters and last-repost timestamps of every pair. The engine
+reads and updates them without touching the Vault; changes are written behind
+in one batched UPDATE every flush interval and on shutdown.
+"""
+import logging
+import asyncio
+from datetime import datetime
+from data.repository import UserRepository
+
+logger = logging.getLogger(__name__)
+
+
+class PairStateCache:
+    def __init__(self, session_factory, flush_seconds: float = 5.0):
+        self._session_factory = session_factory
+        self.flush_seconds = flush_seconds
+        # pair_id -> {"error_count": int, "last_reposted_at": datetime | None}
+        self._state = {}
+        self._dirty = {}
+        # Deleted pairs: a send still in flight when its pair went must not mark it dirty again
+        self._deleted = set()
+        self._timer = None
+        self._tasks = set()
+        self._lock = asyncio.Lock()
+
+    def _entry(self, pair_id: int, error_count: int = 0) -> dict:
+        entry = self._state.get(pair_id)
+        if entry is None:
+            entry = self._state[pair_id] = {"error_count": error_count or 0, "last_reposted_at": None}
+        return entry
+
+    def error_count(self, pair_id: int) -> int:
+        entry = self._state.get(pair_id)
+        return entry["error_count"] if entry else 0
+
+    def record_success(self, pair_id: int):
+        if pair_id in self._deleted:
+            return
+        entry = self._entry(pair_id)
+        entry["error_count"] = 0
+        entry["last_reposted_at"] = datetime.utcnow()
+        self._mark(pair_id, error_count=0, last_reposted_at=entry["last_reposted_at"])
+
+    def record_error(self, pair_id: int, known_count: int = 0) -> int:
+        """Returns the new consecutive error count. known_count seeds a pair seen for the first time."""
+        if pair_id in self._deleted:
+            return 0
+        entry = self._entry(pair_id, known_count)
+        entry["error_count"] += 1
+        self._mark(pair_id, error_count=entry["error_count"])
+        return entry["error_count"]
+
+    def reset(self, pair_id: int):
+        """The Vault already holds a zero (re-activation); keep memory in step."""
+        self._entry(pair_id)["error_count"] = 0
+        dirty = self._dirty.get(pair_id)
+        if dirty and "error_count" in dirty:
+            dirty["error_count"] = 0
+
+    def forget(self, pair_id: int, deleted: bool = False):
+        """deleted: the pair is gone for good (not just handed to another shard); ids are never reused."""
+        self._state.pop(pair_id, None)
+        self._dirty.pop(pair_id, None)
+        if deleted:
+            self._deleted.add(pair_id)
+
+    def _mark(self, pair_id: int, **changes):
+        self._dirty.setdefault(pair_id, {}).update(changes)
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_seconds, self._spawn_flush)
+
+    def _spawn_flush(self):
+        task = asyncio.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        """Rule 14: One write transaction for every pair that changed since the last flush."""
+        async with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            rows = [{"id": pair_id, **changes} for pair_id, changes in dirty.items()]
+            try:
+                async with self._session_factory() as db_session:
+                    await UserRepository(db_session).save_pair_states(rows)
+            except Exception as e:
+                logger.error(f"Failed to write state of {len(rows)} pairs: {e}")
+                # Newer changes made during the failed write win; deleted pairs are not re-queued
+                for pair_id, changes in dirty.items():
+                    if pair_id in self._deleted:
+                        continue
+                    self._dirty[pair_id] = {**changes, **self._dirty.get(pair_id, {})}
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
@@ -0,0 +1,317 @@
+"""
+SERVICES: REPOST PIPELINE
+The 'Digestive Tract'. (Anatomy: Nervous System)
+Staged flow between the Eyes and the send path: ingest -> route/clean -> send.
+Bounded queues between stages give backpressure; worker pools cap in-flight work.
+"""
+import logging
+import asyncio
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_POLICIES = ("block", "drop_oldest", "coalesce")
+# Jobs sharing a batch_key are folded together up to this many message ids
+BATCH_LIMIT = 100
+
+
+class StageTimer:
+    """Running count / average / max of seconds spent in one stage."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def snapshot(self) -> dict:
+        avg = self.total / self.count if self.count else 0.0
+        return {"count": self.count, "avg_ms": round(avg * 1000, 2), "max_ms": round(self.max * 1000, 2)}
+
+
+class SendLanes:
+    """
+    One bounded FIFO lane per pair, served round-robin.
+    A pair is never handed to two workers at once, so per-destination order holds.
+    When a lane is full the pair's overload policy decides:
+      block       -> the job is held for the pair until its lane has room; the router
+                     moves on, and only the owning account's intake waits (wait_for_room)
+      drop_oldest -> the oldest queued job of that pair is discarded
+      coalesce    -> a forward of the same source is merged into the newest queued job;
+                     anything that cannot be merged replaces it (latest wins)
+    """
+    def __init__(self, lane_size: int):
+        self.lane_size = lane_size
+        self._lanes = {}
+        # pair_id -> jobs waiting for room in the pair's full lane (block policy)
+        self._held = {}
+        # user_id -> number of that account's held jobs
+        self._held_by_user = {}
+        self._ready = deque()
+        self._ready_set = set()
+        self._busy = set()
+        self._lock = asyncio.Lock()
+        self._not_empty = asyncio.Condition(self._lock)
+        self._not_full = asyncio.Condition(self._lock)
+        self.dropped = 0
+        self.coalesced = 0
+        self.held = 0
+
+    def _mark_ready(self, pair_id: int):
+        if pair_id not in self._busy and pair_id not in self._ready_set and self._lanes.get(pair_id):
+            self._ready.append(pair_id)
+            self._ready_set.add(pair_id)
+
+    def _hold(self, pair_id: int, job: dict):
+        self._held.setdefault(pair_id, deque()).append(job)
+        user_id = job.get("user_id")
+        self._held_by_user[user_id] = self._held_by_user.get(user_id, 0) + 1
+        self.held += 1
+
+    def _release_held(self, jobs):
+        for job in jobs:
+            user_id = job.get("user_id")
+            left = self._held_by_user.get(user_id, 0) - 1
+            if left > 0:
+                self._held_by_user[user_id] = left
+            else:
+                self._held_by_user.pop(user_id, None)
+
+    def _refill(self, pair_id: int):
+        """Moves held jobs into the pair's lane as far as it has room, oldest first."""
+        held = self._held.get(pair_id)
+        if not held:
+            return
+        lane = self._lanes.setdefault(pair_id, deque())
+        moved = []
+        while held and len(lane) < self.lane_size:
+            moved.append(held.popleft())
+            lane.append(moved[-1])
+        if not held:
+            del self._held[pair_id]
+        if moved:
+            self._release_held(moved)
+            self._mark_ready(pair_id)
+            self._not_empty.notify()
+
+    async def put(self, pair_id: int, job: dict, policy: str = "block"):
+        async with self._lock:
+            # Never waits here: a route worker is shared by every user and pair
+            if pair_id in self._held:
+                self._hold(pair_id, job)
+                return
+            lane = self._lanes.setdefault(pair_id, deque())
+            if len(lane) >= self.lane_size:
+                if policy == "drop_oldest":
+                    lane.popleft()
+                    self.dropped += 1
+                elif policy == "coalesce":
+                    newest = lane[-1]
+                    if (job.get("batch_key") is not None and newest.get("batch_key") == job["batch_key"]
+                            and len(newest["msg_ids"]) + len(job["msg_ids"]) <= BATCH_LIMIT):
+                        newest["msg_ids"].extend(job["msg_ids"])
+                        newest["messages"].extend(job["messages"])
+                    else:
+                        lane[-1] = job
+                    self.coalesced += 1
+                    return
+                else:
+                    self._hold(pair_id, job)
+                    return
+            lane.append(job)
+            self._mark_ready(pair_id)
+            self._not_empty.notify()
+
+    async def wait_for_room(self, user_id: int):
+        """
+        Backpressure of the block policy, scoped to one account: its intake waits while
+        its held jobs add up to a full lane. Routing and every other account keep going.
+        """
+        if self._held_by_user.get(user_id, 0) < self.lane_size:
+            return
+        async with self._lock:
+            await self._not_full.wait_for(lambda: self._held_by_user.get(user_id, 0) < self.lane_size)
+
+    async def get(self) -> dict:
+        async with self._lock:
+            await self._not_empty.wait_for(lambda: self._ready)
+            pair_id = self._ready.popleft()
+            self._ready_set.discard(pair_id)
+            lane = self._lanes[pair_id]
+            job = lane.popleft()
+            self._busy.add(pair_id)
+            self._refill(pair_id)
+            if not lane:
+                del self._lanes[pair_id]
+            self._not_full.notify_all()
+            return job
+
+    async def done(self, pair_id: int):
+        async with self._lock:
+            self._busy.discard(pair_id)
+            self._mark_ready(pair_id)
+            if pair_id in self._ready_set:
+                self._not_empty.notify()
+
+    async def absorb(self, job: dict, limit: int) -> dict:
+        """
+        Folds the queued jobs at the head of the lane that share job's batch_key
+        into job (burst batching). Only the worker holding the pair calls this.
+        """
+        pair_id = job["pair_id"]
+        async with self._lock:
+            lane = self._lanes.get(pair_id)
+            while lane and lane[0].get("batch_key") == job["batch_key"] \
+                    and len(job["msg_ids"]) + len(lane[0]["msg_ids"]) <= limit:
+                nxt = lane.popleft()
+                job["msg_ids"].extend(nxt["msg_ids"])
+                job["messages"].extend(nxt["messages"])
+            if lane is not None:
+                self._refill(pair_id)
+            if lane is not None and not lane:
+                del self._lanes[pair_id]
+            self._not_full.notify_all()
+        return job
+
+    async def discard(self, pair_id: int):
+        """Drops everything still queued for a pair (deleted/paused pairs)."""
+        async with self._lock:
+            self._lanes.pop(pair_id, None)
+            self._release_held(self._held.pop(pair_id, ()))
+            if pair_id in self._ready_set:
+                self._ready_set.discard(pair_id)
+                self._ready.remove(pair_id)
+            self._not_full.notify_all()
+
+    def depths(self) -> dict:
+        """Queued jobs per pair, held ones included."""
+        depths = {pid: len(lane) for pid, lane in self._lanes.items() if lane}
+        for pid, held in self._held.items():
+            depths[pid] = depths.get(pid, 0) + len(held)
+        return depths
+
+    def is_busy(self, pair_id: int) -> bool:
+        return pair_id in self._busy
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._busy)
+
+
+class RepostPipeline:
+    def __init__(self, route_handler, send_handler, route_workers: int = 2, send_workers: int = 8,
+                 ingest_size: int = 1000, lane_size: int = 50):
+        self._route_handler = route_handler
+        self._send_handler = send_handler
+        self._route_workers = route_workers
+        self._send_workers = send_workers
+        self._ingest_size = ingest_size
+        self._ingest = None
+        self.lanes = SendLanes(lane_size)
+        self._workers = []
+        self._routing = 0
+        self._timers = {
+            "ingest_wait": StageTimer(),
+            "route": StageTimer(),
+            "send_wait": StageTimer(),
+            "send": StageTimer(),
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self):
+        """Rule 1: Idempotent. Needs a running loop, so it is called from async paths."""
+        if self._workers:
+            return
+        self._ingest = asyncio.Queue(maxsize=self._ingest_size)
+        for i in range(self._route_workers):
+            self._workers.append(asyncio.create_task(self._route_loop(), name=f"route_{i}"))
+        for i in range(self._send_workers):
+            self._workers.append(asyncio.create_task(self._send_loop(), name=f"send_{i}"))
+        logger.info(f"Pipeline started: {self._route_workers} route / {self._send_workers} send workers.")
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def submit(self, user_id: int, messages: list):
+        """
+        Ingest stage. Blocks the caller (the Telethon handler) when the queue is full, or
+        while this account's block-policy pairs hold a full lane's worth of jobs.
+        """
+        self.start()
+        await self.lanes.wait_for_room(user_id)
+        await self._ingest.put((user_id, messages, time.monotonic()))
+
+    async def dispatch(self, pair_id: int, job: dict, policy: str = "block"):
+        """Hands a cleaned job to the send stage under the pair's overload policy."""
+        job["queued_at"] = time.monotonic()
+        await self.lanes.put(pair_id, job, policy if policy in OVERLOAD_POLICIES else "block")
+
+    async def discard(self, pair_id: int):
+        await self.lanes.discard(pair_id)
+
+    def idle(self) -> bool:
+        """Nothing waiting for ingest, routing, queued in a lane or sending."""
+        return not (self._routing or (self._ingest and self._ingest.qsize())
+                    or self.lanes.depths() or self.lanes.in_flight)
+
+    def holds(self, pair_ids) -> bool:
+        """True while work for these pairs may still be queued or sending. Ingest is not per pair, so any backlog counts."""
+        if self._routing or (self._ingest and self._ingest.qsize()):
+            return True
+        depths = self.lanes.depths()
+        return any(depths.get(pid) or self.lanes.is_busy(pid) for pid in pair_ids)
+
+    async def _route_loop(self):
+        while True:
+            user_id, messages, queued_at = await self._ingest.get()
+            started = time.monotonic()
+            self._timers["ingest_wait"].record(started - queued_at)
+            self._routing += 1
+            try:
+                await self._route_handler(user_id, messages)
+            except Exception as e:
+                logger.error(f"Route stage failed for User {user_id}: {e}")
+            finally:
+                self._routing -= 1
+                self._timers["route"].record(time.monotonic() - started)
+                self._ingest.task_done()
+
+    async def _send_loop(self):
+        while True:
+            job = await self.lanes.get()
+            started = time.monotonic()
+            self._timers["send_wait"].record(started - job["queued_at"])
+            if job.get("batch_key") is not None:
+                await self.lanes.absorb(job, BATCH_LIMIT)
+            try:
+                await self._send_handler(job)
+            except Exception as e:
+                logger.error(f"Send stage failed for Pair #{job['pair_id']}: {e}")
+            finally:
+                self._timers["send"].record(time.monotonic() - started)
+                await self.lanes.done(job["pair_id"])
+
+    def stats(self) -> dict:
+        lanes = self.lanes.depths()
+        return {
+            "ingest_depth": self._ingest.qsize() if self._ingest else 0,
+            "ingest_capacity": self._ingest_size,
+            "send_depth": sum(lanes.values()),
+            "lanes": lanes,
+            "in_flight": self.lanes.in_flight,
+            "dropped": self.lanes.dropped,
+            "coalesced": self.lanes.coalesced,
+            "held": self.lanes.held,
+            "stages": {name: t.snapshot() for name, t in self._timers.items()},
+        }
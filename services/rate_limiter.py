@@ -0,0 +1,118 @@
+"""
+SERVICES: RATE LIMITER
+The 'Breath Control'. (Anatomy: Respiratory System)
+Paces every send of a Telethon account before it reaches Telegram: one token
+bucket per account and one per destination chat, shared by all pairs. Rates are
+learned from FloodWaitError: a flood pauses the chat and halves its rate, steady
+success creeps the rate back up to the configured ceiling.
+"""
+import logging
+import asyncio
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Reservation-style bucket: tokens may go negative, the debt is the wait."""
+    def __init__(self, rate: float, burst: float, min_rate: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is free, without taking it."""
+        self._refill(now)
+        debt = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(debt, self.paused_until - now)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def penalize(self, now: float, seconds: float, pause: bool):
+        """Multiplicative decrease on a flood; optionally hold everything for its duration."""
+        self._refill(now)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+        if pause:
+            self.paused_until = max(self.paused_until, now + seconds)
+
+    def reward(self, step: float):
+        """Additive increase after a clean send."""
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + step)
+
+
+class FloodAwareLimiter:
+    def __init__(self, account_rate: float = 1.0, account_burst: int = 5,
+                 chat_rate: float = 0.33, chat_burst: int = 3,
+                 min_rate: float = 0.02, recovery: float = 0.05):
+        self.account_rate = account_rate
+        self.account_burst = account_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.min_rate = min_rate
+        # Fraction of the ceiling regained per successful send
+        self.recovery = recovery
+        self._accounts = {}
+        self._chats = {}
+        self.floods = 0
+        self.waited_s = 0.0
+
+    def _buckets(self, user_id: int, chat) -> tuple:
+        account = self._accounts.get(user_id)
+        if account is None:
+            account = self._accounts[user_id] = TokenBucket(self.account_rate, self.account_burst, self.min_rate)
+        key = (user_id, str(chat))
+        bucket = self._chats.get(key)
+        if bucket is None:
+            bucket = self._chats[key] = TokenBucket(self.chat_rate, self.chat_burst, self.min_rate)
+        return account, bucket
+
+    async def acquire(self, user_id: int, chat, max_wait: float = None) -> float:
+        """
+        Waits until both buckets have a token, then takes one from each and returns 0.
+        If that would take longer than max_wait, takes nothing and returns the wait instead.
+        """
+        account, bucket = self._buckets(user_id, chat)
+        while True:
+            now = time.monotonic()
+            wait = max(account.wait_time(now), bucket.wait_time(now))
+            if wait <= 0:
+                account.take(now)
+                bucket.take(now)
+                return 0.0
+            if max_wait is not None and wait > max_wait:
+                return wait
+            # Re-check after sleeping: other senders may have taken the token meanwhile
+            self.waited_s += wait
+            await asyncio.sleep(wait)
+
+    def on_flood(self, user_id: int, chat, seconds: float):
+        """Telegram told us exactly how long to back off; the chat pauses, the account slows down."""
+        self.floods += 1
+        account, bucket = self._buckets(user_id, chat)
+        now = time.monotonic()
+        bucket.penalize(now, seconds, pause=True)
+        account.penalize(now, seconds, pause=False)
+        logger.warning(
+            f"FloodWait {seconds}s for User {user_id} -> {chat}; "
+            f"now {bucket.rate * 60:.1f}/min to chat, {account.rate * 60:.1f}/min per account."
+        )
+
+    def on_success(self, user_id: int, chat):
+        account, bucket = self._buckets(user_id, chat)
+        account.reward(account.max_rate * self.recovery)
+        bucket.reward(bucket.max_rate * self.recovery)
+
+    def stats(self) -> dict:
+        return {"floods": self.floods, "waited_s": round(self.waited_s, 1)}
@@ -1,44 +1,134 @@
 """
 SERVICES: REPOST ENGINE
 The 'Nervous System' of the bot.
-Bridges the Vault (Database), the Brain (MessageCleaner), and the Eyes (Telethon).
+Bridges the Vault (Database), the Brain (text pipeline), and the Eyes (Telethon).
 """
 import logging
 import os
 import asyncio
+import copy
+import math
 import time
-import hashlib
-from collections import defaultdict
+import zlib
 from providers.telethon_client import TelethonProvider
 from data.database import async_session
-from data.repository import UserRepository
-from core.repost.logic import MessageCleaner
+from data.repository import UserRepository, ScheduleRepository
+from core.repost.text_pipeline import pipeline_for
 from services.media_cache import MediaCache
+from services.media_store import MediaStore
+from services.pair_index import PairIndex
+from services.pipeline import RepostPipeline
+from services.album_assembler import AlbumAssembler
+from services.dedup_store import DedupStore
+from services.backfill import BackfillCursor, message_refs
+from services.last_seen import LastSeenLog
+from services.shard_map import instance_path
+from services.scheduler import Scheduler
+from services.outbox import Outbox
+from services.rate_limiter import FloodAwareLimiter
+from services.pair_state import PairStateCache
+from services.listener_supervisor import ListenerSupervisor
 from config import config
 
 logger = logging.getLogger(__name__)
 
 MAX_ERRORS_BEFORE_DISABLE = 5
 FLOOD_WAIT_MAX_RETRY = 3
+FLOOD_WAIT_MAX_SECONDS = 300
 DEDUP_CACHE_SIZE = 500
+FANOUT_CONCURRENCY = 5
+BACKFILL_PREFETCH = 100
+BACKFILL_START_DELAY = 5
 
 
 class RepostService:
-    def __init__(self):
+    def __init__(self, owns=None, instance: str = ""):
+        # Rule 1: A shard worker serves only the users owns(user_id) accepts (see services/shard_map.py)
+        self.owns = owns or (lambda user_id: True)
+        # Rule 14: Downloaded media is kept once on disk and shared by every pair
+        self.media_store = None
+        if config.MEDIA_STORE_DIR:
+            self.media_store = MediaStore(
+                instance_path(config.MEDIA_STORE_DIR, instance), config.MEDIA_STORE_MAX_MB * 1024 * 1024
+            )
         self.telethon = TelethonProvider(
             config.API_ID,
-            config.API_HASH
+            config.API_HASH,
+            transfer_part_kb=config.TRANSFER_PART_KB,
+            transfer_workers=config.TRANSFER_WORKERS,
+            transfer_dir=config.TRANSFER_TMP_DIR or None,
+            media_store=self.media_store,
+            client_idle_ttl=config.CLIENT_IDLE_TTL,
+            session_store_path=instance_path(config.SESSION_STORE_PATH, instance) or None,
+            session_flush_seconds=config.SESSION_FLUSH_SECONDS,
+        )
+        # Rule 14: Error counters and timestamps are written behind in batches
+        self.pair_state = PairStateCache(async_session, flush_seconds=config.PAIR_STATE_FLUSH_SECONDS)
+        # Rule 1: Scheduled sends wait in the Vault, not in process memory
+        self.outbox = Outbox(
+            async_session, batch_size=config.OUTBOX_BATCH_SIZE,
+            flush_ms=config.OUTBOX_FLUSH_MS, max_buffered=config.OUTBOX_MAX_BUFFERED
+        )
+        # Rule 14: One heap-driven timer for every schedule flush and backfill step
+        self.scheduler = Scheduler(
+            self._run_scheduled_job,
+            load=self._load_schedule, save=self._save_schedule
+        )
+        self.backfill_cursors = {}
+        # pair_id -> seconds between ticks for the current paced cycle
+        self._pace = {}
+        # Rule 14: Bounded LRU of file references in front of an on-disk index
+        self.media_cache = MediaCache(
+            path=instance_path(config.MEDIA_CACHE_PATH, instance) or None,
+            memory_entries=config.MEDIA_CACHE_MEMORY_ENTRIES,
+            max_entries=config.MEDIA_CACHE_MAX_ENTRIES,
+        )
+        # Rule 14: O(1) LRU dedup memory, persisted to an append-only log
+        self.dedup = DedupStore(capacity=DEDUP_CACHE_SIZE, path=instance_path(config.DEDUP_LOG_PATH, instance) or None)
+        # Rule 4: Source -> pair routing lives in memory, the Vault is the backup
+        self.pair_index = PairIndex()
+        # Rule 14: Bounded fan-out, one semaphore per Telethon account
+        self._send_slots = {}
+        # Rule 14: Pace sends per account and per destination before Telegram has to
+        self.limiter = FloodAwareLimiter(
+            account_rate=config.SEND_RATE_PER_ACCOUNT / 60,
+            account_burst=config.SEND_BURST_PER_ACCOUNT,
+            chat_rate=config.SEND_RATE_PER_CHAT / 60,
+            chat_burst=config.SEND_BURST_PER_CHAT,
+        )
+        # Rule 14: Bounded ingest -> route/clean -> send stages
+        self.pipeline = RepostPipeline(
+            self._execute_repost, self._deliver,
+            route_workers=config.ROUTE_WORKERS,
+            send_workers=config.SEND_WORKERS,
+            ingest_size=config.INGEST_QUEUE_SIZE,
+            lane_size=config.SEND_LANE_SIZE,
+        )
+        self.albums = AlbumAssembler(
+            self.pipeline.submit,
+            quiet_ms=config.ALBUM_QUIET_MS,
+            max_wait_ms=config.ALBUM_MAX_WAIT_MS,
+            max_buffered=config.ALBUM_MAX_BUFFERED,
         )
-        self.album_cache = {}
-        self.schedule_queue = {}
-        self.schedule_timers = {}
-        self.backfill_tasks = {}
-        self.media_cache = MediaCache()
-        self.file_id_cache = {}
-        self._dedup_seen = defaultdict(dict)
         self._bot = None
-        # Rule 1: Tracking state to prevent duplicate listeners
-        self._active_listeners = set()
+        # Rule 1: Listeners are supervised; a dropped or stalled connection is reopened and caught up,
+        # idle accounts may hibernate and are polled instead
+        self.supervisor = ListenerSupervisor(
+            self.telethon, self._catch_up, self.pair_index.has_pairs,
+            check_interval=config.LISTENER_CHECK_SECONDS,
+            stall_seconds=config.LISTENER_STALL_SECONDS,
+            backoff_max=config.LISTENER_BACKOFF_MAX_SECONDS,
+            hibernate_after=config.LISTENER_HIBERNATE_SECONDS,
+            poll_interval=config.LISTENER_POLL_SECONDS,
+        )
+        # (user_id, source chat id) -> newest message id seen; the catch-up anchor.
+        # Shards write it behind so a crashed shard's users can be caught up by the adopter
+        self._last_seen = LastSeenLog(
+            instance_path(config.LAST_SEEN_PATH, instance) if instance else None,
+            flush_seconds=config.LAST_SEEN_FLUSH_SECONDS,
+        )
+        self._background = set()
+        self.startup_report = None
 
     def set_bot(self, bot):
         self._bot = bot
@@ -88,41 +178,188 @@ class RepostService:
             for p in pairs:
                 self._cancel_schedule_timer(p.id)
                 self._cancel_backfill_task(p.id)
-                self.schedule_queue.pop(p.id, None)
-                self._dedup_seen.pop(p.id, None)
+                await self.outbox.discard(p.id)
+                self.dedup.forget_pair(p.id)
+                self.pair_state.forget(p.id, deleted=True)
+                await self.pipeline.discard(p.id)
+            self.pair_index.remove_user(user_id)
+            self._sync_chat_filter(user_id)
             return await repo.delete_all_user_pairs(user_id)
 
     async def delete_single_pair(self, user_id: int, pair_id: int) -> bool:
         self._cancel_schedule_timer(pair_id)
         self._cancel_backfill_task(pair_id)
-        self.schedule_queue.pop(pair_id, None)
-        self._dedup_seen.pop(pair_id, None)
+        await self.outbox.discard(pair_id)
+        self.dedup.forget_pair(pair_id)
+        self.pair_state.forget(pair_id, deleted=True)
         async with async_session() as db_session:
             repo = UserRepository(db_session)
-            return await repo.delete_pair_by_id(user_id, pair_id)
+            deleted = await repo.delete_pair_by_id(user_id, pair_id)
+        if deleted:
+            self.pair_index.remove(pair_id)
+            self._sync_chat_filter(user_id)
+            await self.pipeline.discard(pair_id)
+        return deleted
 
     async def deactivate_pair(self, user_id: int, pair_id: int) -> bool:
         self._cancel_schedule_timer(pair_id)
         self._cancel_backfill_task(pair_id)
-        self.schedule_queue.pop(pair_id, None)
+        await self.outbox.discard(pair_id)
+        async with async_session() as db_session:
+            repo = UserRepository(db_session)
+            paused = await repo.deactivate_pair(user_id, pair_id)
+        if paused:
+            self.pair_index.remove(pair_id)
+            self._sync_chat_filter(user_id)
+            await self.pipeline.discard(pair_id)
+        return paused
+
+    async def update_pair_settings(self, user_id: int, pair_id: int, **settings) -> bool:
+        """Changes per-pair delivery settings; the routed pair picks them up on its next message."""
         async with async_session() as db_session:
             repo = UserRepository(db_session)
-            return await repo.deactivate_pair(user_id, pair_id)
+            updated = await repo.update_pair_settings(user_id, pair_id, **settings)
+        if updated is None:
+            return False
+        live = self.pair_index.get(pair_id)
+        if live is not None:
+            for column, value in settings.items():
+                setattr(live, column, value)
+        if "schedule_mode" in settings or "max_per_tick" in settings:
+            # The pacing of the running cycle was computed for the old settings
+            self._pace.pop(pair_id, None)
+        return True
 
     async def activate_pair(self, user_id: int, pair_id: int) -> bool:
         async with async_session() as db_session:
             repo = UserRepository(db_session)
             success = await repo.activate_pair(user_id, pair_id)
             if success:
-                if user_id not in self._active_listeners:
+                self.pair_state.reset(pair_id)
+                pair = await repo.get_pair_by_id(pair_id)
+                if pair:
+                    self.pair_index.add(pair)
+                    self._remember_peers(pair)
+                    self._sync_chat_filter(user_id)
+                if not self.telethon.is_listening(user_id):
                     user = await repo.get_user(user_id)
                     session_path = self._get_session_path(user_id, user)
                     if session_path:
-                        await self.telethon.start_listener(user_id, session_path, self._handle_new_message)
-                        self._active_listeners.add(user_id)
+                        await self._ensure_listener(user_id, session_path)
+                else:
+                    self._spawn(self._seed_last_seen(user_id))
                 return True
         return False
 
+    async def _ensure_listener(self, user_id: int, session_path):
+        """Rule 1: Single entry point for opening the Eyes of a user."""
+        if self.telethon.is_listening(user_id):
+            self._spawn(self._seed_last_seen(user_id))
+            return
+        self.pipeline.start()
+        self.scheduler.start()
+        started = await self.telethon.start_listener(
+            user_id, session_path, self._handle_new_message,
+            chat_ids=self.pair_index.event_chat_ids(user_id),
+            on_disconnect=self.supervisor.wake,
+        )
+        if started:
+            self.supervisor.watch(user_id)
+            self._spawn(self._seed_last_seen(user_id))
+            # Pairs created before peers were stored get theirs once the account is connected
+            pairs = [self.pair_index.get(pid) for pid in self.pair_index.pair_ids(user_id)]
+            self._spawn(self._resolve_pair_peers(pairs))
+
+    def _remember_peers(self, pair):
+        self.telethon.remember_peer(pair.user_id, pair.source_id, pair.source_peer)
+        self.telethon.remember_peer(pair.user_id, pair.destination_id, pair.destination_peer)
+
+    async def _resolve_pair_peers(self, pairs):
+        """Resolves the source/destination peers a pair doesn't have yet and stores them in one batch."""
+        rows = []
+        for pair in pairs:
+            row = {}
+            for field, identifier in (("source_peer", pair.source_id), ("destination_peer", pair.destination_id)):
+                if getattr(pair, field):
+                    continue
+                encoded = await self.telethon.resolve_peer(pair.user_id, identifier)
+                if encoded:
+                    setattr(pair, field, encoded)
+                    row[field] = encoded
+            if row:
+                rows.append({"id": pair.id, **row})
+        if not rows:
+            return
+        try:
+            async with async_session() as db_session:
+                await UserRepository(db_session).save_pair_states(rows)
+        except Exception as e:
+            # The in-memory cache still holds them; the next connect retries the write
+            logger.error(f"Failed to store peers of {len(rows)} pairs: {e}")
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _seed_last_seen(self, user_id: int):
+        """Anchors catch-up for sources nothing has arrived from yet: their current newest id."""
+        for chat_id in self.pair_index.chat_ids(user_id):
+            if self._last_seen.get(user_id, chat_id) is None:
+                latest = await self.telethon.latest_message_id(user_id, chat_id)
+                if latest:
+                    self._last_seen.seed(user_id, chat_id, latest)
+
+    def _mark_seen(self, user_id: int, chat_id, msg_id: int):
+        self._last_seen.mark(user_id, chat_id, msg_id)
+
+    async def _catch_up(self, user_id: int) -> int:
+        """
+        After a reconnect or a hibernation poll: streams every source from its last seen id
+        in pages and feeds the pipeline in order. Dedup drops whatever the live listener
+        delivered meanwhile. Returns the number of messages queued.
+        """
+        total = 0
+        for chat_id in self.pair_index.chat_ids(user_id):
+            last = self._last_seen.get(user_id, chat_id)
+            if last is None:
+                continue
+            cursor = BackfillCursor(
+                self.telethon.iter_messages_from(user_id, chat_id, last + 1),
+                prefetch=BACKFILL_PREFETCH
+            )
+            try:
+                fetched = 0
+                while fetched < config.CATCHUP_LIMIT:
+                    group = await cursor.next_group()
+                    if not group:
+                        break
+                    fetched += len(group)
+                    self._mark_seen(user_id, chat_id, group[-1].id)
+                    group = [m for m in group if m.message or m.media]
+                    if group:
+                        await self.pipeline.submit(user_id, group)
+                        total += len(group)
+            finally:
+                cursor.close()
+        logger.info(f"Catch-up for User {user_id}: {total} missed messages queued.")
+        return total
+
+    def pipeline_stats(self) -> dict:
+        stats = self.pipeline.stats()
+        stats["limiter"] = self.limiter.stats()
+        stats["media_cache"] = self.media_cache.stats()
+        stats["outbox"] = self.outbox.stats()
+        stats["listeners"] = self.supervisor.stats()
+        stats["session_store"] = self.telethon.registry.stats().get("session_store")
+        stats["startup"] = self.startup_report
+        stats["media_store"] = self.media_store.stats() if self.media_store else None
+        return stats
+
+    def _sync_chat_filter(self, user_id: int):
+        """Pushes the user's current source ids into the listener's live chat filter."""
+        self.telethon.update_chat_filter(user_id, self.pair_index.event_chat_ids(user_id))
+
     async def resolve_channel_for_pair(self, user_id: int, identifier: str, kind: str, invite_hash: str = None) -> str:
         """Joins private channels and returns a normalized ID."""
         if kind == "invite" and invite_hash:
@@ -131,6 +368,8 @@ class RepostService:
                 resolved_id = str(result["id"])
                 if not resolved_id.startswith("-100"):
                     resolved_id = f"-100{resolved_id}"
+                # Cached now, so creating the pair stores it without another lookup
+                await self.telethon.resolve_peer(user_id, resolved_id)
                 return resolved_id
             return identifier
 
@@ -138,6 +377,9 @@ class RepostService:
         if kind in ("private_id", "numeric", "forwarded", "username"):
             entity = await self.telethon.resolve_entity(user_id, identifier)
             if entity:
+                # Cached under the id the pair will store, so creating it needs no lookup
+                encoded = await self.telethon.resolve_peer(user_id, identifier)
+                self.telethon.remember_peer(user_id, str(entity["id"]), encoded)
                 return str(entity["id"])
         
         return identifier
@@ -146,14 +388,22 @@ class RepostService:
         self, user_id: int, source: str, destination: str,
         filter_type: int = 1, replacement_link: str = None,
         schedule_interval: int = None, start_from_msg_id: int = None,
+        overload_policy: str = "block", album_window_ms: int = None,
+        copy_mode: bool = False, schedule_mode: str = "burst",
+        max_per_tick: int = None, queue_policy: str = "all",
     ):
         async with async_session() as db_session:
             repo = UserRepository(db_session)
             # Rule 11: Capture the new pair object to get its ID
             new_pair = await repo.add_repost_pair(
                 user_id, source, destination, filter_type,
-                replacement_link, schedule_interval, start_from_msg_id
+                replacement_link, schedule_interval, start_from_msg_id,
+                overload_policy, album_window_ms, copy_mode,
+                schedule_mode, max_per_tick, queue_policy
             )
+            self.pair_index.add(new_pair)
+            self._remember_peers(new_pair)
+            self._sync_chat_filter(user_id)
             
             user = await repo.get_user(user_id)
             session_path = self._get_session_path(user_id, user)
@@ -163,67 +413,87 @@ class RepostService:
                 return
 
         # Start listening if not already doing so
-        if user_id not in self._active_listeners:
-            await self.telethon.start_listener(user_id, session_path, self._handle_new_message)
-            self._active_listeners.add(user_id)
+        await self._ensure_listener(user_id, session_path)
+        # Rule 14: Resolved once here and stored with the pair; the send path never resolves
+        await self._resolve_pair_peers([new_pair])
 
-        # Rule 7: Pass all required arguments to the backfill task
+        # Rule 7: The backfill runs as scheduled steps, the first one after a brief pause
         if start_from_msg_id and schedule_interval and schedule_interval > 0:
-            task = asyncio.create_task(
-                self._backfill_from_message(
-                    user_id, source, destination, start_from_msg_id, 
-                    filter_type, replacement_link, schedule_interval, new_pair.id
-                )
+            self.scheduler.schedule("backfill", new_pair.id, BACKFILL_START_DELAY)
+
+    async def _run_scheduled_job(self, kind: str, pair_id: int):
+        """Scheduler handler: each fired job runs exactly one step and reschedules itself."""
+        if kind == "flush":
+            await self._flush_schedule(pair_id)
+        elif kind == "backfill":
+            await self._backfill_step(pair_id)
+        else:
+            self.scheduler.cancel(kind, pair_id)
+
+    async def _backfill_step(self, pair_id: int):
+        """Rule 11: Scheduled progression through history (msg 19 -> 20 -> 21), one group per step."""
+        # In-process state: the index drops paused, errored and deleted pairs
+        pair = self.pair_index.get(pair_id)
+        if not pair:
+            logger.info(f"Backfill for Pair #{pair_id} stopped (not active/deleted).")
+            self._cancel_backfill_task(pair_id)
+            return
+
+        # The cursor streams ids between steps; after a restart it reopens at the Vault checkpoint
+        cursor = self.backfill_cursors.get(pair_id)
+        if cursor is None:
+            cursor = self.backfill_cursors[pair_id] = BackfillCursor(
+                message_refs(self.telethon.iter_messages_from(pair.user_id, pair.source_id, pair.start_from_msg_id)),
+                prefetch=BACKFILL_PREFETCH
             )
-            self.backfill_tasks[new_pair.id] = task
-            
 
-    async def _backfill_from_message(self, user_id, source, destination, from_msg_id, filter_type, replacement_link, interval_minutes, pair_id):
-        """Rule 11: Optimized for scheduled progression (msg 19 -> 20 -> 21)."""
-        await asyncio.sleep(5) # Brief pause to let system stabilize
-        
-        current_id = from_msg_id
-        
         while True:
-            # Check if pair still exists and is active before fetching
-            async with async_session() as db_session:
-                repo = UserRepository(db_session)
-                pair = await repo.get_pair_by_id(pair_id)
-                if not pair or not pair.is_active or pair.status == "error":
-                    logger.info(f"Backfill for Pair #{pair_id} stopped (not active/deleted).")
-                    break
-
-            # Rule 6: Fetch only ONE message to ensure we don't skip logic
-            messages = await self.telethon.fetch_messages_from(user_id, source, current_id, limit=1)
-            
-            if not messages:
+            group = await cursor.next_group()
+            if not group:
                 logger.info(f"Backfill for Pair #{pair_id} reached the 'present'. Switching to live listening.")
+                self._cancel_backfill_task(pair_id)
+                return
+
+            # Ids are not contiguous: the checkpoint follows the real message ids
+            next_id = group[-1].id + 1
+            ids = [ref.id for ref in group if ref.postable]
+            if not ids:
+                continue
+            # Fetched right before sending: file references from the prefetch would have expired
+            postable = await self.telethon.get_messages_by_ids(pair.user_id, pair.source_id, ids)
+            if postable is None:
+                logger.error(f"Backfill stopped on Pair #{pair_id} at msg {group[0].id}: fetch failed.")
+                self._cancel_backfill_task(pair_id)
+                return
+            if postable:
                 break
 
-            msg = messages[0]
-            if msg.message:
-                msg.message = MessageCleaner.clean(msg.message, mode=filter_type, replacement=replacement_link)
+        cleaned = self._clean_messages(postable, pipeline_for(pair))
+        forward = self._forward_plan(postable, cleaned) if pair.copy_mode else None
+        payload = cleaned if len(cleaned) > 1 else cleaned[0]
+        result = await self._copy_or_send(pair.user_id, pair.destination_id, payload, pair_id, forward=forward)
 
-            # Send the message
-            result = await self._send_with_retry(user_id, destination, msg, pair_id=pair_id)
-            
-            if result["ok"]:
-                # --- THE CRITICAL UPDATE ---
-                # Move the pointer forward in the Vault
-                current_id += 1 
-                async with async_session() as db_session:
-                    repo = UserRepository(db_session)
-                    await repo.update_pair_start_id(pair_id, current_id)
-                
-                # Rule 4.2: Respect the user's 5-minute schedule
-                logger.info(f"Pair #{pair_id} posted msg {current_id-1}. Waiting {interval_minutes}m for next.")
-                await asyncio.sleep(interval_minutes * 60)
-            else:
-                # If we hit a flood wait or error, stop the loop to prevent bot-wide lockout
-                logger.error(f"Backfill stopped on Pair #{pair_id} at msg {current_id} due to error.")
-                break
+        if not result["ok"]:
+            # If we hit a flood wait or error, stop to prevent bot-wide lockout
+            logger.error(f"Backfill stopped on Pair #{pair_id} at msg {group[0].id} due to error.")
+            self._cancel_backfill_task(pair_id)
+            return
+
+        # --- THE CRITICAL UPDATE ---
+        # Move the pointer forward in the Vault
+        async with async_session() as db_session:
+            repo = UserRepository(db_session)
+            await repo.update_pair_start_id(pair_id, next_id)
+        pair.start_from_msg_id = next_id
+
+        # Rule 4.2: Respect the user's 5-minute schedule
+        interval_minutes = pair.schedule_interval or 0
+        if interval_minutes <= 0:
+            self._cancel_backfill_task(pair_id)
+            return
+        logger.info(f"Pair #{pair_id} posted msg {group[-1].id}. Next in {interval_minutes}m.")
+        self.scheduler.schedule("backfill", pair_id, interval_minutes * 60)
 
-        
     def _compute_dedup_key(self, message) -> str | None:
         parts = []
         msg_id = getattr(message, "id", None)
@@ -239,174 +509,514 @@ class RepostService:
                 parts.append(f"{media_type}:{message.media.document.id}")
 
         if not parts and getattr(message, "message", ""):
-            parts.append(hashlib.md5(message.message.encode()).hexdigest()[:12])
+            # Non-cryptographic digest; the length guards against crc32 collisions
+            text = message.message.encode()
+            parts.append(f"{zlib.crc32(text):08x}{len(text):x}")
 
         return "|".join(parts) if parts else None
 
     def _is_duplicate(self, pair_id: int, message) -> bool:
         key = self._compute_dedup_key(message)
         if not key: return False
+        return self.dedup.seen_before(pair_id, key)
 
-        seen = self._dedup_seen[pair_id]
-        if key in seen: return True
-
-        seen[key] = time.time()
-        # Rule 14: Cache cleanup
-        if len(seen) > DEDUP_CACHE_SIZE:
-            oldest = sorted(seen, key=seen.get)[:100]
-            for k in oldest: del seen[k]
-        return False
-
-    async def _send_with_retry(self, user_id: int, destination: str, message, pair_id: int = None) -> dict:
-        msg_list = message if isinstance(message, list) else [message]
+    def _resolve_cached_media(self, msg_list) -> dict:
+        """Attaches known file_ids and returns {index: media_key} for media still to be learned."""
         media_keys = {}
-        for m in msg_list:
+        for idx, m in enumerate(msg_list):
             key = self.media_cache.extract_media_key(getattr(m, 'media', None))
             if key:
                 cached_id = self.media_cache.get_file_id(key)
                 if cached_id:
                     m.cached_file_id = cached_id
                 else:
-                    media_keys[id(m)] = key
+                    media_keys[idx] = key
+        return media_keys
+
+    def _attach_stored_media(self, msg_list, media_keys: dict):
+        """
+        Media without a reusable file_id is checked against the media store before the network:
+        hits carry a local_path, and every key rides along so a re-upload can store its download.
+        """
+        for idx, key in media_keys.items():
+            m = msg_list[idx]
+            if getattr(m, "store_key", None) == key:
+                continue
+            m.store_key = key
+            m.local_path = self.media_store.get(key)
+
+    async def _send_with_retry(self, user_id: int, destination: str, message, pair_id: int = None,
+                               media_keys: dict = None, forward: dict = None) -> dict:
+        """Sends (or, with a forward plan, server-side copies) with FloodWait retries."""
+        msg_list = message if isinstance(message, list) else [message]
+        if media_keys is None:
+            media_keys = self._resolve_cached_media(msg_list)
+        if self.media_store:
+            self._attach_stored_media(msg_list, media_keys)
 
         for attempt in range(FLOOD_WAIT_MAX_RETRY + 1):
-            result = await self.telethon.send_message(user_id, destination, message)
+            # Waits out learned pauses; anything longer than the cap fails this send instead of a worker
+            wait = await self.limiter.acquire(user_id, destination, max_wait=FLOOD_WAIT_MAX_SECONDS)
+            if wait:
+                return {"ok": False, "error": "flood_wait", "wait_seconds": int(wait)}
+
+            if forward:
+                result = await self.telethon.forward_messages(
+                    user_id, forward["source"], destination, forward["msg_ids"],
+                    drop_media_captions=forward["drop_captions"]
+                )
+            else:
+                result = await self.telethon.send_message(user_id, destination, message)
 
             if result["ok"]:
+                self.limiter.on_success(user_id, destination)
                 if pair_id:
-                    async with async_session() as db_session:
-                        repo = UserRepository(db_session)
-                        await repo.reset_error_count(pair_id)
+                    self.pair_state.record_success(pair_id)
+                # A stale cached file_id was resent from the message's own media: re-learn those too
+                for idx in result.get("refreshed", ()):
+                    key = self.media_cache.extract_media_key(getattr(msg_list[idx], 'media', None))
+                    if key:
+                        media_keys[idx] = key
                 # Store new file ids
                 sent_msg = result.get("message")
                 if sent_msg:
                     sent_list = sent_msg if isinstance(sent_msg, list) else [sent_msg]
-                    for idx, o_msg in enumerate(msg_list):
-                        if id(o_msg) in media_keys and idx < len(sent_list):
+                    for idx, key in media_keys.items():
+                        if idx < len(sent_list):
                             sent_media = getattr(sent_list[idx], 'media', None)
                             if sent_media:
-                                self.media_cache.store_file_id(media_keys[id(o_msg)], sent_media)
+                                self.media_cache.store_file_id(key, sent_media)
                 return result
 
             if result.get("error") == "flood_wait":
                 wait = result.get("wait_seconds", 30)
-                if wait > 300: return result
-                
+                self.limiter.on_flood(user_id, destination, wait)
+                if wait > FLOOD_WAIT_MAX_SECONDS: return result
+
                 await self._notify_user(user_id, f"Rate limited. Retrying in {wait}s...")
-                await asyncio.sleep(wait)
                 continue
 
             return result
         return {"ok": False, "error": "max_retries"}
 
     async def _record_pair_error(self, pair_id: int, user_id: int, error_detail: str):
-        async with async_session() as db_session:
-            repo = UserRepository(db_session)
-            new_count = await repo.increment_error_count(pair_id)
-            if new_count >= MAX_ERRORS_BEFORE_DISABLE:
+        # Rule 14: The threshold is decided in memory; only the rare disable hits the Vault now
+        pair = self.pair_index.get(pair_id)
+        new_count = self.pair_state.record_error(pair_id, known_count=getattr(pair, "error_count", 0))
+        if new_count >= MAX_ERRORS_BEFORE_DISABLE:
+            async with async_session() as db_session:
+                repo = UserRepository(db_session)
                 await repo.deactivate_pair_as_error(pair_id)
-                self._cancel_schedule_timer(pair_id)
-                self._cancel_backfill_task(pair_id)
-                await self._notify_user(user_id, f"Pair #{pair_id} disabled after {new_count} errors.")
+            self.pair_index.remove(pair_id)
+            self._sync_chat_filter(user_id)
+            await self.pipeline.discard(pair_id)
+            self._cancel_schedule_timer(pair_id)
+            self._cancel_backfill_task(pair_id)
+            await self._notify_user(user_id, f"Pair #{pair_id} disabled after {new_count} errors.")
 
     async def _handle_new_message(self, message, user_id):
         if not (message.message or message.media): return
+        # Rule 4: Drop non-source chats before any buffering or DB work
+        pairs = self.pair_index.match(user_id, message.chat_id)
+        if not pairs: return
+        self._mark_seen(user_id, message.chat_id, message.id)
 
         if message.grouped_id:
-            gid = message.grouped_id
-            if gid not in self.album_cache:
-                self.album_cache[gid] = []
-                asyncio.create_task(self._process_album_after_delay(gid, user_id))
-            self.album_cache[gid].append(message)
+            # The album is shared by every pair on this source, so the widest window wins
+            windows = [p.album_window_ms for p in pairs if p.album_window_ms]
+            self.albums.add(user_id, message, quiet_ms=max(windows) if windows else None)
             return
 
-        await self._execute_repost(user_id, [message])
-
-    async def _process_album_after_delay(self, gid, user_id):
-        # Implement a sliding window timeout. If the length changes, wait again.
-        while True:
-            count = len(self.album_cache.get(gid, []))
-            await asyncio.sleep(1.0)
-            if count == len(self.album_cache.get(gid, [])):
-                break
-                
-        messages = self.album_cache.pop(gid, [])
-        if messages:
-            await self._execute_repost(user_id, messages)
+        await self.pipeline.submit(user_id, [message])
 
     async def _execute_repost(self, user_id, messages):
-        # Optimization: Normalize incoming chat ID once
-        raw_cid = str(messages[0].chat_id)
-        norm_cid = raw_cid if raw_cid.startswith("-100") else f"-100{raw_cid}"
-
-        async with async_session() as db_session:
-            repo = UserRepository(db_session)
-            pairs = await repo.get_user_pairs(user_id)
-            if not pairs: return
-
-            for p in pairs:
-                if not p.is_active or p.status == "error": continue
-
-                # Normalize source ID for matching
-                src = str(p.source_id)
-                norm_src = src if src.startswith("-100") else f"-100{src}"
-
-                if norm_cid == norm_src:
-                    await self._process_matched_pair(p, user_id, messages)
-                    break
-
-    async def _process_matched_pair(self, p, user_id, messages):
-        if self._is_duplicate(p.id, messages[0]): return
+        """Route/clean stage: runs on a pipeline worker, hands one send job per pair to the send stage."""
+        # Rule 4: Route from the in-memory index, no Vault round-trip per message
+        pairs = self.pair_index.match(user_id, messages[0].chat_id)
+        pairs = [p for p in pairs if not self._is_duplicate(p.id, messages[0])]
+        if not pairs: return
+
+        # Fan-out: media lookups and cleaning happen once, then every destination gets a copy
+        media_keys = self._resolve_cached_media(messages)
+        variants = {}
+        for p in pairs:
+            # Pairs with the same filter settings share one compiled pipeline, and one cleaned copy
+            clean = pipeline_for(p)
+            if clean not in variants:
+                variants[clean] = self._clean_messages(messages, clean)
+            cleaned = variants[clean]
+            forward = self._forward_plan(messages, cleaned) if p.copy_mode else None
+            await self._process_matched_pair(p, user_id, cleaned, media_keys, forward)
+
+    @staticmethod
+    def _forward_plan(originals, cleaned) -> dict | None:
+        """
+        Copy mode is only possible when the text pipeline left the text alone, or
+        emptied a media caption entirely (then Telegram drops captions for us).
+        Any real rewrite falls back to the regular send path.
+        """
+        drop_captions = False
+        kept_caption = False
+        for orig, new in zip(originals, cleaned):
+            if new.message == orig.message:
+                kept_caption = kept_caption or bool(orig.message)
+            elif not new.message and orig.media:
+                drop_captions = True
+            else:
+                return None
+        if drop_captions and kept_caption:
+            return None
+        return {
+            "source": originals[0].chat_id,
+            "msg_ids": [m.id for m in originals],
+            "drop_captions": drop_captions,
+        }
+
+    @staticmethod
+    def _split_albums(messages) -> list:
+        """Regroups a flat message list into single messages and albums."""
+        groups = []
+        for m in messages:
+            gid = getattr(m, "grouped_id", None)
+            if gid and groups and getattr(groups[-1][0], "grouped_id", None) == gid:
+                groups[-1].append(m)
+            else:
+                groups.append([m])
+        return groups
 
+    def _clean_messages(self, messages, clean) -> list:
+        """Returns the album with cleaned text. Originals are never mutated, so variants can share them."""
+        cleaned = []
         for msg in messages:
             if msg.message:
-                msg.message = MessageCleaner.clean(msg.message, mode=p.filter_type, replacement=p.replacement_link)
-
+                text = clean(msg.message)
+                if text != msg.message:
+                    msg = copy.copy(msg)
+                    msg.message = text
+            cleaned.append(msg)
+        return cleaned
+
+    def _account_slots(self, user_id: int) -> asyncio.Semaphore:
+        slots = self._send_slots.get(user_id)
+        if slots is None:
+            slots = self._send_slots[user_id] = asyncio.Semaphore(FANOUT_CONCURRENCY)
+        return slots
+
+    async def _process_matched_pair(self, p, user_id, messages, media_keys: dict = None, forward: dict = None):
         if p.schedule_interval and p.schedule_interval > 0:
-            bundle = self.media_cache.cache_bundle(p.id, messages)
-            self._enqueue_scheduled(p.id, user_id, p.destination_id, bundle, p.schedule_interval)
+            self._enqueue_scheduled(p, user_id, messages, forward)
         else:
-            result = await self._send_with_retry(user_id, p.destination_id, messages, pair_id=p.id)
-            if not result["ok"]:
-                await self._record_pair_error(p.id, user_id, result.get("error", "Unknown"))
-
-    def _enqueue_scheduled(self, pair_id: int, user_id: int, destination: str, messages, interval_minutes: int):
-        if pair_id not in self.schedule_queue:
-            self.schedule_queue[pair_id] = []
-        self.schedule_queue[pair_id].append({
-            "user_id": user_id, "destination": destination, "messages": messages
-        })
-        if pair_id not in self.schedule_timers or self.schedule_timers[pair_id].done():
-            self.schedule_timers[pair_id] = asyncio.create_task(self._flush_schedule(pair_id, interval_minutes))
-
-    async def _flush_schedule(self, pair_id: int, interval_minutes: int):
-        await asyncio.sleep(interval_minutes * 60)
-        queued = self.schedule_queue.pop(pair_id, [])
-        if not queued: return
-
-        for item in queued:
-            await self._send_with_retry(item["user_id"], item["destination"], item["messages"], pair_id=pair_id)
-        
-        self.schedule_timers.pop(pair_id, None)
-        self.media_cache.clear_pair(pair_id)
+            job = {
+                "pair_id": p.id, "user_id": user_id, "destination": p.destination_id,
+                "messages": list(messages), "media_keys": media_keys,
+            }
+            if forward:
+                # Consecutive forwards of one pair are folded into a single request
+                job["batch_key"] = (forward["source"], forward["drop_captions"])
+                job["msg_ids"] = list(forward["msg_ids"])
+                job["media_keys"] = {}
+            await self.pipeline.dispatch(p.id, job, p.overload_policy)
+
+    async def _deliver(self, job: dict):
+        """Send stage: runs on a pipeline worker, bounded per account by FANOUT_CONCURRENCY."""
+        user_id, pair_id = job["user_id"], job["pair_id"]
+        forward = None
+        if job.get("batch_key") is not None:
+            source, drop_captions = job["batch_key"]
+            forward = {"source": source, "msg_ids": job["msg_ids"], "drop_captions": drop_captions}
+
+        async with self._account_slots(user_id):
+            result = await self._copy_or_send(
+                user_id, job["destination"], job["messages"], pair_id,
+                media_keys=job["media_keys"], forward=forward
+            )
+        if not result["ok"]:
+            await self._record_pair_error(pair_id, user_id, result.get("error", "Unknown"))
+
+    async def _copy_or_send(self, user_id: int, destination: str, messages, pair_id: int,
+                            media_keys: dict = None, forward: dict = None) -> dict:
+        """Copy mode first when planned; protected sources fall back to the send path."""
+        result = await self._send_with_retry(
+            user_id, destination, messages, pair_id=pair_id, media_keys=media_keys, forward=forward
+        )
+        if result.get("error") != "forwards_restricted":
+            return result
+
+        logger.info(f"Pair #{pair_id}: source forbids forwarding, using the send path.")
+        msg_list = messages if isinstance(messages, list) else [messages]
+        for group in self._split_albums(msg_list):
+            result = await self._send_with_retry(user_id, destination, group, pair_id=pair_id)
+            if not result["ok"]: break
+        return result
+
+    def _enqueue_scheduled(self, p, user_id: int, messages, forward: dict = None):
+        if not self.outbox.put(Outbox.encode(p.id, user_id, p.destination_id, messages, forward)):
+            logger.error(f"Pair #{p.id}: outbox write buffer full, scheduled post rejected.")
+            return
+        if not self.scheduler.is_scheduled("flush", p.id):
+            self.scheduler.schedule("flush", p.id, p.schedule_interval * 60)
+
+    async def _flush_schedule(self, pair_id: int):
+        """
+        One tick of a scheduled pair. Burst mode drains the queue (up to max_per_tick)
+        once per interval; paced mode spreads it evenly across the interval, max_per_tick
+        (default 1) posts per tick. Ticks come from the shared scheduler, never from sleeps.
+        """
+        pair = self.pair_index.get(pair_id)
+        if not pair:
+            self._end_flush_cycle(pair_id)
+            return
+
+        interval = (pair.schedule_interval or 1) * 60
+        if pair.queue_policy == "latest":
+            superseded = await self.outbox.keep_latest(pair_id)
+            if superseded:
+                logger.info(f"Pair #{pair_id}: latest-wins dropped {superseded} older queued posts.")
+
+        budget = pair.max_per_tick or None
+        if pair.schedule_mode == "paced":
+            budget = budget or 1
+            if pair_id not in self._pace:
+                # Spacing is fixed for the cycle; posts queued meanwhile join the tail
+                ticks = max(1, math.ceil(await self.outbox.count(pair_id) / budget))
+                self._pace[pair_id] = interval / ticks
+
+        outcome = await self._drain_outbox(pair_id, budget)
+        if outcome in ("budget", "failed"):
+            # Leftovers (or a failed head, which keeps its place) go out on the next tick
+            self.scheduler.schedule("flush", pair_id, self._pace.get(pair_id, interval))
+        else:
+            self._end_flush_cycle(pair_id)
+        await self.outbox.flush()
+
+    def _end_flush_cycle(self, pair_id: int):
+        self._pace.pop(pair_id, None)
+        # Done for good, unless an enqueue during the drain already armed the next flush
+        if not self.scheduler.is_scheduled("flush", pair_id):
+            self.scheduler.cancel("flush", pair_id)
+
+    async def _drain_outbox(self, pair_id: int, budget: int = None) -> str:
+        """Sends the pair's queued posts in order. Returns 'empty', 'budget', 'failed' or 'gone'."""
+        handled = 0
+        while True:
+            limit = self.outbox.batch_size if not budget else min(self.outbox.batch_size, budget - handled)
+            items = await self.outbox.read(pair_id, limit)
+            # Acks could not be saved: stop rather than re-read (and re-send) what already went out
+            if items is None: return "failed"
+            if not items: return "empty"
+
+            for item in items:
+                handled += 1
+                result = await self._send_outbox_item(item)
+                if result["ok"]:
+                    self.outbox.ack(item["id"])
+                    continue
+
+                attempts = item["attempts"] + 1
+                if attempts >= config.OUTBOX_MAX_ATTEMPTS:
+                    logger.error(f"Pair #{pair_id}: dropping queued post after {attempts} attempts.")
+                    self.outbox.ack(item["id"])
+                else:
+                    self.outbox.retry(item["id"], attempts)
+                await self._record_pair_error(pair_id, item["user_id"], result.get("error", "Unknown"))
+
+                if not self.pair_index.get(pair_id): return "gone"
+                # Keep the order: nothing behind a failed post goes out before it
+                if attempts < config.OUTBOX_MAX_ATTEMPTS: return "failed"
+
+            if budget and handled >= budget: return "budget"
+
+    async def _send_outbox_item(self, item: dict) -> dict:
+        """Re-fetches the originals (fresh file references), re-applies the cleaned text and sends."""
+        fetched = await self.telethon.get_messages_by_ids(item["user_id"], item["source_id"], item["msg_ids"])
+        if fetched is None:
+            return {"ok": False, "error": "disconnected"}
+
+        by_id = {m.id: m for m in fetched}
+        messages = []
+        for msg_id, text in zip(item["msg_ids"], item["texts"]):
+            msg = by_id.get(msg_id)
+            if msg is None: continue
+            if (msg.message or "") != text:
+                msg.message = text
+            messages.append(msg)
+        if not messages:
+            # Deleted at the source while queued: nothing left to post
+            return {"ok": True}
+
+        forward = None
+        if item["copy_mode"]:
+            forward = {"source": item["source_id"], "msg_ids": [m.id for m in messages], "drop_captions": item["drop_captions"]}
+        payload = messages if len(messages) > 1 else messages[0]
+        return await self._copy_or_send(item["user_id"], item["destination"], payload, item["pair_id"], forward=forward)
 
     def _cancel_schedule_timer(self, pair_id: int):
-        timer = self.schedule_timers.pop(pair_id, None)
-        if timer and not timer.done(): timer.cancel()
-        self.media_cache.clear_pair(pair_id)
+        self.scheduler.cancel("flush", pair_id)
+        self._pace.pop(pair_id, None)
 
     def _cancel_backfill_task(self, pair_id: int):
-        task = self.backfill_tasks.pop(pair_id, None)
-        if task and not task.done(): task.cancel()
+        self.scheduler.cancel("backfill", pair_id)
+        cursor = self.backfill_cursors.pop(pair_id, None)
+        if cursor: cursor.close()
+
+    async def _load_schedule(self) -> dict:
+        async with async_session() as db_session:
+            return await ScheduleRepository(db_session).load_jobs()
+
+    async def _save_schedule(self, upserts: dict, deletes: set):
+        async with async_session() as db_session:
+            await ScheduleRepository(db_session).save_jobs(upserts, deletes)
+
+    async def _arm_pending_flushes(self, pair_ids=None):
+        """Posts queued before a crash (or a shard handoff) that never got their flush timer persisted."""
+        for pair_id in await self.outbox.pending_pairs():
+            if pair_ids is not None and pair_id not in pair_ids:
+                continue
+            pair = self.pair_index.get(pair_id)
+            if pair and pair.schedule_interval and not self.scheduler.is_scheduled("flush", pair_id):
+                self.scheduler.schedule("flush", pair_id, pair.schedule_interval * 60)
+
+    # --- Sharding (driven by services/shard_coordinator.py) ---
+
+    async def release_users(self, user_ids) -> dict:
+        """
+        Hands users over to another shard. Their listeners stop, work already taken in
+        drains (bounded by SHARD_HANDOFF_SECONDS), and their timers leave memory while
+        the persisted rows stay. Returns user_id -> {source chat id: last seen id} so the
+        new owner catches up exactly from where this shard stopped listening.
+        """
+        pair_ids = set()
+        for user_id in user_ids:
+            self.supervisor.unwatch(user_id)
+            await self.telethon.stop_listener(user_id)
+            self.albums.flush_user(user_id)
+            pair_ids |= self.pair_index.pair_ids(user_id)
+
+        deadline = time.monotonic() + config.SHARD_HANDOFF_SECONDS
+        while self.pipeline.holds(pair_ids) and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+
+        for pair_id in pair_ids:
+            self.scheduler.forget("flush", pair_id)
+            self.scheduler.forget("backfill", pair_id)
+            self._pace.pop(pair_id, None)
+            cursor = self.backfill_cursors.pop(pair_id, None)
+            if cursor: cursor.close()
+            await self.pipeline.discard(pair_id)
+        await self.scheduler.persist()
+        await self.outbox.flush()
+        await self.pair_state.flush()
+        for pair_id in pair_ids:
+            self.pair_state.forget(pair_id)
+
+        handoff = {}
+        for user_id in user_ids:
+            self.pair_index.remove_user(user_id)
+            self._send_slots.pop(user_id, None)
+            handoff[user_id] = self._last_seen.pop_user(user_id)
+        logger.info(f"Released {len(handoff)} users ({len(pair_ids)} pairs) to another shard.")
+        return handoff
+
+    async def adopt_users(self, user_ids, handoff: dict = None):
+        """Takes users over from another shard: pairs, timers and queued posts from the Vault, then the Eyes."""
+        user_ids = set(user_ids)
+        handoff = handoff or {}
+        async with async_session() as db_session:
+            repo = UserRepository(db_session)
+            pairs = [p for p in await repo.get_all_active_pairs() if p.user_id in user_ids]
+            users = [u for u in await repo.get_active_users_with_sessions() if u.id in user_ids]
+        for pair in pairs:
+            self.pair_index.add(pair)
+            self._remember_peers(pair)
+        adopted = {p.id for p in pairs}
+
+        self.scheduler.start()
+        await self.scheduler.restore(only=lambda kind, pair_id: pair_id in adopted)
+        await self._arm_pending_flushes(adopted)
+
+        for user in users:
+            for chat_id, msg_id in handoff.get(user.id, {}).items():
+                self._mark_seen(user.id, chat_id, msg_id)
+            self._sync_chat_filter(user.id)
+            path = self._get_session_path(user.id, user)
+            if path:
+                await self._ensure_listener(user.id, path)
+                if handoff.get(user.id):
+                    self._spawn(self._catch_up(user.id))
+        logger.info(f"Adopted {len(users)} users ({len(adopted)} pairs) from another shard.")
+
+    async def stats_by_shard(self) -> dict:
+        """Same shape as the coordinator's: label -> pipeline_stats()."""
+        return {"": self.pipeline_stats()}
+
+    async def shutdown(self):
+        """Rule 1: Persist in-memory state before the organism goes to sleep."""
+        await self.supervisor.stop()
+        # Albums still inside their quiet window go out; queued work gets a bounded chance to finish
+        await self.albums.close()
+        deadline = time.monotonic() + config.SHUTDOWN_DRAIN_SECONDS
+        while not self.pipeline.idle() and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        await self.pipeline.stop()
+        for pair_id in list(self.backfill_cursors):
+            self.backfill_cursors.pop(pair_id).close()
+        await self.scheduler.stop()
+        await self.outbox.close()
+        await self.pair_state.close()
+        await self.telethon.registry.close_all()
+        self.dedup.close()
+        self.media_cache.close()
+        self._last_seen.close()
+        logger.info("Repost engine state flushed.")
 
     async def recover_all_listeners(self):
+        """Rule 1: Boot recovery. Users and sessions come from one query; clients connect concurrently."""
+        started = time.monotonic()
         async with async_session() as db_session:
             repo = UserRepository(db_session)
-            users = await repo.get_all_active_users_with_pairs()
-            for uid in users:
-                if uid not in self._active_listeners:
-                    user = await repo.get_user(uid)
-                    path = self._get_session_path(uid, user)
-                    if path:
-                        await self.telethon.start_listener(uid, path, self._handle_new_message)
-                        self._active_listeners.add(uid)
\ No newline at end of file
+            pairs = await repo.get_all_active_pairs()
+            users = [u for u in await repo.get_active_users_with_sessions() if self.owns(u.id)]
+        # Pairs of users another shard owns are neither served nor treated as vanished
+        foreign = {p.id for p in pairs if not self.owns(p.user_id)}
+        self.pair_index.load([p for p in pairs if p.id not in foreign])
+        for pair in pairs:
+            if pair.id not in foreign:
+                self._remember_peers(pair)
+
+        slots = asyncio.Semaphore(config.RECOVERY_CONCURRENCY)
+        latencies = {}
+
+        async def reconnect_user(user):
+            path = self._get_session_path(user.id, user)
+            if not path or self.telethon.is_listening(user.id):
+                return
+            async with slots:
+                t0 = time.monotonic()
+                await self._ensure_listener(user.id, path)
+                latencies[user.id] = time.monotonic() - t0
+            ok = self.telethon.is_listening(user.id)
+            logger.info(f"Recovery: User {user.id} {'listening' if ok else 'FAILED'} after {latencies[user.id] * 1000:.0f} ms.")
+
+        await asyncio.gather(*(reconnect_user(u) for u in users))
+
+        # Timers resume after the Eyes are open; jobs of vanished pairs are dropped
+        self.scheduler.start()
+        await self.scheduler.restore(
+            keep=lambda kind, pair_id: self.pair_index.get(pair_id) is not None,
+            only=lambda kind, pair_id: pair_id not in foreign,
+        )
+        await self._arm_pending_flushes()
+
+        ordered = sorted(latencies.values())
+        self.startup_report = {
+            "users": len(users),
+            "listening": sum(1 for uid in latencies if self.telethon.is_listening(uid)),
+            "connect_p50_ms": round(ordered[len(ordered) // 2] * 1000) if ordered else 0,
+            "connect_max_ms": round(ordered[-1] * 1000) if ordered else 0,
+            "ready_s": round(time.monotonic() - started, 2),
+        }
+        r = self.startup_report
+        logger.info(
+            f"Recovery: {r['listening']}/{r['users']} users listening, connect p50 {r['connect_p50_ms']} ms, "
+            f"max {r['connect_max_ms']} ms; ready in {r['ready_s']}s."
+        )
\ No newline at end of file
@@ -0,0 +1,256 @@
+"""
+SERVICES: SCHEDULER
+The 'Heartbeat'. (Anatomy: Nervous System)
+One timer for every timed job in the engine (schedule flushes, backfill steps).
+Jobs live in an indexed min-heap keyed by (kind, pair_id): O(log n) schedule,
+reschedule and cancel. Next-run times are written behind to the Vault so a
+restart resumes exactly where it left off.
+"""
+import logging
+import asyncio
+import itertools
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class IndexedHeap:
+    """Binary min-heap of (due, key) with a key -> position map."""
+    def __init__(self):
+        self._heap = []
+        self._pos = {}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, key):
+        return key in self._pos
+
+    def due_of(self, key) -> float | None:
+        i = self._pos.get(key)
+        return self._heap[i][0] if i is not None else None
+
+    def peek(self):
+        due, _, key = self._heap[0]
+        return due, key
+
+    def push(self, key, due: float):
+        """Inserts key, or moves it to a new due time."""
+        entry = (due, next(self._seq), key)
+        i = self._pos.get(key)
+        if i is None:
+            self._heap.append(entry)
+            i = len(self._heap) - 1
+            self._pos[key] = i
+            self._sift_up(i)
+            return
+        old_due = self._heap[i][0]
+        self._heap[i] = entry
+        if due < old_due:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+    def remove(self, key) -> bool:
+        i = self._pos.pop(key, None)
+        if i is None:
+            return False
+        last = self._heap.pop()
+        if i < len(self._heap):
+            self._heap[i] = last
+            self._pos[last[2]] = i
+            self._sift_up(i)
+            self._sift_down(self._pos[last[2]])
+        return True
+
+    def pop(self):
+        due, key = self.peek()
+        self.remove(key)
+        return due, key
+
+    def _swap(self, i, j):
+        h = self._heap
+        h[i], h[j] = h[j], h[i]
+        self._pos[h[i][2]] = i
+        self._pos[h[j][2]] = j
+
+    def _sift_up(self, i):
+        h = self._heap
+        while i > 0:
+            parent = (i - 1) >> 1
+            if h[i][:2] < h[parent][:2]:
+                self._swap(i, parent)
+                i = parent
+            else:
+                break
+
+    def _sift_down(self, i):
+        h = self._heap
+        n = len(h)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < n and h[child][:2] < h[smallest][:2]:
+                    smallest = child
+            if smallest == i:
+                break
+            self._swap(i, smallest)
+            i = smallest
+
+
+class Scheduler:
+    """
+    handler(kind, pair_id) is awaited in its own task when a job comes due.
+    load() -> {(kind, pair_id): due} and save(upserts, deletes) persist next-run state.
+    """
+    def __init__(self, handler, load=None, save=None, persist_interval: float = 2.0,
+                 retry_base: float = 30.0, retry_max: float = 900.0, max_failures: int = 5):
+        self._handler = handler
+        self._load = load
+        self._save = save
+        self._persist_interval = persist_interval
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_failures = max_failures
+        self._jobs = IndexedHeap()
+        # (kind, pair_id) -> consecutive handler failures
+        self._failures = {}
+        self._dirty = {}
+        self._wake = None
+        self._task = None
+        self._running = set()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def start(self):
+        """Rule 1: Idempotent; the single timer task of the organism."""
+        if self._task and not self._task.done():
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="scheduler")
+
+    async def restore(self, keep=None, only=None) -> int:
+        """
+        Loads persisted jobs; keep(kind, pair_id) filters out jobs of vanished pairs.
+        only(kind, pair_id) limits the restore to this process's pairs: jobs outside it
+        are left alone, rows included (sharded mode).
+        """
+        if not self._load:
+            return 0
+        restored = 0
+        for (kind, pair_id), due in (await self._load()).items():
+            if only and not only(kind, pair_id):
+                continue
+            if keep and not keep(kind, pair_id):
+                self._dirty[(kind, pair_id)] = None
+                continue
+            self._jobs.push((kind, pair_id), due)
+            restored += 1
+        self._poke()
+        logger.info(f"Scheduler restored {restored} jobs.")
+        return restored
+
+    def schedule(self, kind: str, pair_id: int, delay: float):
+        self.schedule_at(kind, pair_id, time.time() + delay)
+
+    def schedule_at(self, kind: str, pair_id: int, due: float):
+        key = (kind, pair_id)
+        self._jobs.push(key, due)
+        self._dirty[key] = due
+        self._poke()
+
+    def cancel(self, kind: str, pair_id: int) -> bool:
+        """
+        Removes a pending job, and its persisted row. Handlers call this when a
+        fired job is finished for good; until then the row survives a crash.
+        """
+        key = (kind, pair_id)
+        removed = self._jobs.remove(key)
+        self._failures.pop(key, None)
+        self._dirty[key] = None
+        self._poke()
+        return removed
+
+    def forget(self, kind: str, pair_id: int) -> bool:
+        """Drops a job from memory only; its persisted row stays for whoever takes the pair over."""
+        self._failures.pop((kind, pair_id), None)
+        return self._jobs.remove((kind, pair_id))
+
+    def is_scheduled(self, kind: str, pair_id: int) -> bool:
+        return (kind, pair_id) in self._jobs
+
+    def _poke(self):
+        if self._wake:
+            self._wake.set()
+
+    async def _run(self):
+        last_persist = time.monotonic()
+        while True:
+            now = time.time()
+            while self._jobs and self._jobs.peek()[0] <= now:
+                _, key = self._jobs.pop()
+                task = asyncio.create_task(self._fire(*key))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+            if self._dirty and time.monotonic() - last_persist >= self._persist_interval:
+                await self.persist()
+                last_persist = time.monotonic()
+
+            timeout = None
+            if self._jobs:
+                timeout = max(0.0, self._jobs.peek()[0] - time.time())
+            if self._dirty:
+                flush_in = self._persist_interval - (time.monotonic() - last_persist)
+                timeout = flush_in if timeout is None else min(timeout, flush_in)
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, kind: str, pair_id: int):
+        key = (kind, pair_id)
+        try:
+            await self._handler(kind, pair_id)
+        except Exception as e:
+            # The job is already off the heap: retry it with backoff, or cancel it for good,
+            # so memory and the persisted row never disagree
+            failures = self._failures.get(key, 0) + 1
+            if failures >= self.max_failures:
+                logger.error(f"Scheduled {kind} for Pair #{pair_id} failed {failures} times, dropping it: {e}")
+                self.cancel(kind, pair_id)
+                return
+            self._failures[key] = failures
+            delay = min(self.retry_max, self.retry_base * 2 ** (failures - 1))
+            logger.error(f"Scheduled {kind} for Pair #{pair_id} failed: {e}; retrying in {delay:.0f}s")
+            # A handler that rescheduled itself before failing still waits out the backoff
+            due = max(self._jobs.due_of(key) or 0, time.time() + delay)
+            self.schedule_at(kind, pair_id, due)
+            return
+        self._failures.pop(key, None)
+
+    async def persist(self):
+        """Writes every changed next-run time in one batch."""
+        if not self._save or not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        upserts = {k: v for k, v in dirty.items() if v is not None}
+        deletes = {k for k, v in dirty.items() if v is None}
+        try:
+            await self._save(upserts, deletes)
+        except Exception as e:
+            logger.error(f"Failed to persist scheduler state: {e}")
+            # Keep the changes for the next attempt unless something newer replaced them
+            for k, v in dirty.items():
+                self._dirty.setdefault(k, v)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.persist()
@@ -19,9 +19,16 @@ class SessionService:
     def __init__(self):
         # Same here—matching the DNA perfectly
         os.makedirs(SESSIONS_DIR, exist_ok=True)
+        # Rule 1: In sharded mode the accounts live in the workers; this process keeps no
+        # connection (and no session store) of its own, every check uses a throwaway client
+        self.sharded = config.SHARD_WORKERS > 1
+        # Shares the process-wide client registry with the repost engine
         self.telethon = TelethonProvider(
             api_id=config.API_ID, 
-            api_hash=config.API_HASH
+            api_hash=config.API_HASH,
+            client_idle_ttl=config.CLIENT_IDLE_TTL,
+            session_store_path=None if self.sharded else (config.SESSION_STORE_PATH or None),
+            session_flush_seconds=config.SESSION_FLUSH_SECONDS,
         )
 
     async def handle_session_input(self, message: types.Message) -> bool:
@@ -30,14 +37,16 @@ class SessionService:
 
         if message.document:
             file_path = f"{SESSIONS_DIR}/{user_id}.session"
+            # The upload lands beside the live file: a bad one must not clobber a working session
+            upload_path = f"{SESSIONS_DIR}/{user_id}.upload.session"
             
-            # Action: Download directly to destination
-            await message.bot.download(message.document, destination=file_path)
+            await message.bot.download(message.document, destination=upload_path)
             
-            # The Eyes validate the file path
-            is_valid = await self.telethon.validate_session(file_path)
+            # The Eyes validate the new file on its own, never through the live connection
+            is_valid = await self.telethon.validate_session(upload_path, user_id=user_id, fresh=True)
             
             if is_valid:
+                os.replace(upload_path, file_path)
                 # Logical Storage: Inform the Librarian
                 async with async_session() as db_session:
                     repo = UserRepository(db_session)
@@ -46,15 +55,15 @@ class SessionService:
                 await message.answer("✅ .session file validated and saved in the Vault.")
                 return True
             else:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                if os.path.exists(upload_path):
+                    os.remove(upload_path)
                 await message.answer("❌ Invalid or corrupted .session file. Please try again.")
                 return False
 
         elif message.text:
             session_str = message.text.strip()
             # The Eyes validate the string
-            is_valid = await self.telethon.validate_session(session_str)
+            is_valid = await self.telethon.validate_session(session_str, user_id=user_id, fresh=self.sharded)
             
             if is_valid:
                 # Rule 11: Ask the Librarian to update the memory
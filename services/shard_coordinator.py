@@ -0,0 +1,275 @@
+"""
+SERVICES: SHARD COORDINATOR
+The 'Brain Stem'. (Anatomy: Nervous System)
+Sharded mode of the engine. The bot process keeps aiogram polling and the Vault
+reads; every Telethon account lives in one of N worker processes
+(services/shard_worker.py), picked by rendezvous hashing of the user id. The bot
+handlers see the same interface as RepostService: pair mutations are routed to the
+owning shard, reads go straight to the Vault.
+
+When a worker dies it is dropped from the map (its users move to the survivors) and
+respawned with backoff; resize() adds or retires workers. Either way only the users
+whose owner changes are handed over, with their last seen ids, so the new owner
+catches up where the old one stopped. A dead worker can't report them; its last
+write-behind file (services/last_seen.py) stands in.
+"""
+import logging
+import asyncio
+import os
+import sys
+import time
+from config import config
+from data.database import async_session
+from data.repository import UserRepository
+from services.last_seen import read_last_seen
+from services.shard_map import ShardMap, instance_path
+from services.shard_rpc import RpcClient, RpcError, remove_stale_socket
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESPAWN_BACKOFF_MAX = 300
+STATS_TIMEOUT = 5
+SHUTDOWN_TIMEOUT = 30
+
+
+class ShardCoordinator:
+    def __init__(self, workers: int, socket_dir: str):
+        self.target = workers
+        self.socket_dir = socket_dir
+        self.map = ShardMap([])
+        # shard_id -> {"proc", "rpc", "watch"}
+        self._workers = {}
+        self._retiring = set()
+        self._stopping = False
+        self._lock = asyncio.Lock()
+        # Cleared while users are in flight between shards; routed calls wait for it
+        self._stable = asyncio.Event()
+        self.startup_report = None
+        self.rebalances = 0
+
+    # --- Same interface as RepostService for the bot handlers ---
+
+    def set_bot(self, bot):
+        """Workers notify users through their own Bot instance."""
+
+    async def user_has_session(self, user_id: int) -> bool:
+        if os.path.exists(os.path.join("data", "sessions", f"{user_id}.session")):
+            return True
+        async with async_session() as db_session:
+            user = await UserRepository(db_session).get_user(user_id)
+            return bool(user and user.session_string)
+
+    async def register_user(self, user_id: int, username: str):
+        async with async_session() as db_session:
+            await UserRepository(db_session).create_or_update_user(user_id, username)
+
+    async def get_user_pairs(self, user_id: int):
+        async with async_session() as db_session:
+            return await UserRepository(db_session).get_user_pairs(user_id)
+
+    async def add_new_pair(self, user_id: int, **kwargs):
+        return await self._route("add_new_pair", user_id, **kwargs)
+
+    async def activate_pair(self, user_id: int, pair_id: int) -> bool:
+        return await self._route("activate_pair", user_id, pair_id=pair_id)
+
+    async def deactivate_pair(self, user_id: int, pair_id: int) -> bool:
+        return await self._route("deactivate_pair", user_id, pair_id=pair_id)
+
+    async def update_pair_settings(self, user_id: int, pair_id: int, **settings) -> bool:
+        return await self._route("update_pair_settings", user_id, pair_id=pair_id, **settings)
+
+    async def delete_single_pair(self, user_id: int, pair_id: int) -> bool:
+        return await self._route("delete_single_pair", user_id, pair_id=pair_id)
+
+    async def delete_all_user_pairs(self, user_id: int):
+        return await self._route("delete_all_user_pairs", user_id)
+
+    async def resolve_channel_for_pair(self, user_id: int, identifier: str, kind: str, invite_hash: str = None) -> str:
+        return await self._route(
+            "resolve_channel_for_pair", user_id, identifier=identifier, kind=kind, invite_hash=invite_hash
+        )
+
+    async def stats_by_shard(self) -> dict:
+        """label -> pipeline_stats() of every worker that answers in time."""
+        shard_ids = sorted(self._workers)
+        replies = await asyncio.gather(
+            *(self._workers[s]["rpc"].call("stats", timeout=STATS_TIMEOUT) for s in shard_ids),
+            return_exceptions=True
+        )
+        return {f"shard{s}": r for s, r in zip(shard_ids, replies) if isinstance(r, dict)}
+
+    async def _route(self, method: str, user_id: int, **kwargs):
+        await self._stable.wait()
+        shard_id = self.map.owner(user_id)
+        worker = self._workers.get(shard_id)
+        if worker is None:
+            raise RpcError(f"no live shard for User {user_id}")
+        return await worker["rpc"].call("call", method=method, kwargs={"user_id": user_id, **kwargs})
+
+    # --- Lifecycle ---
+
+    async def recover_all_listeners(self):
+        """Boot: spawns the workers, then each recovers the users it owns, all in parallel."""
+        started = time.monotonic()
+        os.makedirs(self.socket_dir, exist_ok=True)
+        shard_ids = list(range(self.target))
+        await asyncio.gather(*(self._spawn(s) for s in shard_ids))
+        self.map = ShardMap(shard_ids)
+        reports = await asyncio.gather(
+            *(self._workers[s]["rpc"].call("boot", shards=shard_ids) for s in shard_ids),
+            return_exceptions=True
+        )
+        reports = [r for r in reports if isinstance(r, dict)]
+        self.startup_report = {
+            "users": sum(r["users"] for r in reports),
+            "listening": sum(r["listening"] for r in reports),
+            "connect_p50_ms": max((r["connect_p50_ms"] for r in reports), default=0),
+            "connect_max_ms": max((r["connect_max_ms"] for r in reports), default=0),
+            "ready_s": round(time.monotonic() - started, 2),
+        }
+        self._stable.set()
+        logger.info(
+            f"Sharded recovery: {len(reports)}/{len(shard_ids)} shards up, "
+            f"{self.startup_report['listening']}/{self.startup_report['users']} users listening "
+            f"in {self.startup_report['ready_s']}s."
+        )
+
+    async def _spawn(self, shard_id: int):
+        path = os.path.join(self.socket_dir, f"shard{shard_id}.sock")
+        remove_stale_socket(path)
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "services.shard_worker", str(shard_id), path, cwd=PROJECT_ROOT
+        )
+        try:
+            rpc = await RpcClient.connect(path, name=f"shard{shard_id}")
+        except RpcError:
+            proc.kill()
+            raise
+        self._workers[shard_id] = {
+            "proc": proc, "rpc": rpc,
+            "watch": asyncio.create_task(self._watch(shard_id, proc), name=f"watch_shard{shard_id}"),
+        }
+        logger.info(f"Shard {shard_id} spawned (pid {proc.pid}).")
+
+    async def _watch(self, shard_id: int, proc):
+        code = await proc.wait()
+        if self._stopping or shard_id in self._retiring:
+            return
+        logger.error(f"Shard {shard_id} exited with code {code}; moving its users to the other shards.")
+        # Read before the respawn: a fresh worker starts a new file
+        lost = read_last_seen(instance_path(config.LAST_SEEN_PATH, f"shard{shard_id}"))
+        worker = self._workers.pop(shard_id, None)
+        if worker:
+            await worker["rpc"].close()
+        await self._rebalance([s for s in self.map.shard_ids if s != shard_id], handoff=lost)
+        await self._respawn(shard_id)
+
+    async def _respawn(self, shard_id: int):
+        attempt = 0
+        while not self._stopping:
+            await asyncio.sleep(min(RESPAWN_BACKOFF_MAX, 5 * 2 ** attempt))
+            attempt += 1
+            try:
+                await self._join(shard_id)
+                return
+            except Exception as e:
+                logger.error(f"Respawn of shard {shard_id} failed: {e}")
+                await self._stop_worker(shard_id)
+
+    async def _join(self, shard_id: int):
+        """A new worker boots owning nothing, then the rebalance hands it its users."""
+        await self._spawn(shard_id)
+        await self._workers[shard_id]["rpc"].call("boot", shards=self.map.shard_ids)
+        await self._rebalance(self.map.shard_ids + [shard_id])
+
+    async def resize(self, workers: int):
+        """Adds or retires workers; only the users whose owner changes move."""
+        live = sorted(self._workers)
+        if workers > len(live):
+            free = sorted(set(range(workers)) - set(live))
+            for shard_id in free[:workers - len(live)]:
+                await self._join(shard_id)
+        elif workers < len(live):
+            retired = live[workers:]
+            self._retiring.update(retired)
+            await self._rebalance([s for s in self.map.shard_ids if s not in retired])
+            for shard_id in retired:
+                await self._stop_worker(shard_id)
+                self._retiring.discard(shard_id)
+        self.target = workers
+
+    async def _rebalance(self, shard_ids: list, handoff: dict = None):
+        """
+        Moves every user whose owner differs between the current map and shard_ids.
+        handoff holds last seen ids of users whose old owner can no longer report them.
+        """
+        async with self._lock:
+            self._stable.clear()
+            try:
+                async with async_session() as db_session:
+                    user_ids = await UserRepository(db_session).get_all_active_users_with_pairs()
+                new_map = ShardMap(shard_ids)
+                moves = self.map.moves(new_map, user_ids)
+
+                # Live old owners stop listening and report where they stopped; dead ones can't
+                handoff = dict(handoff or {})
+                by_old = {}
+                for user_id, (old, _) in moves.items():
+                    by_old.setdefault(old, []).append(user_id)
+                for old, users in by_old.items():
+                    worker = self._workers.get(old)
+                    if worker is None:
+                        continue
+                    try:
+                        handoff.update(await worker["rpc"].call("release_users", user_ids=users))
+                    except RpcError as e:
+                        logger.error(f"Shard {old} could not release {len(users)} users: {e}")
+
+                self.map = new_map
+                await asyncio.gather(
+                    *(w["rpc"].call("set_shards", shards=shard_ids) for w in self._workers.values()),
+                    return_exceptions=True
+                )
+
+                by_new = {}
+                for user_id, (_, new) in moves.items():
+                    by_new.setdefault(new, []).append(user_id)
+                for new, users in by_new.items():
+                    worker = self._workers.get(new)
+                    if worker is None:
+                        continue
+                    try:
+                        await worker["rpc"].call(
+                            "adopt_users", user_ids=users,
+                            handoff={str(u): handoff[str(u)] for u in users if str(u) in handoff}
+                        )
+                    except RpcError as e:
+                        logger.error(f"Shard {new} could not adopt {len(users)} users: {e}")
+                self.rebalances += 1
+                logger.info(f"Shard map {shard_ids}: {len(moves)} of {len(user_ids)} users moved.")
+            finally:
+                self._stable.set()
+
+    async def _stop_worker(self, shard_id: int):
+        worker = self._workers.pop(shard_id, None)
+        if worker is None:
+            return
+        try:
+            await worker["rpc"].call("shutdown", timeout=STATS_TIMEOUT)
+        except (RpcError, asyncio.TimeoutError):
+            pass
+        try:
+            await asyncio.wait_for(worker["proc"].wait(), timeout=SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Shard {shard_id} did not stop in {SHUTDOWN_TIMEOUT}s; killing it.")
+            worker["proc"].kill()
+        await worker["rpc"].close()
+        worker["watch"].cancel()
+
+    async def shutdown(self):
+        """Rule 1: Every worker persists its own state before the organism goes to sleep."""
+        self._stopping = True
+        await asyncio.gather(*(self._stop_worker(s) for s in list(self._workers)))
+        logger.info("All shards stopped.")
@@ -0,0 +1,46 @@
+"""
+SERVICES: SHARD MAP
+The 'Territories'. (Anatomy: Nervous System)
+Decides which worker process owns a user. Rendezvous (highest random weight)
+hashing: every shard scores every user and the highest score wins. Adding or
+removing a shard only moves the users that shard wins or loses; everyone else
+stays where they are.
+"""
+import hashlib
+import os
+
+
+def instance_path(path: str, instance: str) -> str:
+    """data/dedup.log -> data/dedup.shard2.log: each shard worker keeps its own local state files."""
+    if not path or not instance:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{instance}{ext}"
+
+
+def _score(shard_id: int, user_id: int) -> int:
+    digest = hashlib.blake2b(f"{shard_id}:{user_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class ShardMap:
+    def __init__(self, shard_ids):
+        self.shard_ids = sorted(set(shard_ids))
+
+    def owner(self, user_id: int) -> int | None:
+        if not self.shard_ids:
+            return None
+        return max(self.shard_ids, key=lambda shard_id: _score(shard_id, user_id))
+
+    def owns(self, shard_id: int):
+        """Predicate for one worker: user_id -> does this shard own it."""
+        return lambda user_id: self.owner(user_id) == shard_id
+
+    def moves(self, other: "ShardMap", user_ids) -> dict:
+        """user_id -> (owner here, owner in other) for every user whose owner changes."""
+        moved = {}
+        for user_id in user_ids:
+            before, after = self.owner(user_id), other.owner(user_id)
+            if before != after:
+                moved[user_id] = (before, after)
+        return moved
@@ -0,0 +1,109 @@
+"""
+SERVICES: SHARD RPC
+The 'Synapse'. (Anatomy: Nervous System)
+Wire between the coordinator (bot process) and the shard workers: newline-delimited
+JSON over a local unix socket. Every request carries an id; replies may come back
+in any order, so one connection serves many calls at once.
+
+Request: {"id": 7, "method": "call", "params": {...}}
+Reply:   {"id": 7, "result": ...}  or  {"id": 7, "error": "..."}
+"""
+import logging
+import asyncio
+import itertools
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+# Stats and handoff payloads stay far below this; it only bounds a runaway line
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+
+class RpcError(Exception):
+    pass
+
+
+async def write_message(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json.dumps(message, default=str).encode() + b"\n")
+    await writer.drain()
+
+
+async def read_message(reader: asyncio.StreamReader) -> dict | None:
+    """Next message, or None once the other side has closed."""
+    line = await reader.readline()
+    return json.loads(line) if line else None
+
+
+class RpcClient:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, name: str = "shard"):
+        self.name = name
+        self._reader = reader
+        self._writer = writer
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._write_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._read_loop(), name=f"rpc_{name}")
+
+    @classmethod
+    async def connect(cls, path: str, name: str = "shard", timeout: float = 30) -> "RpcClient":
+        """Waits for a freshly spawned worker to open its socket."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(path, limit=MAX_MESSAGE_BYTES)
+                return cls(reader, writer, name)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if loop.time() > deadline:
+                    raise RpcError(f"{name} did not open {path} within {timeout:.0f}s")
+                await asyncio.sleep(0.2)
+
+    @property
+    def closed(self) -> bool:
+        return self._task.done()
+
+    async def call(self, method: str, timeout: float | None = None, **params):
+        if self.closed:
+            raise RpcError(f"{self.name} connection closed")
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = future
+        try:
+            async with self._write_lock:
+                await write_message(self._writer, {"id": call_id, "method": method, "params": params})
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(call_id, None)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                reply = await read_message(self._reader)
+                if reply is None:
+                    break
+                future = self._pending.get(reply.get("id"))
+                if future is None or future.done():
+                    continue
+                if "error" in reply:
+                    future.set_exception(RpcError(reply["error"]))
+                else:
+                    future.set_result(reply.get("result"))
+        except (ConnectionError, json.JSONDecodeError) as e:
+            logger.error(f"RPC link to {self.name} broken: {e}")
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(RpcError(f"{self.name} connection closed"))
+
+    async def close(self):
+        self._writer.close()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+def remove_stale_socket(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
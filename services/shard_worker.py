@@ -0,0 +1,131 @@
+"""
+SERVICES: SHARD WORKER
+The 'Organ'. (Anatomy: Nervous System)
+One worker process of sharded mode: its own event loop, RepostService and Telethon
+clients for the users its shard owns. Takes orders from the coordinator over a
+local unix socket (services/shard_rpc.py) and stops when the coordinator goes away.
+
+Spawned by the coordinator: python -m services.shard_worker <shard id> <socket path>
+"""
+import logging
+import asyncio
+import sys
+from aiogram import Bot
+from config import config
+from services.repost_engine import RepostService
+from services.shard_map import ShardMap
+from services.shard_rpc import read_message, write_message, remove_stale_socket, MAX_MESSAGE_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Engine methods the coordinator may route to the owning shard
+ROUTED_METHODS = (
+    "add_new_pair", "activate_pair", "deactivate_pair", "delete_single_pair",
+    "delete_all_user_pairs", "resolve_channel_for_pair", "update_pair_settings",
+)
+
+
+class ShardWorker:
+    def __init__(self, shard_id: int, socket_path: str):
+        self.shard_id = shard_id
+        self.socket_path = socket_path
+        # Owns nothing until the coordinator sends the shard map
+        self.service = RepostService(owns=lambda user_id: False, instance=f"shard{shard_id}")
+        self._bot = None
+        self._done = asyncio.Event()
+
+    # --- RPC methods: JSON in, JSON out ---
+
+    async def rpc_boot(self, shards: list):
+        self.service.owns = ShardMap(shards).owns(self.shard_id)
+        await self.service.recover_all_listeners()
+        return self.service.startup_report
+
+    async def rpc_set_shards(self, shards: list):
+        self.service.owns = ShardMap(shards).owns(self.shard_id)
+
+    async def rpc_release_users(self, user_ids: list):
+        handoff = await self.service.release_users(user_ids)
+        # JSON object keys are strings: chat ids travel as [chat_id, msg_id] pairs
+        return {str(uid): [[chat_id, msg_id] for chat_id, msg_id in seen.items()] for uid, seen in handoff.items()}
+
+    async def rpc_adopt_users(self, user_ids: list, handoff: dict):
+        seen = {int(uid): {chat_id: msg_id for chat_id, msg_id in pairs} for uid, pairs in handoff.items()}
+        await self.service.adopt_users(user_ids, seen)
+
+    async def rpc_call(self, method: str, kwargs: dict):
+        if method not in ROUTED_METHODS:
+            raise ValueError(f"{method} is not routable")
+        return await getattr(self.service, method)(**kwargs)
+
+    async def rpc_stats(self):
+        return self.service.pipeline_stats()
+
+    async def rpc_shutdown(self):
+        self._done.set()
+
+    # --- Socket ---
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def handle(request: dict):
+            reply = {"id": request.get("id")}
+            try:
+                handler = getattr(self, f"rpc_{request.get('method')}", None)
+                if handler is None:
+                    raise ValueError(f"unknown method {request.get('method')}")
+                reply["result"] = await handler(**request.get("params", {}))
+            except Exception as e:
+                logger.error(f"Shard {self.shard_id}: {request.get('method')} failed: {e}")
+                reply["error"] = f"{type(e).__name__}: {e}"
+            async with write_lock:
+                await write_message(writer, reply)
+
+        try:
+            while True:
+                request = await read_message(reader)
+                if request is None:
+                    break
+                # Requests run concurrently: a slow boot must not hold up stats or routed calls
+                task = asyncio.create_task(handle(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            # The coordinator is the only client: losing it means this worker is orphaned
+            logger.warning(f"Shard {self.shard_id}: coordinator link closed.")
+            self._done.set()
+
+    async def run(self):
+        self._bot = Bot(token=config.BOT_TOKEN.get_secret_value())
+        self.service.set_bot(self._bot)
+        remove_stale_socket(self.socket_path)
+        server = await asyncio.start_unix_server(self._serve, path=self.socket_path, limit=MAX_MESSAGE_BYTES)
+        logger.info(f"Shard {self.shard_id} listening on {self.socket_path}")
+        try:
+            await self._done.wait()
+        finally:
+            server.close()
+            await self.service.shutdown()
+            await self._bot.session.close()
+            remove_stale_socket(self.socket_path)
+            logger.info(f"Shard {self.shard_id} stopped.")
+
+
+def main():
+    shard_id, socket_path = int(sys.argv[1]), sys.argv[2]
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f"%(asctime)s - shard{shard_id} - %(name)s - %(levelname)s - %(message)s"
+    )
+    try:
+        asyncio.run(ShardWorker(shard_id, socket_path).run())
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import pytest
+from services.dedup_store import DedupStore, LOG_BATCH
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("services.dedup_store.time.time", clock)
+    return clock
+
+
+def test_repeat_is_caught_per_pair():
+    store = DedupStore(capacity=10)
+    assert not store.seen_before(1, "a")
+    assert store.seen_before(1, "a")
+    assert not store.seen_before(2, "a")
+
+
+def test_lru_evicts_the_coldest_key():
+    store = DedupStore(capacity=2)
+    store.seen_before(1, "a")
+    store.seen_before(1, "b")
+    # A hit warms "a", so "b" is the coldest when "c" arrives
+    assert store.seen_before(1, "a")
+    store.seen_before(1, "c")
+    assert store.size() == 2
+    assert store.seen_before(1, "a")
+    assert not store.seen_before(1, "b")
+
+
+def test_ttl_expires_keys(clock):
+    store = DedupStore(capacity=10, ttl_seconds=60)
+    store.seen_before(1, "a")
+    clock.now += 59
+    assert store.seen_before(1, "a")
+    # The hit refreshed the timestamp
+    clock.now += 59
+    assert store.seen_before(1, "a")
+    clock.now += 61
+    assert not store.seen_before(1, "a")
+
+
+def test_log_replays_keys_and_tombstones(tmp_path):
+    path = str(tmp_path / "dedup.log")
+    store = DedupStore(capacity=10, path=path)
+    store.seen_before(1, "a")
+    store.seen_before(1, "b")
+    store.seen_before(2, "c")
+    store.forget_pair(2)
+    store.close()
+
+    replayed = DedupStore(capacity=10, path=path)
+    assert replayed.seen_before(1, "a")
+    assert replayed.seen_before(1, "b")
+    assert not replayed.seen_before(2, "c")
+    replayed.close()
+
+
+def test_replay_drops_expired_and_malformed_lines(tmp_path, clock):
+    path = tmp_path / "dedup.log"
+    path.write_text(
+        f"1\t{clock.now - 120:.0f}\told\n"
+        f"1\t{clock.now - 10:.0f}\tfresh\n"
+        "garbage\n"
+        "1\tnot-a-time\tbad\n",
+        encoding="utf-8",
+    )
+    store = DedupStore(capacity=10, ttl_seconds=60, path=str(path))
+    assert store.seen_before(1, "fresh")
+    assert not store.seen_before(1, "old")
+    assert not store.seen_before(1, "bad")
+    store.close()
+
+
+def test_replay_respects_capacity(tmp_path):
+    path = str(tmp_path / "dedup.log")
+    store = DedupStore(capacity=100, path=path)
+    for i in range(5):
+        store.seen_before(1, f"k{i}")
+    store.close()
+
+    replayed = DedupStore(capacity=2, path=path)
+    replayed.seen_before(9, "warm-up")
+    assert replayed.size() == 3
+    assert replayed.seen_before(1, "k4")
+    assert replayed.seen_before(1, "k3")
+    assert not replayed.seen_before(1, "k0")
+    replayed.close()
+
+
+def test_compaction_keeps_only_live_keys(tmp_path):
+    path = tmp_path / "dedup.log"
+    store = DedupStore(capacity=2, path=str(path), compact_ratio=1.0)
+    for i in range(10):
+        store.seen_before(1, f"k{i}")
+    store.compact()
+    store.close()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [line.split("\t")[2] for line in lines] == ["k8", "k9"]
+
+    replayed = DedupStore(capacity=2, path=str(path))
+    assert replayed.seen_before(1, "k9")
+    replayed.close()
+
+
+def test_log_records_are_written_in_batches(tmp_path):
+    path = tmp_path / "dedup.log"
+    store = DedupStore(capacity=LOG_BATCH * 2, path=str(path), flush_interval=3600)
+    for i in range(LOG_BATCH - 1):
+        store.seen_before(1, f"k{i}")
+    assert path.read_text(encoding="utf-8") == ""
+    store.seen_before(1, "last")
+    assert len(path.read_text(encoding="utf-8").splitlines()) == LOG_BATCH
+    store.close()
@@ -0,0 +1,66 @@
+import asyncio
+import time
+import pytest
+from services.listener_supervisor import ListenerSupervisor
+
+
+class FakeProvider:
+    def __init__(self):
+        self.listeners = {}
+        self.reconnects = 0
+
+    def has_listener(self, user_id):
+        return user_id in self.listeners
+
+    def is_listening(self, user_id):
+        return self.listeners.get(user_id, {}).get("connected", False)
+
+    def is_hibernating(self, user_id):
+        return False
+
+    def last_event_at(self, user_id):
+        return self.listeners[user_id]["last_event_at"]
+
+    def update_gap(self, user_id):
+        return self.listeners[user_id]["gap"]
+
+    async def reconnect(self, user_id):
+        self.reconnects += 1
+        return False
+
+
+def supervisor(provider) -> ListenerSupervisor:
+    async def catch_up(user_id):
+        return 0
+    return ListenerSupervisor(provider, catch_up, has_sources=lambda user_id: True,
+                              stall_seconds=900, backoff_base=0.001, backoff_max=0.01)
+
+
+def test_quiet_account_is_not_called_stalled():
+    provider = FakeProvider()
+    now = time.monotonic()
+    # Two posts a day: 20 minutes of silence is normal
+    provider.listeners[1] = {"connected": True, "last_event_at": now - 1200, "gap": 43200}
+    # Never heard anything: no evidence it should be talking
+    provider.listeners[2] = {"connected": True, "last_event_at": now - 100000, "gap": None}
+    # Talks every few seconds: 20 minutes of silence is a stall
+    provider.listeners[3] = {"connected": True, "last_event_at": now - 1200, "gap": 5}
+    sup = supervisor(provider)
+    assert not sup._stalled(1, now)
+    assert not sup._stalled(2, now)
+    assert sup._stalled(3, now)
+
+
+@pytest.mark.asyncio
+async def test_recovery_stops_when_the_listener_is_gone():
+    provider = FakeProvider()
+    provider.listeners[1] = {"connected": False, "last_event_at": 0, "gap": None}
+    sup = supervisor(provider)
+    sup._watched.add(1)
+    task = asyncio.create_task(sup._recover(1, "disconnected"))
+    await asyncio.sleep(0.05)
+    assert not task.done() and provider.reconnects > 0
+    # Released or stopped elsewhere while recovery was backing off
+    del provider.listeners[1]
+    await asyncio.wait_for(task, timeout=1)
+    assert 1 not in sup._watched
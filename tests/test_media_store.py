@@ -0,0 +1,55 @@
+import os
+from services.media_store import MediaStore
+
+
+def store_file(store: MediaStore, key: str, size: int) -> str:
+    staged = store.staging_path(key)
+    with open(staged, "wb") as f:
+        f.write(os.urandom(size))
+    return store.put(key, staged)
+
+
+def test_lru_eviction_by_bytes(tmp_path):
+    store = MediaStore(str(tmp_path), max_bytes=250)
+    a = store_file(store, "doc:1", 100)
+    b = store_file(store, "doc:2", 100)
+    assert store.get("doc:1") == a
+    store_file(store, "doc:3", 100)
+    assert os.path.exists(a)
+    assert not os.path.exists(b)
+    assert store.get("doc:2") is None
+
+
+def test_pinned_file_survives_eviction_until_unpinned(tmp_path):
+    store = MediaStore(str(tmp_path), max_bytes=150)
+    a = store_file(store, "doc:1", 100)
+    store.pin("doc:1")
+    # A put for another key while doc:1 is being uploaded
+    store_file(store, "doc:2", 100)
+    assert os.path.exists(a)
+    store.unpin("doc:1")
+    assert not os.path.exists(a)
+
+
+def test_pins_are_counted(tmp_path):
+    store = MediaStore(str(tmp_path), max_bytes=150)
+    a = store_file(store, "doc:1", 100)
+    store.pin("doc:1")
+    store.pin("doc:1")
+    store_file(store, "doc:2", 100)
+    store.unpin("doc:1")
+    assert os.path.exists(a)
+    store.unpin("doc:1")
+    assert not os.path.exists(a)
+
+
+def test_replaced_content_of_a_pinned_key_is_removed_on_unpin(tmp_path):
+    store = MediaStore(str(tmp_path), max_bytes=1000)
+    old = store_file(store, "doc:1", 100)
+    store.pin("doc:1")
+    new = store_file(store, "doc:1", 120)
+    assert old != new and os.path.exists(old)
+    assert store.get("doc:1") == new
+    store.unpin("doc:1")
+    assert not os.path.exists(old)
+    assert os.path.exists(new)
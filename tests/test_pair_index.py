@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+from services.pair_index import PairIndex
+
+
+def pair(pair_id: int, source_id: str, user_id: int = 1, is_active: bool = True, status: str = "active"):
+    return SimpleNamespace(id=pair_id, user_id=user_id, source_id=source_id, is_active=is_active, status=status)
+
+
+def routed(index: PairIndex, chat_id: int) -> list:
+    """What the live filter plus routing do with an update from chat_id."""
+    if chat_id not in index.event_chat_ids(1):
+        return []
+    return [p.id for p in index.match(1, chat_id)]
+
+
+def test_basic_group_source_passes_the_live_filter():
+    index = PairIndex()
+    index.add(pair(1, "-123"))
+    assert routed(index, -123) == [1]
+    assert index.chat_ids(1) == {-123}
+
+
+def test_user_and_channel_sources_pass_the_live_filter():
+    index = PairIndex()
+    index.add(pair(1, "555"))
+    index.add(pair(2, "-1001234567890"))
+    assert routed(index, 555) == [1]
+    assert routed(index, -1001234567890) == [2]
+    assert routed(index, -999) == []
+    assert index.chat_ids(1) == {555, -1001234567890}
+
+
+def test_username_sources_are_left_out_of_numeric_ids():
+    index = PairIndex()
+    index.add(pair(1, "@news"))
+    assert index.chat_ids(1) == set()
+    assert index.event_chat_ids(1) == set()
+
+
+def test_inactive_and_errored_pairs_are_not_routed():
+    index = PairIndex()
+    index.add(pair(1, "-123", is_active=False))
+    index.add(pair(2, "-456", status="error"))
+    assert not index.has_pairs(1)
+    assert index.event_chat_ids(1) == set()
+
+
+def test_remove_drops_the_source_from_the_filter():
+    index = PairIndex()
+    index.add(pair(1, "-123"))
+    index.add(pair(2, "-123"))
+    index.remove(1)
+    assert routed(index, -123) == [2]
+    index.remove(2)
+    assert routed(index, -123) == []
@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy import delete, select
+from data.models import RepostPair, User
+from data.repository import UserRepository
+from services.pair_state import PairStateCache
+
+
+async def add_pairs(session_factory, count: int) -> list:
+    async with session_factory() as db_session:
+        db_session.add(User(id=1))
+        pairs = [RepostPair(user_id=1, source_id=f"-100{i}", destination_id="-1009") for i in range(count)]
+        db_session.add_all(pairs)
+        await db_session.commit()
+        return [p.id for p in pairs]
+
+
+async def stored(session_factory, pair_id: int) -> RepostPair | None:
+    async with session_factory() as db_session:
+        return (await db_session.execute(select(RepostPair).where(RepostPair.id == pair_id))).scalar_one_or_none()
+
+
+@pytest.mark.asyncio
+async def test_batch_with_a_vanished_pair_still_writes_the_others(session_factory):
+    kept, gone = await add_pairs(session_factory, 2)
+    async with session_factory() as db_session:
+        await db_session.execute(delete(RepostPair).where(RepostPair.id == gone))
+        await db_session.commit()
+        await UserRepository(db_session).save_pair_states([
+            {"id": kept, "error_count": 2},
+            {"id": gone, "error_count": 4},
+            {"id": kept, "destination_peer": "self"},
+        ])
+    pair = await stored(session_factory, kept)
+    assert (pair.error_count, pair.destination_peer) == (2, "self")
+
+
+@pytest.mark.asyncio
+async def test_records_after_delete_do_not_block_later_flushes(session_factory):
+    kept, gone = await add_pairs(session_factory, 2)
+    cache = PairStateCache(session_factory, flush_seconds=60)
+    cache.record_error(gone)
+
+    # Deleted by the user while a send for it is still in flight
+    async with session_factory() as db_session:
+        assert await UserRepository(db_session).delete_pair_by_id(1, gone)
+    cache.forget(gone, deleted=True)
+    cache.record_error(gone)
+    cache.record_success(gone)
+    cache.record_error(kept)
+    await cache.flush()
+
+    assert (await stored(session_factory, kept)).error_count == 1
+    cache.record_error(kept)
+    await cache.close()
+    assert (await stored(session_factory, kept)).error_count == 2
+    assert cache._dirty == {}
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_requeues_changes(session_factory):
+    (pair_id,) = await add_pairs(session_factory, 1)
+    down = True
+
+    def vault():
+        if down:
+            raise OSError("vault down")
+        return session_factory()
+
+    cache = PairStateCache(vault, flush_seconds=60)
+    cache.record_error(pair_id)
+    await cache.flush()
+    down = False
+    await cache.close()
+    assert (await stored(session_factory, pair_id)).error_count == 1
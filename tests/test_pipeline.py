@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from services.pipeline import SendLanes
+
+
+def job(pair_id: int, n: int, user_id: int = 1, batch_key=None) -> dict:
+    return {"pair_id": pair_id, "user_id": user_id, "msg_ids": [n], "messages": [n], "batch_key": batch_key}
+
+
+async def drain(lanes: SendLanes) -> list:
+    taken = []
+    while lanes.depths():
+        item = await lanes.get()
+        taken.append((item["pair_id"], item["msg_ids"]))
+        await lanes.done(item["pair_id"])
+    return taken
+
+
+@pytest.mark.asyncio
+async def test_block_holds_without_waiting_and_keeps_order():
+    lanes = SendLanes(lane_size=2)
+    for n in range(5):
+        # Would hang here if a full lane still made the router wait
+        await asyncio.wait_for(lanes.put(1, job(1, n)), timeout=1)
+    await asyncio.wait_for(lanes.put(2, job(2, 9, user_id=2)), timeout=1)
+    assert lanes.depths() == {1: 5, 2: 1}
+    assert lanes.held == 3
+    taken = await drain(lanes)
+    assert [ids for pid, ids in taken if pid == 1] == [[0], [1], [2], [3], [4]]
+    assert (2, [9]) in taken
+
+
+@pytest.mark.asyncio
+async def test_only_the_saturated_account_waits_for_room():
+    lanes = SendLanes(lane_size=2)
+    for n in range(4):
+        await lanes.put(1, job(1, n, user_id=1))
+    # User 1 holds a full lane's worth; user 2 is untouched
+    await asyncio.wait_for(lanes.wait_for_room(2), timeout=1)
+    waiter = asyncio.create_task(lanes.wait_for_room(1))
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    first = await lanes.get()
+    await lanes.done(first["pair_id"])
+    await asyncio.wait_for(waiter, timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_discard_releases_held_jobs_and_their_account():
+    lanes = SendLanes(lane_size=1)
+    for n in range(3):
+        await lanes.put(1, job(1, n))
+    await lanes.discard(1)
+    assert lanes.depths() == {}
+    await asyncio.wait_for(lanes.wait_for_room(1), timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest():
+    lanes = SendLanes(lane_size=2)
+    for n in range(4):
+        await lanes.put(1, job(1, n), policy="drop_oldest")
+    assert await drain(lanes) == [(1, [2]), (1, [3])]
+    assert lanes.dropped == 2
+
+
+@pytest.mark.asyncio
+async def test_coalesce_merges_forwards_of_one_source():
+    lanes = SendLanes(lane_size=1)
+    key = ("-1001", False)
+    for n in range(3):
+        await lanes.put(1, job(1, n, batch_key=key), policy="coalesce")
+    assert await drain(lanes) == [(1, [0, 1, 2])]
+    assert lanes.coalesced == 2
+
+
+@pytest.mark.asyncio
+async def test_coalesce_replaces_what_cannot_be_merged():
+    lanes = SendLanes(lane_size=1)
+    for n in range(3):
+        await lanes.put(1, job(1, n), policy="coalesce")
+    assert await drain(lanes) == [(1, [2])]
@@ -0,0 +1,171 @@
+import asyncio
+import random
+import time
+import pytest
+from data.repository import ScheduleRepository
+from services.scheduler import IndexedHeap, Scheduler
+
+
+def drain(heap: IndexedHeap) -> list:
+    order = []
+    while heap:
+        order.append(heap.pop())
+    return order
+
+
+def test_heap_pops_in_due_order():
+    heap = IndexedHeap()
+    for pair_id, due in enumerate([5, 1, 4, 2, 3]):
+        heap.push(("schedule", pair_id), due)
+    assert [due for due, _ in drain(heap)] == [1, 2, 3, 4, 5]
+
+
+def test_heap_reschedule_moves_key_both_ways():
+    heap = IndexedHeap()
+    for pair_id in range(5):
+        heap.push(("schedule", pair_id), 10 + pair_id)
+    heap.push(("schedule", 4), 1)
+    heap.push(("schedule", 0), 100)
+    assert len(heap) == 5
+    assert heap.due_of(("schedule", 4)) == 1
+    assert [key[1] for _, key in drain(heap)] == [4, 1, 2, 3, 0]
+
+
+def test_heap_cancel_keeps_order_and_index():
+    heap = IndexedHeap()
+    for pair_id in range(8):
+        heap.push(("backfill", pair_id), pair_id)
+    assert heap.remove(("backfill", 3))
+    assert not heap.remove(("backfill", 3))
+    assert ("backfill", 3) not in heap
+    assert heap.due_of(("backfill", 3)) is None
+    assert [key[1] for _, key in drain(heap)] == [0, 1, 2, 4, 5, 6, 7]
+
+
+def test_heap_matches_sorted_reference_under_random_ops():
+    rng = random.Random(7)
+    heap, reference = IndexedHeap(), {}
+    for _ in range(2000):
+        key = ("schedule", rng.randrange(50))
+        if rng.random() < 0.3:
+            assert heap.remove(key) == (reference.pop(key, None) is not None)
+        else:
+            due = rng.random()
+            heap.push(key, due)
+            reference[key] = due
+    assert drain(heap) == sorted((due, key) for key, due in reference.items())
+
+
+@pytest.mark.asyncio
+async def test_scheduler_fires_rescheduled_job_and_skips_cancelled():
+    fired = []
+    done = asyncio.Event()
+
+    async def handler(kind, pair_id):
+        fired.append((kind, pair_id))
+        done.set()
+
+    scheduler = Scheduler(handler)
+    scheduler.start()
+    try:
+        scheduler.schedule("schedule", 1, 3600)
+        scheduler.schedule("schedule", 2, 0.05)
+        scheduler.cancel("schedule", 2)
+        # Pulled in from an hour away
+        scheduler.schedule("schedule", 1, 0.01)
+        await asyncio.wait_for(done.wait(), timeout=2)
+        await asyncio.sleep(0.1)
+    finally:
+        await scheduler.stop()
+    assert fired == [("schedule", 1)]
+    assert not scheduler.is_scheduled("schedule", 2)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_reloads_jobs_from_the_vault(session_factory):
+    async def load():
+        async with session_factory() as db_session:
+            return await ScheduleRepository(db_session).load_jobs()
+
+    async def save(upserts, deletes):
+        async with session_factory() as db_session:
+            await ScheduleRepository(db_session).save_jobs(upserts, deletes)
+
+    async def handler(kind, pair_id):
+        pass
+
+    due = time.time() + 3600
+    before = Scheduler(handler, load=load, save=save)
+    before.schedule_at("schedule", 1, due)
+    before.schedule_at("backfill", 2, due + 60)
+    before.schedule_at("schedule", 3, due)
+    before.schedule_at("schedule", 1, due + 30)
+    before.cancel("schedule", 3)
+    await before.persist()
+
+    assert await load() == {("schedule", 1): pytest.approx(due + 30), ("backfill", 2): pytest.approx(due + 60)}
+
+    # Pair 2 vanished while the process was down: its row goes on the next persist
+    after = Scheduler(handler, load=load, save=save)
+    assert await after.restore(keep=lambda kind, pair_id: pair_id != 2) == 1
+    assert after.is_scheduled("schedule", 1)
+    assert not after.is_scheduled("backfill", 2)
+    await after.persist()
+    assert set(await load()) == {("schedule", 1)}
+
+
+@pytest.mark.asyncio
+async def test_failing_handler_is_retried_with_backoff_then_dropped():
+    saved = {}
+    calls = []
+
+    async def save(upserts, deletes):
+        saved.update(upserts)
+        for key in deletes:
+            saved.pop(key, None)
+
+    async def handler(kind, pair_id):
+        calls.append(time.monotonic())
+        raise RuntimeError("boom")
+
+    scheduler = Scheduler(handler, save=save, retry_base=0.1, retry_max=0.1, max_failures=3)
+    scheduler.start()
+    try:
+        scheduler.schedule("flush", 1, 0)
+        await asyncio.sleep(0.03)
+        # Failed once: back on the heap, and its row still wanted
+        assert len(calls) == 1
+        assert scheduler.is_scheduled("flush", 1)
+        await scheduler.persist()
+        assert ("flush", 1) in saved
+        await asyncio.sleep(0.4)
+    finally:
+        await scheduler.stop()
+    assert len(calls) == 3
+    assert calls[1] - calls[0] >= 0.09
+    assert not scheduler.is_scheduled("flush", 1)
+    assert ("flush", 1) not in saved
+
+
+@pytest.mark.asyncio
+async def test_success_resets_the_failure_count():
+    outcomes = [RuntimeError("boom"), None, RuntimeError("boom"), None]
+    fired = asyncio.Event()
+
+    async def handler(kind, pair_id):
+        outcome = outcomes.pop(0)
+        if outcome:
+            raise outcome
+        if outcomes:
+            scheduler.schedule(kind, pair_id, 0)
+        else:
+            fired.set()
+
+    scheduler = Scheduler(handler, retry_base=0.01, retry_max=0.01, max_failures=2)
+    scheduler.start()
+    try:
+        scheduler.schedule("backfill", 1, 0)
+        await asyncio.wait_for(fired.wait(), timeout=2)
+    finally:
+        await scheduler.stop()
+    assert outcomes == []
@@ -0,0 +1,46 @@
+from collections import Counter
+from services.shard_map import ShardMap, instance_path
+
+USERS = range(1, 5001)
+
+
+def test_owner_is_deterministic_and_order_free():
+    a, b = ShardMap([0, 1, 2]), ShardMap([2, 0, 1, 1])
+    assert all(a.owner(u) == b.owner(u) for u in USERS)
+    assert ShardMap([]).owner(1) is None
+
+
+def test_users_spread_over_every_shard():
+    counts = Counter(ShardMap(range(4)).owner(u) for u in USERS)
+    assert set(counts) == {0, 1, 2, 3}
+    # 1250 each on average; rendezvous hashing stays well within +-15%
+    assert all(abs(n - 1250) < 190 for n in counts.values())
+
+
+def test_adding_a_worker_only_moves_users_to_it():
+    before, after = ShardMap(range(3)), ShardMap(range(4))
+    moved = before.moves(after, USERS)
+    assert moved
+    assert all(new == 3 for _, new in moved.values())
+    assert set(moved) == {u for u in USERS if after.owner(u) == 3}
+    # Roughly the new worker's fair share, nothing more
+    assert len(moved) < len(USERS) / 4 * 1.15
+
+
+def test_removing_a_worker_only_moves_its_users():
+    before, after = ShardMap(range(4)), ShardMap([0, 1, 3])
+    moved = before.moves(after, USERS)
+    assert set(moved) == {u for u in USERS if before.owner(u) == 2}
+    assert all(old == 2 and new in (0, 1, 3) for old, new in moved.values())
+
+
+def test_owns_predicate_partitions_users():
+    shards = ShardMap(range(3))
+    predicates = [shards.owns(shard_id) for shard_id in range(3)]
+    assert all(sum(owns(u) for owns in predicates) == 1 for u in USERS)
+
+
+def test_instance_path():
+    assert instance_path("data/dedup.log", "shard2") == "data/dedup.shard2.log"
+    assert instance_path("data/last_seen.json", None) == "data/last_seen.json"
+    assert instance_path("", "shard1") == ""